@@ -18,6 +18,7 @@ try:
     from failure_flags import ModuleDetectionFlags
     from failure_flags import TextDetectionFlags
     from failure_flags import ObstacleDetectionFlags
+    from failure_flags import FailureCounts
 
     from pipeline import arange
     from pipeline import init_vision
@@ -22,6 +22,7 @@ from vision.module.region_of_interest import get_region_of_interest
 from vision.module.module_bounding import get_module_bounds
 from vision.module.module_orientation import get_module_orientation
 from vision.module.module_orientation import get_module_roll
+from vision.module.module_orientation import get_module_roll_contours
 
 
 IMG_FOLDER = "module"  # default folder to read images from
@@ -178,6 +179,52 @@ class AccuracyModule:
         """
         return get_module_roll(region)
 
+    def accuracy_get_module_roll_contours(self, region: np.ndarray) -> float:
+        """
+        Measuring accuracy of get_module_roll_contours(), the contour roll get_module_roll replaced.
+
+        Parameters
+        ----------
+        region: ndarray
+            Padded region of image with module.
+
+        Returns
+        -------
+        float - module roll with respect to positive y-axis.
+        """
+        return get_module_roll_contours(region)
+
+
+def compare_module_roll(regions: dict) -> dict:
+    """
+    Compares get_module_roll to get_module_roll_contours on hand-labeled regions.
+
+    Parameters
+    ----------
+    regions: dict
+        {filename: (region, estimated roll in degrees)}, e.g. from common.module_roll_regions().
+
+    Returns
+    -------
+    dict - {filename: {"estimate", "roll", "roll_contours", "time", "time_contours"}}, times in seconds.
+    """
+    results = {}
+
+    for filename, (region, estimate) in regions.items():
+        result = {"estimate": estimate}
+
+        for roll_key, time_key, roll_function in [
+            ("roll", "time", get_module_roll),
+            ("roll_contours", "time_contours", get_module_roll_contours),
+        ]:
+            start = time.perf_counter()
+            result[roll_key] = roll_function(region)
+            result[time_key] = time.perf_counter() - start
+
+        results[filename] = result
+
+    return results
+
 
 class BenchModuleAccuracy:
     """
@@ -354,3 +401,19 @@ class BenchModuleAccuracy:
             )
 
         return crash
+
+
+if __name__ == "__main__":
+    import common
+
+    results = compare_module_roll(common.module_roll_regions())
+
+    if not results:
+        print("No module roll images found in vision_images/module/Feb29")
+
+    for filename, result in results.items():
+        print(
+            f"{filename}: estimate {result['estimate']}, "
+            f"gradient {result['roll']:.2f} ({result['time'] * 1000:.2f} ms), "
+            f"contours {result['roll_contours']:.2f} ({result['time_contours'] * 1000:.2f} ms)"
+        )
@@ -161,3 +161,46 @@ def noise(amounts=None, dimensions=(1280, 720), generator=np.random.poisson, dty
         output.update({title: (color_image, depth_image)})
 
     return output
+
+
+def module_roll_regions(folder=None):
+    """
+    Regions around the module in hand-labeled images of the module dataset,
+    with their estimated roll.
+
+    Parameters
+    ----------
+    folder: str
+        Location of the dataset, defaults to vision_images/module/Feb29.
+
+    Returns
+    -------
+    {filename: (region, estimated roll in degrees)}, empty if the dataset is missing.
+    """
+    if folder is None:
+        folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'vision_images', 'module', 'Feb29')
+
+    estimates = {
+        # FORMAT: "name_of_file" : [estimated degrees (roll value), (estimated center)]
+        "2020-02-29_15.36.15.167565": [20, (1180, 300)],
+        "2020-02-29_15.40.46.652448": [14, (700, 550)],
+        "2020-02-29_15.40.48.862847": [10, (1300, 630)],
+        "2020-02-29_15.40.40.444538": [5, (830, 670)],
+        "2020-02-29_15.40.54.564617": [8, (435, 650)],
+    }
+
+    regions = {}
+
+    for filename, (roll, center) in estimates.items():
+        color_image = cv2.imread(os.path.join(folder, filename) + "-colorImage.jpg")
+
+        if color_image is None:
+            continue
+
+        # same rough boundary around the module as the unit tests
+        region = color_image[center[1] - 250:center[1] + 250, center[0] - 180:center[0] + 180, :]
+
+        regions[filename] = (region, roll)
+
+    return regions
@@ -20,6 +20,9 @@ import cv2
 import common
 
 from vision.module.in_frame import ModuleInFrame
+from vision.module.slopes import get_slopes
+from vision.module.clustering import cluster_circles
+from vision.module.module_orientation import get_module_roll, get_module_roll_contours
 
 
 class TimeModuleInFrame:
@@ -84,3 +87,113 @@ class TimeModuleInFrame:
         Timing mif.
         """
         ModuleInFrame(color_image, depth_image)
+
+
+class TimeModuleSlopes:
+    """
+    Timing pairwise slopes, vectorized get_slopes against the pairwise loop it replaced.
+    """
+    CIRCLE_COUNTS = [5, 10, 25, 50, 100, 200]
+
+    def setup(self):
+        """
+        Generate circles.
+        """
+        random = np.random.default_rng(0)
+
+        self.PARAMETERS = {}
+
+        for n_circles in self.CIRCLE_COUNTS:
+            circles = random.integers(0, 480, (n_circles, 3)).astype('uint16')
+
+            self.PARAMETERS.update({f'n_circle={n_circles}': (circles,)})
+
+    def time_get_slopes(self, circles):
+        """
+        Timing vectorized slopes.
+        """
+        get_slopes(circles)
+
+    def time_loop_slopes(self, circles):
+        """
+        Timing pairwise loop slopes.
+        """
+        slopes = np.array([])
+        for x, y, _ in circles:
+            for iX, iY, _ in circles:
+                m = (iY - y) / (iX - x)
+                if (not np.isnan(m)) and (not np.isinf(m)) and (x != iX and y != iY):
+                    slopes = np.append(slopes, m)
+
+
+class TimeModuleClustering:
+    """
+    Timing cluster_circles, on circles spread over the image and packed in one dense blob.
+    """
+    CIRCLE_COUNTS = [25, 100, 200]
+    LINK_SCALE = 6
+
+    def setup(self):
+        """
+        Generate circles.
+        """
+        random = np.random.default_rng(0)
+
+        self.PARAMETERS = {}
+
+        for n_circles in self.CIRCLE_COUNTS:
+            radii = random.integers(2, 6, n_circles)
+
+            spread = np.column_stack((random.integers(0, 640, n_circles), random.integers(0, 480, n_circles), radii))
+            dense = np.column_stack((random.integers(0, 60, (n_circles, 2)), radii))
+
+            self.PARAMETERS.update({f'spread n_circle={n_circles}': (spread,)})
+            self.PARAMETERS.update({f'dense n_circle={n_circles}': (dense,)})
+
+    def time_cluster_circles(self, circles):
+        """
+        Timing clustering.
+        """
+        cluster_circles(circles, self.LINK_SCALE)
+
+
+class TimeModuleRoll:
+    """
+    Timing roll estimation, gradient orientation get_module_roll against the contour version it replaced.
+    """
+    DEFAULT_DIMS = (360, 500)
+
+    def setup(self):
+        """
+        Load module regions, and generate rotated modules on a cluttered background.
+        """
+        self.PARAMETERS = {}
+
+        for filename, (region, _) in common.module_roll_regions().items():
+            self.PARAMETERS.update({filename: (region,)})
+
+        random = np.random.default_rng(0)
+
+        for roll in [5, 20, 40]:
+            color_image = np.full((self.DEFAULT_DIMS[1], self.DEFAULT_DIMS[0], 3), 230, dtype='uint8')
+
+            for _ in range(150):
+                location = (int(random.integers(0, self.DEFAULT_DIMS[0])), int(random.integers(0, self.DEFAULT_DIMS[1])))
+                cv2.circle(color_image, location, int(random.integers(2, 6)), (60, 60, 60), -1)
+
+            box = cv2.boxPoints(((180, 250), (150, 220), roll)).astype(np.int32)
+            cv2.fillPoly(color_image, [box], (30, 30, 30), cv2.LINE_AA)
+
+            self.PARAMETERS.update({f'roll={roll} clutter': (color_image,)})
+
+    def time_get_module_roll(self, region):
+        """
+        Timing gradient orientation roll.
+        """
+        get_module_roll(region)
+
+    def time_get_module_roll_contours(self, region):
+        """
+        Timing contour roll.
+        """
+        get_module_roll_contours(region)
@@ -3,6 +3,8 @@ Bounding boxes to convey information to flight code.
 """
 from enum import Enum
 
+import numpy as np
+
 
 class ObjectType(Enum):
     """
@@ -36,6 +38,206 @@ class BoundingBox:
         return f"BoundingBox[{id(self)}, {self.object_type}]: {str(self.vertices)}"
 
 
+class BoundingBoxBatch:
+    """
+    Bounding boxes stored in one NumPy record array, so a frame's boxes
+    are sent to flight code as one contiguous buffer instead of an object each.
+
+    BoundingBox objects are made when indexed or iterated over.
+
+    Parameters
+    ----------
+    vertices: array_like
+        (N, 4, 2) (x, y) corners of each box.
+    object_types: list[ObjectType]
+        Type of each box.
+    depths: array_like
+        Depth of each box, NaN where unknown.
+    orientations: array_like
+        (N, 3) x, y, z tilt of each box, NaN where unknown.
+    from_tracking: array_like
+        Whether each box was found near the last frame's box.
+    vertices_3d: array_like
+        (N, 8, 3) camera-frame near then far face corners, NaN where unknown.
+    distances: array_like
+        Distance to each box, NaN where unknown.
+    """
+    TYPES = list(ObjectType)  # type codes are indices into TYPES
+
+    DTYPE = np.dtype([
+        ('vertices', np.float32, (4, 2)),
+        ('type', np.uint8),
+        ('depth', np.float32),
+        ('orientation', np.float32, (3,)),
+        ('from_tracking', np.bool_),
+        ('vertices_3d', np.float32, (8, 3)),
+        ('distance', np.float32),
+    ])
+
+    def __init__(
+        self,
+        vertices=(),
+        object_types=(),
+        depths=None,
+        orientations=None,
+        from_tracking=None,
+        vertices_3d=None,
+        distances=None,
+    ):
+        vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 4, 2)
+
+        if len(object_types) != vertices.shape[0]:
+            raise ValueError(f"Got {vertices.shape[0]} boxes but {len(object_types)} types")
+
+        self.records = np.zeros(vertices.shape[0], dtype=self.DTYPE)
+
+        self.records['vertices'] = vertices
+        self.records['type'] = [self.TYPES.index(ObjectType(object_type)) for object_type in object_types]
+        self.records['depth'] = np.nan if depths is None else depths
+        self.records['orientation'] = np.nan if orientations is None else orientations
+        self.records['from_tracking'] = False if from_tracking is None else from_tracking
+        self.records['vertices_3d'] = np.nan if vertices_3d is None else vertices_3d
+        self.records['distance'] = np.nan if distances is None else distances
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Batch backed by existing records, without copying.
+
+        Parameters
+        ----------
+        records: np.ndarray
+            Array of DTYPE.
+
+        Returns
+        -------
+        BoundingBoxBatch
+        """
+        batch = cls()
+        batch.records = records
+        return batch
+
+    @classmethod
+    def from_boxes(cls, boxes):
+        """
+        Batch of BoundingBoxes, and of other batches.
+
+        Parameters
+        ----------
+        boxes: list[BoundingBox or BoundingBoxBatch]
+            Boxes with four (x, y) vertices.
+
+        Returns
+        -------
+        BoundingBoxBatch
+        """
+        records = []
+
+        for box in boxes:
+            if isinstance(box, BoundingBoxBatch):
+                records.append(box.records)
+                continue
+
+            record = np.zeros(1, dtype=cls.DTYPE)
+            record['vertices'] = np.asarray(box.vertices, dtype=np.float32).reshape(4, 2)
+            record['type'] = cls.TYPES.index(box.object_type)
+            record['depth'] = getattr(box, 'module_depth', np.nan)
+            record['orientation'] = getattr(box, 'orientation', (np.nan,) * 3)
+            record['from_tracking'] = getattr(box, 'from_tracking', False)
+            record['vertices_3d'] = getattr(box, 'vertices_3d', np.nan)
+            record['distance'] = getattr(box, 'distance', np.nan)
+            records.append(record)
+
+        if not records:
+            return cls()
+
+        return cls.from_records(np.concatenate(records))
+
+    def to_buffer(self):
+        """
+        Serialize to one contiguous buffer.
+
+        Returns
+        -------
+        bytes
+        """
+        return self.records.tobytes()
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Batch read from a buffer made by to_buffer.
+
+        Parameters
+        ----------
+        buffer: bytes
+
+        Returns
+        -------
+        BoundingBoxBatch - read-only views into buffer.
+        """
+        return cls.from_records(np.frombuffer(buffer, dtype=cls.DTYPE))
+
+    def __reduce__(self):
+        # pickled, e.g. onto a multiprocessing Queue, as one buffer
+        return (self.from_buffer, (self.to_buffer(),))
+
+    @property
+    def vertices(self):
+        return self.records['vertices']
+
+    @property
+    def object_types(self):
+        return [self.TYPES[code] for code in self.records['type']]
+
+    @property
+    def depths(self):
+        return self.records['depth']
+
+    @property
+    def orientations(self):
+        return self.records['orientation']
+
+    @property
+    def vertices_3d(self):
+        return self.records['vertices_3d']
+
+    @property
+    def distances(self):
+        return self.records['distance']
+
+    def __len__(self):
+        return self.records.shape[0]
+
+    def __getitem__(self, i):
+        """
+        Make the BoundingBox of box i.
+        """
+        record = self.records[i]
+
+        box = BoundingBox([tuple(vertex) for vertex in record['vertices'].tolist()], self.TYPES[record['type']])
+
+        if not np.isnan(record['depth']):
+            box.module_depth = float(record['depth'])
+        if not np.all(np.isnan(record['orientation'])):
+            box.orientation = tuple(record['orientation'].tolist())
+        if record['from_tracking']:
+            box.from_tracking = True
+        if not np.isnan(record['distance']):
+            vertices_3d = record['vertices_3d'].tolist()
+            box.vertices_3d = [tuple(vertex) for vertex in vertices_3d]
+            box.distance = float(record['distance'])
+
+        return box
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f"BoundingBoxBatch[{id(self)}, {len(self)} boxes]"
+
+
 if __name__ == '__main__':
     verts = [(1, 3), (2, 4)]
 
@@ -10,8 +10,11 @@ sys.path.append(os.path.dirname(__file__))
 
 try:
     from template import Camera
+    from frame_grabber import FrameGrabber
 
     # conditional imports to prevent circular imports that depend on Camera
+    if "shared_frames" not in sys.modules:
+        from shared_frames import SharedFrameBuffer
     if "realsense" not in sys.modules:
         from realsense import Realsense
     if "sim_camera" not in sys.modules:
@@ -22,6 +22,10 @@ try:
     from vision.common.take_picture import save_camera_frame
 except ImportError:
     from common.take_picture import save_camera_frame
+try:
+    from vision.common.intrinsics import Intrinsics
+except ImportError:
+    from common.intrinsics import Intrinsics
 
 
 class BagFile(Camera):
@@ -102,6 +106,11 @@ class BagFile(Camera):
 
             depth_image = np.asanyarray(aligned_depth_frame.get_data())
             color_image = np.asanyarray(color_frame.get_data())
+
+            if self.intrinsics is None:
+                self.intrinsics = Intrinsics.from_realsense(
+                    color_frame.profile.as_video_stream_profile().get_intrinsics()
+                )
             color_image = color_image[:, :, ::-1]  # shifts colors back to normal
 
             yield depth_image, color_image
@@ -0,0 +1,190 @@
+"""
+Background frame acquisition for any camera, handing consumers only the newest frame.
+"""
+import threading
+import time
+from collections import deque
+
+
+class FrameGrabber:
+    """
+    Pulls frames from a camera on a background thread so camera wait time
+    does not add to processing latency.
+
+    Frames are kept in a small buffer; get() returns the newest frame and
+    drops any older ones that were never processed (latest frame wins).
+
+    Parameters
+    ----------
+    camera: Camera
+        Camera, or any iterable of (depth image, color image) pairs, to pull frames from.
+    buffer_size: int
+        Maximum number of frames held at once.
+    """
+
+    def __init__(self, camera, buffer_size: int = 2):
+        if buffer_size < 1:
+            raise ValueError(f"buffer_size must be at least 1, got {buffer_size}")
+
+        self.camera = camera
+
+        self.frames = deque(maxlen=buffer_size)  # (timestamp, (depth, color)) pairs
+        self.condition = threading.Condition()
+
+        self.captured = 0  # frames read from the camera
+        self.dropped = 0  # frames replaced by newer frames before being processed
+        self.processed = 0  # frames handed out by get()
+
+        # time.monotonic() of when the last handed out frame was captured
+        self.timestamp = 0.0
+
+        self.running = False
+        self.finished = False  # camera ran out of frames or raised
+        self.error = None  # exception raised by the camera, re-raised by get()
+        self.thread = None
+
+    def start(self) -> "FrameGrabber":
+        """
+        Start the acquisition thread, if not already running.
+
+        Returns
+        -------
+        FrameGrabber - self, for chaining.
+        """
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(
+                target=self._acquire, name="frame_grabber", daemon=True
+            )
+            self.thread.start()
+
+        return self
+
+    def stop(self, timeout: float = 1.0) -> None:
+        """
+        Stop the acquisition thread.
+
+        Parameters
+        ----------
+        timeout: float
+            Seconds to wait for the thread to exit.
+
+        Returns
+        -------
+        None
+        """
+        self.running = False
+
+        with self.condition:
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _acquire(self) -> None:
+        """
+        Acquisition loop, runs on the background thread.
+
+        Returns
+        -------
+        None
+        """
+        try:
+            for frame in self.camera:
+                with self.condition:
+                    if len(self.frames) == self.frames.maxlen:
+                        self.dropped += 1  # oldest frame is pushed out unprocessed
+
+                    self.frames.append((time.monotonic(), frame))
+                    self.captured += 1
+                    self.condition.notify()
+
+                if not self.running:
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def get(self, timeout: float = None) -> tuple:
+        """
+        Get the newest frame, waiting for one if the buffer is empty.
+        Older buffered frames are dropped.
+
+        Parameters
+        ----------
+        timeout: float
+            Seconds to wait for a frame, None waits indefinitely.
+
+        Raises
+        ------
+        StopIteration: If the camera has no more frames.
+        Exception: Whatever the camera raised, once its buffered frames are used up.
+        TimeoutError: If no frame arrived within timeout.
+
+        Returns
+        -------
+        tuple - (depth image, color image)
+        """
+        if self.thread is None:
+            self.start()
+
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.frames or self.finished, timeout
+            ):
+                raise TimeoutError(f"No frame received within {timeout} seconds")
+
+            if not self.frames:
+                if self.error is not None:
+                    raise self.error
+                raise StopIteration
+
+            self.timestamp, frame = self.frames.pop()
+
+            self.dropped += len(self.frames)
+            self.frames.clear()
+
+            self.processed += 1
+
+        return frame
+
+    @property
+    def frame_age(self) -> float:
+        """
+        Seconds since the last frame handed out by get() was captured.
+        """
+        return time.monotonic() - self.timestamp
+
+    @property
+    def counters(self) -> dict:
+        """
+        Snapshot of the captured, dropped and processed frame counts.
+        """
+        with self.condition:
+            return {
+                "captured": self.captured,
+                "dropped": self.dropped,
+                "processed": self.processed,
+            }
+
+    def __iter__(self):
+        """
+        Iterate over the newest frames until the camera runs out.
+
+        Yields
+        ------
+        depth image: numpy array
+        color image: numpy array
+        """
+        while True:
+            try:
+                yield self.get()
+            except StopIteration:
+                return
+
+    def __next__(self) -> tuple:
+        return self.get()
@@ -18,6 +18,10 @@ try:
     from vision.common.take_picture import save_camera_frame
 except ImportError:
     from common.take_picture import save_camera_frame
+try:
+    from vision.common.intrinsics import Intrinsics
+except ImportError:
+    from common.intrinsics import Intrinsics
 
 
 class Realsense(Camera):
@@ -87,6 +91,11 @@ class Realsense(Camera):
             depth_image = np.asanyarray(aligned_depth_frame.get_data())
             color_image = np.asanyarray(color_frame.get_data())
 
+            if self.intrinsics is None:
+                self.intrinsics = Intrinsics.from_realsense(
+                    color_frame.profile.as_video_stream_profile().get_intrinsics()
+                )
+
             yield depth_image, color_image
 
     def display_in_window(self, clipping=False):
@@ -0,0 +1,293 @@
+"""
+SharedFrameBuffer is a child class of camera, a ring of preallocated shared memory frame slots
+so one process can write camera frames and any number of worker processes can read them without copying.
+"""
+import os
+import sys
+
+parent_dir = os.path.dirname(os.path.abspath(__file__))
+gparent_dir = os.path.dirname(parent_dir)
+ggparent_dir = os.path.dirname(gparent_dir)
+sys.path += [parent_dir, gparent_dir, ggparent_dir]
+
+import ctypes
+import multiprocessing
+import time
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+import cv2
+import numpy as np
+
+try:
+    from vision.camera.template import Camera
+except ImportError:
+    from template import Camera
+
+
+class SharedFrameBuffer(Camera):
+    """
+    Ring buffer of depth (uint16) and color (uint8, 3 channel) frames in shared memory.
+
+    One writer fills the slots in order, each with a sequence number and timestamp.
+    Readers get numpy views straight into the shared slots, a view stays valid
+    until `slots` more frames have been written, which is_valid(sequence) checks.
+
+    Pass the buffer to worker processes as a multiprocessing.Process argument.
+
+    Parameters
+    ----------
+    screen_width: number
+        Width of the frames.
+    screen_height: number
+        Height of the frames.
+    frame_rate: number
+        Framerate of the camera writing into the buffer.
+    slots: int
+        Number of frames held at once.
+    """
+
+    def __init__(self, screen_width, screen_height, frame_rate=0, slots=4, **kwargs):
+        super().__init__(screen_width, screen_height, frame_rate)
+
+        if slots < 2:
+            raise ValueError(f"SharedFrameBuffer needs at least 2 slots, got {slots}")
+
+        self.slots = slots
+
+        self._depth_memory = RawArray(ctypes.c_uint16, slots * self.height * self.width)
+        self._color_memory = RawArray(
+            ctypes.c_uint8, slots * self.height * self.width * 3
+        )
+
+        # sequence number of the frame in each slot, 0 when empty and -1 while being written
+        self._sequences = RawArray(ctypes.c_int64, slots)
+        self._timestamps = RawArray(ctypes.c_double, slots)  # time.monotonic() of write
+
+        self._head = RawValue(ctypes.c_int64, 0)  # sequence number of the newest frame
+        self._closed = RawValue(ctypes.c_bool, False)
+        self._new_frame = multiprocessing.Condition()
+
+        self._map_views()
+
+    def _map_views(self) -> None:
+        """
+        Create the numpy views of the shared slots.
+
+        Returns
+        -------
+        None
+        """
+        self.depth_slots = np.frombuffer(self._depth_memory, dtype=np.uint16).reshape(
+            self.slots, self.height, self.width
+        )
+        self.color_slots = np.frombuffer(self._color_memory, dtype=np.uint8).reshape(
+            self.slots, self.height, self.width, 3
+        )
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+
+        # numpy views are rebuilt on the other side of the process boundary
+        del state["depth_slots"]
+        del state["color_slots"]
+
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._map_views()
+
+    @property
+    def head(self) -> int:
+        """
+        Sequence number of the newest frame, 0 if nothing has been written.
+        """
+        return self._head.value
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether the writer has finished.
+        """
+        return self._closed.value
+
+    def write(self, depth_image: np.ndarray, color_image: np.ndarray) -> int:
+        """
+        Copy a frame into the next slot. Only one process may write.
+
+        Parameters
+        ----------
+        depth_image: ndarray
+            1 channel depth image.
+        color_image: ndarray
+            3 channel color image.
+
+        Returns
+        -------
+        int - sequence number of the written frame.
+        """
+        sequence = self._head.value + 1
+        slot = sequence % self.slots
+
+        # readers of the old frame in this slot see it go stale
+        self._sequences[slot] = -1
+
+        np.copyto(self.depth_slots[slot], depth_image, casting="unsafe")
+        np.copyto(self.color_slots[slot], color_image, casting="unsafe")
+
+        self._timestamps[slot] = time.monotonic()
+        self._sequences[slot] = sequence
+
+        with self._new_frame:
+            self._head.value = sequence
+            self._new_frame.notify_all()
+
+        return sequence
+
+    def read(self, sequence: int = None) -> tuple:
+        """
+        Get views of a frame in the buffer.
+
+        Parameters
+        ----------
+        sequence: int
+            Sequence number of the frame, defaults to the newest frame.
+
+        Returns
+        -------
+        tuple - (sequence, timestamp, depth image, color image) or None if the frame
+            has not been written yet or has already been overwritten.
+        """
+        if sequence is None:
+            sequence = self._head.value
+
+        slot = sequence % self.slots
+
+        if sequence <= 0 or self._sequences[slot] != sequence:
+            return None
+
+        timestamp = self._timestamps[slot]
+        depth_image, color_image = self.depth_slots[slot], self.color_slots[slot]
+
+        # slot may have been reused while reading the timestamp
+        if self._sequences[slot] != sequence:
+            return None
+
+        return sequence, timestamp, depth_image, color_image
+
+    def is_valid(self, sequence: int) -> bool:
+        """
+        Whether views from read(sequence) still hold that frame.
+
+        Parameters
+        ----------
+        sequence: int
+            Sequence number of the frame.
+
+        Returns
+        -------
+        bool
+        """
+        return sequence > 0 and self._sequences[sequence % self.slots] == sequence
+
+    def wait(self, after: int = 0, timeout: float = None) -> int:
+        """
+        Wait for a frame newer than `after`.
+
+        Parameters
+        ----------
+        after: int
+            Sequence number of the last frame seen.
+        timeout: float
+            Seconds to wait, None waits indefinitely.
+
+        Returns
+        -------
+        int - sequence number of the newest frame, 0 on timeout or if the writer closed.
+        """
+        with self._new_frame:
+            self._new_frame.wait_for(
+                lambda: self._head.value > after or self._closed.value, timeout
+            )
+            sequence = self._head.value
+
+        return sequence if sequence > after else 0
+
+    def close(self) -> None:
+        """
+        Signal readers that no more frames will be written.
+
+        Returns
+        -------
+        None
+        """
+        with self._new_frame:
+            self._closed.value = True
+            self._new_frame.notify_all()
+
+    def fill_from(self, camera: Camera, count: int = None) -> None:
+        """
+        Write frames from a camera into the buffer, closing it when done.
+        Intended as the target of the camera process.
+
+        Parameters
+        ----------
+        camera: Camera
+            Camera to pull frames from.
+        count: int
+            Number of frames to write, None writes until the camera runs out.
+
+        Returns
+        -------
+        None
+        """
+        try:
+            for i, (depth_image, color_image) in enumerate(camera):
+                if count is not None and i >= count:
+                    break
+
+                self.write(depth_image, color_image)
+        finally:
+            self.close()
+
+    def __iter__(self):
+        """
+        Iterate over the newest frames, skipping any that were missed.
+        NOTE: Images are views into shared memory, valid until `slots` more frames are written.
+
+        Yields
+        ------
+        depth image[1 channel]: numpy array
+        color image[3 channel]: numpy array
+        """
+        last = 0
+
+        while True:
+            sequence = self.wait(last)
+
+            if not sequence:
+                return
+
+            frame = self.read(sequence)
+            last = sequence
+
+            if frame is not None:
+                yield frame[2], frame[3]
+
+    def display_in_window(self) -> None:
+        """
+        Displays the depth/color image streams, separately, in one window
+        """
+        for depth_image, color_image in self:
+            depth_colormap = cv2.applyColorMap(
+                cv2.convertScaleAbs(depth_image, alpha=0.03), cv2.COLORMAP_JET
+            )
+
+            cv2.imshow("Depth/Color Stream", np.hstack((color_image, depth_colormap)))
+
+            key = cv2.waitKey(1)
+
+            # if pressed 'q' or escape (27) exit program
+            if key == ord("q") or key == 27:
+                cv2.destroyAllWindows()
+                break
@@ -24,6 +24,9 @@ class Camera:
         self.height = screen_height
         self.framerate = frame_rate
 
+        # Intrinsics of the color stream, set by children that know them
+        self.intrinsics = None
+
     def __iter__(self):
         """
         Guarantees that child classes have an __iter__ method
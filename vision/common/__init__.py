@@ -10,6 +10,10 @@ sys.path.append(os.path.dirname(__file__))
 
 try:
     from import_params import import_params
+    from stage_timer import StageTimer
+    from buffers import BufferPool
+    from frame_cache import FrameCache
+    from intrinsics import Intrinsics
 
 except ImportError as e:
     print(f"common/__init__.py failed: {e}")
@@ -0,0 +1,45 @@
+"""
+Reusable scratch arrays, so per-frame image operations can write in place
+instead of allocating new arrays every frame.
+"""
+import numpy as np
+
+
+class BufferPool:
+    """
+    Named scratch arrays that are only reallocated when a larger one is needed.
+
+    Arrays handed out are contiguous views into the pool's storage, and are
+    overwritten by the next get() of the same name.
+    """
+
+    def __init__(self):
+        self.buffers = {}  # name: flat ndarray
+
+    def get(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        """
+        Get an uninitialized array.
+
+        Parameters
+        ----------
+        name: str
+            Name of the buffer.
+        shape: tuple
+            Shape of the array.
+        dtype: numpy dtype
+            Type of the array.
+
+        Returns
+        -------
+        np.ndarray - contiguous array of the given shape and type.
+        """
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+
+        buffer = self.buffers.get(name)
+
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self.buffers[name] = buffer
+
+        return buffer[:size].reshape(shape)
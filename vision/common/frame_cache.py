@@ -0,0 +1,139 @@
+"""
+Images derived from one camera frame, computed the first time an algorithm
+asks for them and shared with every other algorithm working on the frame.
+"""
+import cv2
+import numpy as np
+
+
+class FrameCache:
+    """
+    Lazily computed images of one frame, each computed at most once.
+
+    Returned images are read-only, as they are shared between algorithms.
+
+    Parameters
+    ----------
+    color_image: np.ndarray
+        Color image of the frame, BGR like the Realsense bgr8 stream.
+    depth_image: np.ndarray
+        Depth image of the frame.
+    """
+
+    def __init__(self, color_image: np.ndarray, depth_image: np.ndarray):
+        self.color_image = color_image
+        self.depth_image = depth_image
+
+        self.images = {}  # key: derived image
+
+    def get(self, key, compute) -> np.ndarray:
+        """
+        Get a derived image, computing it if it is not cached yet.
+
+        Parameters
+        ----------
+        key: hashable
+            Name of the image and the parameters it was computed with.
+        compute: callable
+            Takes no arguments and returns the image.
+
+        Returns
+        -------
+        np.ndarray - read-only image.
+        """
+        image = self.images.get(key)
+
+        if image is None:
+            image = compute()
+            image.flags.writeable = False
+            self.images[key] = image
+
+        return image
+
+    def gray(self, code: int = cv2.COLOR_BGR2GRAY) -> np.ndarray:
+        """
+        Gray scale image.
+
+        Parameters
+        ----------
+        code: int
+            cv2 color conversion code from the color image's channel order.
+
+        Returns
+        -------
+        np.ndarray - read-only gray scale image.
+        """
+        return self.get(
+            ("gray", code), lambda: cv2.cvtColor(src=self.color_image, code=code)
+        )
+
+    def blurred(self, ksize: int = 5) -> np.ndarray:
+        """
+        Gaussian blurred color image.
+
+        Parameters
+        ----------
+        ksize: int
+            Size of the blur kernel, odd.
+
+        Returns
+        -------
+        np.ndarray - read-only blurred color image.
+        """
+        return self.get(
+            ("blurred", ksize),
+            lambda: cv2.GaussianBlur(
+                src=self.color_image, ksize=(ksize, ksize), sigmaX=0
+            ),
+        )
+
+    def blurred_gray(
+        self, ksize: int = 5, code: int = cv2.COLOR_BGR2GRAY
+    ) -> np.ndarray:
+        """
+        Gaussian blurred gray scale image.
+
+        Parameters
+        ----------
+        ksize: int
+            Size of the blur kernel, odd.
+        code: int
+            cv2 color conversion code from the color image's channel order.
+
+        Returns
+        -------
+        np.ndarray - read-only blurred gray scale image.
+        """
+        return self.get(
+            ("blurred_gray", ksize, code),
+            lambda: cv2.GaussianBlur(
+                src=self.gray(code), ksize=(ksize, ksize), sigmaX=0
+            ),
+        )
+
+    def hsv(self, code: int = cv2.COLOR_BGR2HSV) -> np.ndarray:
+        """
+        HSV image.
+
+        Parameters
+        ----------
+        code: int
+            cv2 color conversion code from the color image's channel order.
+
+        Returns
+        -------
+        np.ndarray - read-only HSV image.
+        """
+        return self.get(
+            ("hsv", code), lambda: cv2.cvtColor(src=self.color_image, code=code)
+        )
+
+    def depth_valid(self) -> np.ndarray:
+        """
+        Pixels with a depth reading.
+
+        Returns
+        -------
+        np.ndarray - read-only bool mask, True where the depth is not 0.
+        """
+        return self.get("depth_valid", lambda: self.depth_image != 0)
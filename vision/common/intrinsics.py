@@ -0,0 +1,117 @@
+"""
+Pinhole camera intrinsics, to back-project pixels with depth into camera-frame points.
+"""
+import numpy as np
+
+HORIZONTAL_FOV = 86  # degrees
+VERTICAL_FOV = 57  # degrees
+
+
+class Intrinsics:
+    """
+    Focal lengths and principal point of a camera, in pixels.
+
+    Camera-frame points have x to the right, y down and z forward, like
+    pyrealsense2's rs2_deproject_pixel_to_point. Lens distortion is ignored.
+
+    Parameters
+    ----------
+    width, height: int
+        Resolution the intrinsics are for.
+    fx, fy: float
+        Focal lengths.
+    ppx, ppy: float
+        Principal point.
+    """
+
+    def __init__(
+        self, width: int, height: int, fx: float, fy: float, ppx: float, ppy: float
+    ):
+        self.width = width
+        self.height = height
+        self.fx = fx
+        self.fy = fy
+        self.ppx = ppx
+        self.ppy = ppy
+
+    @classmethod
+    def from_fov(
+        cls,
+        width: int,
+        height: int,
+        horizontal_fov: float = HORIZONTAL_FOV,
+        vertical_fov: float = VERTICAL_FOV,
+    ):
+        """
+        Intrinsics of an ideal camera with a field of view, centered on the image.
+
+        Parameters
+        ----------
+        width, height: int
+            Resolution of the image.
+        horizontal_fov, vertical_fov: float
+            Field of view, in degrees.
+
+        Returns
+        -------
+        Intrinsics
+        """
+        fx = (width / 2) / np.tan(np.radians(horizontal_fov) / 2)
+        fy = (height / 2) / np.tan(np.radians(vertical_fov) / 2)
+
+        return cls(width, height, fx, fy, (width - 1) / 2, (height - 1) / 2)
+
+    @classmethod
+    def from_realsense(cls, intrinsics):
+        """
+        Intrinsics of a Realsense stream.
+
+        Parameters
+        ----------
+        intrinsics: pyrealsense2.intrinsics
+            e.g. from frame.profile.as_video_stream_profile().get_intrinsics().
+
+        Returns
+        -------
+        Intrinsics
+        """
+        return cls(
+            intrinsics.width,
+            intrinsics.height,
+            intrinsics.fx,
+            intrinsics.fy,
+            intrinsics.ppx,
+            intrinsics.ppy,
+        )
+
+    def deproject(self, x, y, depth) -> np.ndarray:
+        """
+        Back-project pixels to camera-frame points.
+
+        Parameters
+        ----------
+        x, y: array_like
+            Pixel coordinates.
+        depth: array_like
+            Depth of each pixel along z, in the units of the returned points.
+
+        Returns
+        -------
+        np.ndarray - (..., 3) x, y, z points, broadcast over the inputs.
+        """
+        x, y, depth = np.broadcast_arrays(
+            np.asarray(x, dtype=np.float64),
+            np.asarray(y, dtype=np.float64),
+            np.asarray(depth, dtype=np.float64),
+        )
+
+        return np.stack(
+            [(x - self.ppx) / self.fx * depth, (y - self.ppy) / self.fy * depth, depth],
+            axis=-1,
+        )
+
+    def __repr__(self):
+        return (
+            f"Intrinsics[{self.width}x{self.height}, fx={self.fx:.1f}, fy={self.fy:.1f}, "
+            f"ppx={self.ppx:.1f}, ppy={self.ppy:.1f}]"
+        )
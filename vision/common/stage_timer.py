@@ -0,0 +1,102 @@
+"""
+Per-stage latency measurement for the vision pipeline.
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class StageTimer:
+    """
+    Times named stages with a monotonic clock.
+
+    Keeps the timings of the current frame, and a rolling window
+    of past timings of each stage for percentile latencies.
+
+    Parameters
+    ----------
+    window: int
+        Number of past timings kept per stage.
+    """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, window: int = 100):
+        if window < 1:
+            raise ValueError(f"window must be at least 1, got {window}")
+
+        self.window = window
+
+        self.timings = {}  # stage: seconds, for the current frame
+        self.samples = {}  # stage: deque of seconds, for the last window frames
+
+    def reset(self) -> None:
+        """
+        Start a new frame, clearing the current timings.
+
+        Returns
+        -------
+        None
+        """
+        self.timings = {}
+
+    @contextmanager
+    def time(self, stage: str):
+        """
+        Time the enclosed block as a stage. A stage that raises is still timed.
+
+        Parameters
+        ----------
+        stage: str
+            Name of the stage.
+        """
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Add a timing for a stage.
+
+        Parameters
+        ----------
+        stage: str
+            Name of the stage.
+        seconds: float
+            Time taken by the stage.
+
+        Returns
+        -------
+        None
+        """
+        self.timings[stage] = seconds
+
+        if stage not in self.samples:
+            self.samples[stage] = deque(maxlen=self.window)
+
+        self.samples[stage].append(seconds)
+
+    def percentiles(self) -> dict:
+        """
+        Rolling latency percentiles of each stage.
+
+        Returns
+        -------
+        dict - {stage: {"p50": seconds, "p95": seconds, "p99": seconds}}
+        """
+        latencies = {}
+
+        for stage, samples in self.samples.items():
+            values = np.percentile(np.array(samples), self.PERCENTILES)
+
+            latencies[stage] = {
+                f"p{percentile}": float(value)
+                for percentile, value in zip(self.PERCENTILES, values)
+            }
+
+        return latencies
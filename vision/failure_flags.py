@@ -1,3 +1,6 @@
+from multiprocessing.sharedctypes import RawArray
+
+
 class FailureFlags:
     """
     Abstract class used by the pipeline to track which algorithm failed
@@ -5,13 +8,88 @@ class FailureFlags:
 
     For each attribute, a value of True signals that the algorithm
     ran to completion without any problems
+
+    The attributes are packed into one integer, bits, where bit i is set if
+    the algorithm FIELDS[i] failed. FIELDS of a state are only ever appended to,
+    so the bit layout is stable.
+
+    Parameters
+    ----------
+    bits: int
+        Packed flags, 0 if every algorithm succeeded.
     """
 
-    def __init__(self):
-        pass
+    FIELDS = ()  # algorithm of each bit
+    LABELS = {}  # field: name in __str__, if not the field
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # flags read and write their bit like a bool attribute
+        for bit, field in enumerate(cls.FIELDS):
+            setattr(cls, field, cls._flag(1 << bit))
+
+    @staticmethod
+    def _flag(mask):
+        def get_flag(self):
+            return not self.bits & mask
+
+        def set_flag(self, value):
+            if value:
+                self.bits &= ~mask
+            else:
+                self.bits |= mask
+
+        return property(get_flag, set_flag)
+
+    def reset(self):
+        """
+        Mark every algorithm as successful, to reuse the flags for another frame.
+        """
+        self.bits = 0
+
+    def copy(self):
+        """
+        Flags with the same bits, e.g. to keep them while these are reused.
+        """
+        return type(self)(self.bits)
+
+    @classmethod
+    def decode(cls, bits):
+        """
+        Human readable status of each algorithm.
+
+        Parameters
+        ----------
+        bits: int
+            Packed flags of this state.
+
+        Returns
+        -------
+        str - "field: OK" or "field: ERROR" of each field.
+        """
+        if not cls.FIELDS:
+            return "INVALID STATE"
+
+        return ", ".join(
+            f"{cls.LABELS.get(field, field)}: {'ERROR' if bits >> bit & 1 else 'OK'}"
+            for bit, field in enumerate(cls.FIELDS)
+        )
+
+    def __reduce__(self):
+        # pickled as the packed integer
+        return (type(self), (self.bits,))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.bits == other.bits
+
+    __hash__ = None
 
     def __str__(self):
-        return "INVALID STATE"
+        return self.decode(self.bits)
 
 
 class ObstacleDetectionFlags(FailureFlags):
@@ -20,17 +98,7 @@ class ObstacleDetectionFlags(FailureFlags):
     in the event of the program crashing during obstacle detection ("early_laps")
     """
 
-    def __init__(self):
-        self.obstacle_finder = True
-        self.obstacle_tracker = True
-
-    def __str__(self):
-        return (
-            "obstacle_finder: "
-            + ("OK" if self.obstacle_finder else "ERROR")
-            + ", obstacle_tracker: "
-            + ("OK" if self.obstacle_tracker else "ERROR")
-        )
+    FIELDS = ("obstacle_finder", "obstacle_tracker")
 
 
 class TextDetectionFlags(FailureFlags):
@@ -39,11 +107,7 @@ class TextDetectionFlags(FailureFlags):
     in the event of the program crashing during text detection
     """
 
-    def __init__(self):
-        self.detect_russian_word = True
-
-    def __str__(self):
-        return "detect_russian_word: " + ("OK" if self.detect_russian_word else "ERROR")
+    FIELDS = ("detect_russian_word",)
 
 
 class ModuleDetectionFlags(FailureFlags):
@@ -52,38 +116,107 @@ class ModuleDetectionFlags(FailureFlags):
     in the event of the program crashing during module detection
     """
 
-    def __init__(self):
-        self.set_img = True
-        self.detect_russian_word = True
-        self.set_text = True
-        self.is_in_frame = True
-        self.get_center = True
-        self.get_module_depth = True
-        self.get_region_of_interest = True
-        self.get_module_orientation = True
-        self.get_module_bounds = True
-        self.get_module_roll = True
+    FIELDS = (
+        "set_img",
+        "detect_russian_word",
+        "set_text",
+        "is_in_frame",
+        "get_center",
+        "get_module_depth",
+        "get_region_of_interest",
+        "get_module_orientation",
+        "get_module_bounds",
+        "get_module_roll",
+    )
+    LABELS = {"set_img": "setImg"}
 
-    def __str__(self):
-        return (
-            "setImg: "
-            + ("OK" if self.set_img else "ERROR")
-            + ", detect_russian_word: "
-            + ("OK" if self.detect_russian_word else "ERROR")
-            + ", set_text: "
-            + ("OK" if self.set_text else "ERROR")
-            + ", is_in_frame: "
-            + ("OK" if self.is_in_frame else "ERROR")
-            + ", get_center: "
-            + ("OK" if self.get_center else "ERROR")
-            + ", get_module_depth: "
-            + ("OK" if self.get_module_depth else "ERROR")
-            + ", get_region_of_interest: "
-            + ("OK" if self.get_region_of_interest else "ERROR")
-            + ", get_module_orientation: "
-            + ("OK" if self.get_module_orientation else "ERROR")
-            + ", get_module_bounds: "
-            + ("OK" if self.get_module_bounds else "ERROR")
-            + ", get_module_roll: "
-            + ("OK" if self.get_module_roll else "ERROR")
-        )
+
+class FailureCounts:
+    """
+    Frame and failure counts of each algorithm, in a preallocated shared array,
+    so failure rates can be read from other processes without a queue.
+
+    The array has a frame count for each flags class, followed by a
+    failure count for each of its FIELDS.
+
+    Parameters
+    ----------
+    flag_types: tuple[type]
+        FailureFlags subclasses to count.
+    """
+
+    FLAG_TYPES = (ObstacleDetectionFlags, TextDetectionFlags, ModuleDetectionFlags)
+
+    def __init__(self, flag_types=FLAG_TYPES):
+        self.offsets = {}  # flags class: index of its frame count
+
+        size = 0
+        for flag_type in flag_types:
+            self.offsets[flag_type] = size
+            size += 1 + len(flag_type.FIELDS)
+
+        # single writer, so no lock; counts are only ever incremented
+        self.counts = RawArray("Q", size)
+
+    def record(self, flags):
+        """
+        Count one frame's flags. Flags of classes not being counted are ignored.
+
+        Parameters
+        ----------
+        flags: FailureFlags
+            Flags of the frame.
+        """
+        offset = self.offsets.get(type(flags))
+
+        if offset is None:
+            return
+
+        counts = self.counts
+        counts[offset] += 1
+
+        bits = flags.bits
+        index = offset + 1
+        while bits:
+            if bits & 1:
+                counts[index] += 1
+            bits >>= 1
+            index += 1
+
+    def failures(self, flag_type):
+        """
+        Number of frames and failures of each algorithm of a state.
+
+        Parameters
+        ----------
+        flag_type: type
+            FailureFlags subclass of the state.
+
+        Returns
+        -------
+        tuple[int, dict] - frames counted, and failures of each field.
+        """
+        offset = self.offsets[flag_type]
+
+        counts = self.counts[offset : offset + 1 + len(flag_type.FIELDS)]
+
+        return counts[0], dict(zip(flag_type.FIELDS, counts[1:]))
+
+    def rates(self):
+        """
+        Failure rate of each algorithm, keyed by state then field.
+
+        Returns
+        -------
+        dict - {flags class name: {field: failures / frames}}, 0 before any frames.
+        """
+        rates = {}
+
+        for flag_type in self.offsets:
+            frames, failures = self.failures(flag_type)
+            rates[flag_type.__name__] = {
+                field: count / frames if frames else 0
+                for field, count in failures.items()
+            }
+
+        return rates
@@ -13,8 +13,15 @@ try:
     from location import ModuleLocation
     from region_of_interest import get_region_of_interest
     from module_bounding import get_module_bounds
-    from module_orientation import get_module_orientation, get_module_roll
+    from module_orientation import (
+        get_module_orientation,
+        get_module_roll,
+        get_module_roll_contours,
+        fit_module_plane,
+    )
     from module_depth import get_module_depth
+    from slopes import get_slopes
+    from clustering import cluster_circles
 
 except ImportError as e:
     print(f"module/__init__.py failed: {e}")
@@ -0,0 +1,97 @@
+"""
+This file contains the cluster_circles function to group circles that are near each other.
+"""
+
+import numpy as np
+
+
+def cluster_circles(circles: np.ndarray, link_scale: float) -> np.ndarray:
+    """
+    Groups circles in a single pass, deterministically.
+
+    Two circles are linked if their centers are within link_scale times their mean
+    radius, and clusters are the groups of circles connected by links.
+    Neighbors are found with a uniform grid hash, so only nearby circles are compared,
+    and clusters are labelled by hooking linked roots together, all as array operations.
+
+    Parameters
+    ----------
+    circles: ndarray
+        (x, y, r) circles to group.
+    link_scale: float
+        Largest distance between linked circles, in mean radii.
+
+    Returns
+    -------
+    ndarray - cluster label of each circle, numbered in order of each cluster's first circle.
+    """
+    circles = np.asarray(circles, dtype=np.float64)
+    num_circles = circles.shape[0]
+
+    if not num_circles:
+        return np.array([], dtype=np.intp)
+
+    x, y, r = circles[:, 0], circles[:, 1], circles[:, 2]
+
+    # cells as big as the longest possible link, so links are only to the 3x3 neighboring cells
+    cell_size = max(link_scale * np.max(r), 1)
+    cells_x = np.floor(x / cell_size).astype(np.int64)
+    cells_y = np.floor(y / cell_size).astype(np.int64)
+
+    # circles sorted by cell, cells numbered by column with a spare row between columns
+    rows = cells_y.max() - cells_y.min() + 3
+    cells = (cells_x - cells_x.min()) * rows + (cells_y - cells_y.min())
+    order = np.argsort(cells, kind="stable")
+    sorted_cells = cells[order]
+
+    # linked pairs, gathered one neighboring cell offset at a time
+    link_i, link_j = [], []
+
+    for offset in (-rows - 1, -rows, -rows + 1, -1, 0, 1, rows - 1, rows, rows + 1):
+        # range of sorted circles in the neighboring cell of each circle
+        first = np.searchsorted(sorted_cells, cells + offset, side="left")
+        counts = np.searchsorted(sorted_cells, cells + offset, side="right") - first
+
+        # every (circle, neighbor) pair
+        pair_i = np.repeat(np.arange(num_circles), counts)
+        ends = np.cumsum(counts)
+        pair_j = order[np.repeat(first - ends + counts, counts) + np.arange(ends[-1])]
+
+        dx = x[pair_i] - x[pair_j]
+        dy = y[pair_i] - y[pair_j]
+        reach = link_scale * (r[pair_i] + r[pair_j]) / 2
+
+        # each pair once, from its lower index
+        links = (dx * dx + dy * dy <= reach * reach) & (pair_i < pair_j)
+
+        link_i.append(pair_i[links])
+        link_j.append(pair_j[links])
+
+    link_i = np.concatenate(link_i)
+    link_j = np.concatenate(link_j)
+
+    # forest of parent indices, parents are never above their children, so no cycles
+    parents = np.arange(num_circles)
+
+    while True:
+        # point every circle at its root
+        roots = parents[parents]
+        while np.any(roots != parents):
+            parents = roots
+            roots = parents[parents]
+
+        root_i, root_j = parents[link_i], parents[link_j]
+        split = root_i != root_j
+
+        if not np.any(split):
+            break
+
+        # hook the higher root of each split link under the lower one,
+        # keeps the least index of each cluster as its root, independent of cell order
+        root_i, root_j = root_i[split], root_j[split]
+        np.minimum.at(parents, np.maximum(root_i, root_j), np.minimum(root_i, root_j))
+
+    # number clusters by their first circle
+    _, labels = np.unique(parents, return_inverse=True)
+
+    return labels
@@ -7,6 +7,11 @@ import cv2
 import numpy as np
 import argparse
 
+try:
+    from vision.module.slopes import get_slopes
+except ImportError:
+    from slopes import get_slopes
+
 # Constants
 BLUR_SIZE = 5  # Blur kernel size
 BUCKET_MODIFIER = 1  # Changes how many buckets are in the range
@@ -17,7 +22,7 @@ MAX_CIRCLES = 100  # Maximum number of cirlces that can be detected in an image
 MIN_CIRCLES = 4  # Minimum number of circles needed to perform calculations
 
 
-def ModuleInFrame(color_image: np.ndarray) -> bool:
+def ModuleInFrame(color_image: np.ndarray, frame=None) -> bool:
     """
     Determines if the Module is in frame
 
@@ -25,6 +30,8 @@ def ModuleInFrame(color_image: np.ndarray) -> bool:
     ----------
     color_image: ndarray
         The color image.
+    frame: FrameCache
+        Images already derived from color_image, None to compute them here.
 
     Returns
     -------
@@ -36,11 +43,14 @@ def ModuleInFrame(color_image: np.ndarray) -> bool:
     # Ignore numpy warnings
     np.seterr(all="ignore")
 
-    # Grayscale
-    gray = cv2.cvtColor(src=color_image, code=cv2.COLOR_RGB2GRAY)
+    if frame is not None:
+        blur = frame.blurred_gray(BLUR_SIZE)
+    else:
+        # Grayscale
+        gray = cv2.cvtColor(src=color_image, code=cv2.COLOR_BGR2GRAY)
 
-    # Guassian Blur
-    blur = cv2.GaussianBlur(src=gray, ksize=(BLUR_SIZE, BLUR_SIZE), sigmaX=0)
+        # Guassian Blur
+        blur = cv2.GaussianBlur(src=gray, ksize=(BLUR_SIZE, BLUR_SIZE), sigmaX=0)
 
     # Laplacian Transform
     laplacian = cv2.Laplacian(src=blur, ddepth=cv2.CV_8U, ksize=3)
@@ -68,15 +78,10 @@ def ModuleInFrame(color_image: np.ndarray) -> bool:
     circles = np.reshape(circles, (np.shape(circles)[1], 3))
 
     # Finding slopes between the circles
-    slopes = np.array([])
-    for x, y, r in circles:
-        # cv2.circle(output, (x, y), r, (0, 255, 0), 4)
-        # cv2.rectangle(output, (x - 5, y - 5), (x + 5, y + 5), (0, 128, 255), -1)
-        for iX, iY, iR in circles:
-            m = (iY - y) / (iX - x)
-            # slope must be non-infinite and can't be between the same circle
-            if (not np.isnan(m)) and (not np.isinf(m)) and (x != iX and y != iY):
-                slopes = np.append(slopes, m)
+    # for x, y, r in circles:
+    #     cv2.circle(output, (x, y), r, (0, 255, 0), 4)
+    #     cv2.rectangle(output, (x - 5, y - 5), (x + 5, y + 5), (0, 128, 255), -1)
+    slopes = get_slopes(circles)
 
     if not slopes.size:
         return False
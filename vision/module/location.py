@@ -6,24 +6,63 @@ import cv2
 import numpy as np
 
 from vision.bounding_box import ObjectType, BoundingBox
+from vision.common.buffers import BufferPool
+from vision.module.clustering import cluster_circles
+from vision.module.slopes import get_slopes
 
 
 class ModuleLocation:
     """
     Finds the coordinates of the center of the front face of the module.
+
+    Parameters
+    ----------
+    tracking: bool
+        Whether to search only a window around the last found module.
+    max_misses: int
+        Images in a row the module can be missing from the window before
+        searching the full image again.
+    pyramid: bool
+        Whether to find circles on a downscaled image first, for images taller than REFERENCE_HEIGHT.
+        Off by default, small holes can be lost when downscaling.
     """
 
     ## Initialization
 
-    def __init__(self):
+    # Circle detection parameters, tuned on REFERENCE_HEIGHT images and scaled up for larger images
+    REFERENCE_HEIGHT = 480  # (in px)
+    BLUR_SIZE = 5  # Size of the blur kernel
+    MIN_DIST = 10  # (in px), minimum distance between circle centers
+    MAX_RADIUS = 10  # (in px), largest hole radius
+
+    def __init__(
+        self, tracking: bool = False, max_misses: int = 3, pyramid: bool = False
+    ):
         np.seterr(all="ignore")  # Ignore numpy warnings
 
+        self.tracking = tracking
+        self.max_misses = max_misses
+        self.pyramid = pyramid
+
+        self.track = None  # (x, y, half window size) of the last found module
+        self.misses = 0  # images in a row the tracked module was not found
+        # (x0, y0, x1, y1) part of the image searched, None for all of it
+        self.window = None
+        # whether the current image is searched from the track
+        self.from_tracking = False
+        self.found_center = False  # whether a center was found in the current image
+
+        self.buffers = BufferPool()  # pre-processing images reused between images
+
         self.img = np.array(0)  # Color image input
         self.depth = np.array(0)  # Depth image input
+        self.frame = None  # FrameCache of the input images, if any
 
         self.text_boxes = []  # list of BoundingBoxes of the text in the image
 
         self.circles = np.array(0)  # Array of circles detected in color image
+        # Unfiltered circles given by set_circles, None to detect them
+        self.found_circles = None
         self.clusters = []  # list of grouped circles that are near each other
         self.best_cluster = np.array(
             []
@@ -120,6 +159,8 @@ class ModuleLocation:
         self.center[0] = x_total // num_holes
         self.center[1] = y_total // num_holes
 
+        self.found_center = True
+
         # Returns either the center in the current image
         # or the center (0, 1) if no center was found
         return tuple(self.center)
@@ -250,13 +291,7 @@ class ModuleLocation:
         -------
         np.ndarray - Array of calculated slopes between circles
         """
-        slopes = np.array([])
-        for x, y, _ in circles:
-            for iX, iY, _ in circles:
-                m = (iY - y) / (iX - x)
-                # slope must be non-infinite and can't be between the same circle
-                if (not np.isnan(m)) and (not np.isinf(m)) and (x != iX and y != iY):
-                    slopes = np.append(slopes, m)
+        slopes = get_slopes(circles)
 
         # Convert slopes to degrees
         slopes = np.degrees(np.arctan(slopes))
@@ -265,35 +300,88 @@ class ModuleLocation:
 
     ## Image Processing
 
-    def _increase_brightness(self, offset: int) -> np.ndarray:
+    def _get_gray(self, img: np.ndarray) -> np.ndarray:
         """
-        Increases brightness of self.img by scaling the median to 128 + an offset
+        Converts a color image to gray scale, in a buffer reused between images.
 
         Parameters
         ----------
+        img: np.ndarray
+            Color image.
+
+        Returns
+        -------
+        np.ndarray - gray scale image, overwritten by the next call.
+        """
+        gray = self.buffers.get("gray", np.shape(img)[:2], np.uint8)
+
+        return cv2.cvtColor(src=img, code=cv2.COLOR_BGR2GRAY, dst=gray)
+
+    def _get_brightness_alpha(self, gray: np.ndarray, offset: int) -> float:
+        """
+        Finds the brightness scale that moves the median brightness of an image to 128 + an offset.
+        The median is taken from a histogram, for an even number of pixels it is the lower middle value.
+
+        Parameters
+        ----------
+        gray: np.ndarray
+            Gray scale image.
         offset: int
             The offset at which to scale the median brightness to. Range: [-128, 127]
 
         Returns
         -------
-        np.ndarray - brightened color image
+        float - brightness scale
         """
-        # Get gray scale of color image
-        gray = cv2.cvtColor(src=self.img, code=cv2.COLOR_RGB2GRAY)
-        median_brightness = np.median(gray)  # median brightness of gray scale image
+        histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+
+        # median brightness of gray scale image
+        median_brightness = np.searchsorted(np.cumsum(histogram), (gray.size + 1) / 2)
 
         if not median_brightness:  # prevent divide by zero
             median_brightness = 1
 
         # Calculate magnitude of brightness based on median + offset
-        alpha_value = (128 + offset) / median_brightness
+        return (128 + offset) / median_brightness
+
+    def _preprocess(self, gray: np.ndarray, alpha: float, scale: float) -> np.ndarray:
+        """
+        Brightens, blurs and takes the Laplacian of a gray scale image, in buffers reused between images.
+
+        Parameters
+        ----------
+        gray: np.ndarray
+            Gray scale image.
+        alpha: float
+            Brightness scale, from _get_brightness_alpha.
+        scale: float
+            Resolution of the camera over REFERENCE_HEIGHT, the blur kernel is scaled by it.
+
+        Returns
+        -------
+        np.ndarray - Laplacian image, overwritten by the next call.
+        """
+        # Size of the blur kernel, odd
+        blur_size = 2 * int(round(self.BLUR_SIZE * scale / 2 - 0.5)) + 1
+
+        shape = np.shape(gray)
+
+        # Increase brightness, scaling gray is the same as scaling color then taking gray
+        bright = self.buffers.get("bright", shape, np.uint8)
+        bright = cv2.convertScaleAbs(src=gray, dst=bright, alpha=alpha, beta=0)
+
+        # Guassian Blur / Median Blur
+        blur = self.buffers.get("blur", shape, np.uint8)
+        blur = cv2.GaussianBlur(
+            src=bright, ksize=(blur_size, blur_size), sigmaX=0, dst=blur
+        )
+        # blur = cv2.medianBlur(gray, 15)
+        # blur = cv2.bilateralFilter(src=gray, d=11, sigmaColor=75, sigmaSpace=75)
 
-        # Brighten image
-        brightened_image = cv2.addWeighted(
-            src1=self.img, alpha=alpha_value, src2=0, beta=0, gamma=0
-        )  # brightened_image = src1*alpha + src2*beta + gamma
+        # Laplacian Transform / ksize = 3 for Guassian / ksize = 1 for Median
+        laplacian = self.buffers.get("laplacian", shape, np.uint8)
 
-        return brightened_image
+        return cv2.Laplacian(src=blur, ddepth=cv2.CV_8U, ksize=3, dst=laplacian)
 
     def _filter_text_circles(self) -> np.ndarray:
         """
@@ -314,11 +402,6 @@ class ModuleLocation:
         if len(self.text_boxes) < MIN_TEXTBOXES or len(self.text_boxes) > MAX_TEXTBOXES:
             return self.circles
 
-        # Filter out rectangles that are not directly below text
-        circle_filter = np.array(
-            [], dtype=np.uint16
-        )  # array of indices of circles out of bounds
-
         # get text bounding extreme points of rotated bounding boxes
         ll_x, ll_y = self.text_boxes[0].vertices[0]  # lower left point
         lr_x, lr_y = self.text_boxes[-1].vertices[3]  # lower right point
@@ -343,27 +426,23 @@ class ModuleLocation:
 
         # create a vector from the lower-left/lower-right corner of text to all detected circles
         # the cross product tells us what side of the bounding vectors the circle is on
-        for i, (x, y, _) in enumerate(self.circles):
-            needs_removal = False  # assume the circle is safely below the text
+        x = self.circles[:, 0].astype(np.int64)
+        y = self.circles[:, 1].astype(np.int64)
 
-            # create two vectors
-            ll_to_circ = (x - ll_x, y - ll_y)  # vector from ll bound to circle
-            lr_to_circ = (x - lr_x, y - lr_y)  # vector from lr bound to circle
+        ll_to_circ = (x - ll_x, y - ll_y)  # vectors from ll bound to circles
+        lr_to_circ = (x - lr_x, y - lr_y)  # vectors from lr bound to circles
 
-            lower_cross = np.cross(lower_vect, ll_to_circ)  # <0 = above lower bound
-            if lower_cross <= 0:
-                needs_removal = True
-            left_cross = np.cross(perp_vect, ll_to_circ)  # >0 = outside left bound
-            if left_cross >= 0:
-                needs_removal = True
-            right_cross = np.cross(perp_vect, lr_to_circ)  # <0 = outside right bound
-            if right_cross <= 0:
-                needs_removal = True
+        # <0 = above lower bound
+        lower_cross = lower_vect[0] * ll_to_circ[1] - lower_vect[1] * ll_to_circ[0]
+        # >0 = outside left bound
+        left_cross = perp_vect[0] * ll_to_circ[1] - perp_vect[1] * ll_to_circ[0]
+        # <0 = outside right bound
+        right_cross = perp_vect[0] * lr_to_circ[1] - perp_vect[1] * lr_to_circ[0]
 
-            if needs_removal:
-                circle_filter = np.append(circle_filter, i)
+        # Filter out circles that are not directly below text
+        needs_removal = (lower_cross <= 0) | (left_cross >= 0) | (right_cross <= 0)
 
-        self.circles = np.delete(self.circles, circle_filter, axis=0)
+        self.circles = self.circles[~needs_removal]
 
     def _filter_distant_circles(self, depth_threshold: int) -> np.ndarray:
         """
@@ -378,18 +457,11 @@ class ModuleLocation:
         -------
         np.ndarray - filtered array of circles
         """
-        # Create filter of far away circles based on depth image
-        circle_filter = np.array(
-            [], dtype=np.uint16
-        )  # array of indices of distant circles
+        # Depth at the center of every circle
+        circle_depths = self.depth[self.circles[:, 1], self.circles[:, 0]]
 
-        for i, (x, y, _) in enumerate(self.circles):
-            if (
-                self.depth[y][x] > depth_threshold
-            ):  # if too far away, remove (add index to filter)
-                circle_filter = np.append(circle_filter, i)
-
-        self.circles = np.delete(self.circles, circle_filter, axis=0)
+        # Remove circles that are too far away
+        self.circles = self.circles[circle_depths <= depth_threshold]
 
     def _cluster_circles(self) -> None:
         """
@@ -399,48 +471,11 @@ class ModuleLocation:
         -------
         None
         """
-        MIN_CIRCLES = 5  # minimum number of total circles to require clusting
-        CLSTR_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-        MAX_COMPACTNESS = 40000  # NOTE: May need scaling up for higher res, only tested with 480p Data
-        MIN_COMPACTNESS = (
-            1000  # At this level, we're likely splitting up a potentially good cluster
-        )
-        MAX_CLUSTERS = 30
-
-        if self.circles.shape[0] < 5:  # not enough circles for clustering
-            # place all circles into one cluster
-            num_clusters = 1
-            labels = np.zeros(self.circles.shape[0], dtype=np.ushort)
-        else:
-            num_clusters = 2
-            kmeans_circles = self.circles.astype(
-                np.float32
-            )  # kmeans requires float32 data
-
-            compactness = MAX_COMPACTNESS + 1  # init compactness to enter while loop
-            while compactness > MAX_COMPACTNESS:  # ensure low variance within clusters
-                # perform clustring with current num_clusters
-                compactness, labels, _ = cv2.kmeans(
-                    data=kmeans_circles,
-                    K=num_clusters,
-                    bestLabels=None,
-                    criteria=CLSTR_CRITERIA,
-                    attempts=30,
-                    flags=cv2.KMEANS_PP_CENTERS,
-                )
-
-                # too many clusters = too low confidence for further clustering
-                if num_clusters > MAX_CLUSTERS:
-                    return
-                # or circles are already super compact = likely overlapping
-                if compactness < MIN_COMPACTNESS:
-                    self.clusters = [self.circles]
-                    return
-                # attempt more clusters if clusters too spread out
-                if compactness > MAX_COMPACTNESS:
-                    num_clusters += 1  # try higher K value
+        # (in radii), largest distance between neighboring holes of a cluster
+        LINK_SCALE = 6
 
-            labels = np.ravel(labels)  # flatten column vector of labels
+        labels = cluster_circles(self.circles, LINK_SCALE)
+        num_clusters = np.max(labels) + 1 if labels.shape[0] else 0
 
         # Organize circles into a list of clusters
         self.clusters = [[] for x in np.arange(num_clusters)]
@@ -467,57 +502,162 @@ class ModuleLocation:
             else:
                 i += 1
 
-    def _circle_detection(self) -> np.ndarray:
+    def _find_circles(self) -> np.ndarray:
         """
-        Uses cv2 to detect circles in the color image.
+        Uses cv2 to detect circles in the color image, without any filtering.
+        Depends only on the color image, so it can run separately from text detection.
+
+        Above REFERENCE_HEIGHT, with pyramid set, circles are first found on a downscaled
+        image, then found at full resolution only in windows around groups of those circles.
 
         Returns
         -------
-        ndarray - circles detected in image.
+        ndarray - (x, y, r) circles detected in image.
         """
-        BLUR_SIZE = 5  # Size of the blur kernel
-        # NOTE: Blur size may need increase w/ higher resolution, only tested on 480p data set
         BRIGHTNESS_OFFSET = 42  # offset for brightness magnitude calculation
-        DEPTH_THRESH = 5000  # (in mm), tolerated dist. to filter circles
+        WINDOW_PADDING = 10  # (in downscaled px), padding around downscaled circles
+
+        # Only search the tracking window, if any
+        x0, y0 = 0, 0
+        img = self.img
+        if self.window is not None:
+            x0, y0, x1, y1 = self.window
+            img = self.img[y0:y1, x0:x1]
+
+        # Converted to gray once, brightness is applied to the gray image
+        if self.frame is not None:
+            gray = self.frame.gray()
+            if self.window is not None:
+                gray = gray[y0:y1, x0:x1]
+        else:
+            gray = self._get_gray(img)
 
-        ## Image Pre-processing ##
-        # Increase brightness of image
-        bright = self._increase_brightness(offset=BRIGHTNESS_OFFSET)
+        # Hough parameters are scaled from REFERENCE_HEIGHT to the camera resolution
+        scale = max(np.shape(self.img)[0] / self.REFERENCE_HEIGHT, 1)
 
-        # Grayscale
-        bright_gray = cv2.cvtColor(src=bright, code=cv2.COLOR_RGB2GRAY)
+        if not self.pyramid or scale == 1:
+            alpha = self._get_brightness_alpha(gray, BRIGHTNESS_OFFSET)
+            circles = self._hough_circles(gray, alpha, scale)
+        else:
+            ## Coarse: downscaled to REFERENCE_HEIGHT ##
+            height, width = np.shape(gray)
+            small_size = (
+                max(int(round(width / scale)), 1),
+                max(int(round(height / scale)), 1),
+            )
+            small = self.buffers.get("small", small_size[::-1], np.uint8)
+            small = cv2.resize(
+                src=gray, dsize=small_size, dst=small, interpolation=cv2.INTER_AREA
+            )
+            alpha = self._get_brightness_alpha(small, BRIGHTNESS_OFFSET)
+            candidates = self._hough_circles(small, alpha, 1)
 
-        # Guassian Blur / Median Blur
-        blur = cv2.GaussianBlur(src=bright_gray, ksize=(BLUR_SIZE, BLUR_SIZE), sigmaX=0)
-        # blur = cv2.medianBlur(gray, 15)
-        # blur = cv2.bilateralFilter(src=gray, d=11, sigmaColor=75, sigmaSpace=75)
+            # Group nearby candidates into windows
+            candidate_mask = np.zeros(np.shape(small)[:2], dtype=np.uint8)
+            for x, y, r in candidates.astype(np.int64):
+                pad = r + WINDOW_PADDING
+                cv2.rectangle(
+                    candidate_mask, (x - pad, y - pad), (x + pad, y + pad), 255, -1
+                )
 
-        # Laplacian Transform / ksize = 3 for Guassian / ksize = 1 for Median
-        laplacian = cv2.Laplacian(src=blur, ddepth=cv2.CV_8U, ksize=3)
-        laplacian = np.uint8(laplacian)
+            _, _, stats, _ = cv2.connectedComponentsWithStats(candidate_mask)
+
+            ## Fine: full resolution, only inside the windows ##
+            found = []
+            for win_x, win_y, win_w, win_h, _ in stats[1:]:
+                wx0, wy0 = int(win_x * scale), int(win_y * scale)
+                wx1 = min(int(np.ceil((win_x + win_w) * scale)), width)
+                wy1 = min(int(np.ceil((win_y + win_h) * scale)), height)
+
+                window_circles = self._hough_circles(
+                    gray[wy0:wy1, wx0:wx1], alpha, scale
+                )
+                window_circles[:, 0] += wx0
+                window_circles[:, 1] += wy0
+                found.append(window_circles)
+
+            circles = np.concatenate(found) if found else np.zeros((0, 3), np.uint16)
+
+            # Windows may overlap, drop circles too close to an earlier one
+            if circles.shape[0] > 1:
+                centers = circles[:, :2].astype(np.float64)
+                distances = np.linalg.norm(centers[:, np.newaxis] - centers, axis=2)
+                too_close = np.triu(distances < self.MIN_DIST * scale, k=1)
+                circles = circles[~np.any(too_close, axis=0)]
+
+        ## Reformatting ##
+        # Prevents TypeError if no circles detected
+        if not circles.shape[0]:
+            return np.array([])
+
+        # Move window circles to full image coordinates
+        circles[:, 0] += x0
+        circles[:, 1] += y0
+
+        return circles
+
+    def _hough_circles(
+        self, gray: np.ndarray, alpha: float, scale: float
+    ) -> np.ndarray:
+        """
+        Pre-processes an image and finds circles in it with HoughCircles.
+
+        Parameters
+        ----------
+        gray: np.ndarray
+            Gray scale image to find circles in.
+        alpha: float
+            Brightness scale, from _get_brightness_alpha.
+        scale: float
+            Resolution of the camera over REFERENCE_HEIGHT, Hough parameters are scaled by it.
+
+        Returns
+        -------
+        ndarray - (x, y, r) uint16 circles relative to gray, shape (0, 3) if none found.
+        """
+        ## Image Pre-processing ##
+        laplacian = self._preprocess(gray, alpha, scale)
 
         ## Hough Circle Detection ##
-        self.circles = cv2.HoughCircles(  # NOTE: Params may need partial rework, only tested on 480p data
+        circles = cv2.HoughCircles(
             image=laplacian,
             method=cv2.HOUGH_GRADIENT,
             dp=1,
-            minDist=10,
+            minDist=self.MIN_DIST * scale,
             param1=70,  # canny edge detector gradient upper threshold
-            param2=14,  # accumulator threshold for circle centers
+            param2=int(round(14 * scale)),  # accumulator threshold for circle centers
             minRadius=0,
-            maxRadius=10,  # NOTE: May need to be increased, only tested on 480p data
+            maxRadius=int(round(self.MAX_RADIUS * scale)),
         )
 
         ## Reformatting ##
         # Prevents TypeError if no circles detected
-        if self.circles is None:
-            self.circles = np.array([])
-            return self.circles
+        if circles is None:
+            return np.zeros((0, 3), dtype=np.uint16)
 
-        self.circles = np.uint16(self.circles)
+        circles = np.uint16(circles)
 
         # Resize circles into 2d array
-        self.circles = np.reshape(self.circles, (np.shape(self.circles)[1], 3))
+        return np.reshape(circles, (np.shape(circles)[1], 3))
+
+    def _circle_detection(self) -> np.ndarray:
+        """
+        Detects circles in the color image, or uses those given to set_circles,
+        then filters out distant circles and circles not below the text.
+
+        Returns
+        -------
+        ndarray - circles detected in image.
+        """
+        DEPTH_THRESH = 5000  # (in mm), tolerated dist. to filter circles
+
+        if self.found_circles is None:
+            self.circles = self._find_circles()
+        else:
+            self.circles = np.copy(self.found_circles)
+
+        if not self.circles.size:
+            return self.circles
 
         ## Post-Processing: Circle filtering and grouping ##
         # Remove circles that are farther than DEPTH_THRESHOLD millimeters away
@@ -528,9 +668,70 @@ class ModuleLocation:
 
         return self.circles
 
+    ## Tracking
+
+    def _update_track(self) -> None:
+        """
+        Updates the track with the result of the last image.
+        The track is dropped after max_misses images in a row without a center.
+
+        Returns
+        -------
+        None
+        """
+        MIN_HALF_WINDOW = 60  # (in px), smallest half width of the tracking window
+        WINDOW_SCALE = 2  # half width of the tracking window, in module hole spans
+
+        if self.found_center:
+            hole_span = np.max(np.ptp(self.holes[:, :2].astype(np.int64), axis=0))
+
+            self.track = (
+                int(self.center[0]),
+                int(self.center[1]),
+                int(max(WINDOW_SCALE * hole_span, MIN_HALF_WINDOW)),
+            )
+            self.misses = 0
+        elif self.track is not None:
+            self.misses += 1
+
+            if self.misses >= self.max_misses:
+                self.track = None
+                self.misses = 0
+
+    def _get_window(self) -> tuple:
+        """
+        Finds the part of the image to search around the tracked module.
+
+        Returns
+        -------
+        tuple - (x0, y0, x1, y1) bounds of the window, clipped to the image,
+            or None if the window is outside of the image.
+        """
+        x, y, half_window = self.track
+        height, width = self.img.shape[:2]
+
+        x0, y0 = max(x - half_window, 0), max(y - half_window, 0)
+        x1, y1 = min(x + half_window, width), min(y + half_window, height)
+
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        return (x0, y0, x1, y1)
+
+    def reset_track(self) -> None:
+        """
+        Forgets the tracked module, the next image is searched in full.
+
+        Returns
+        -------
+        None
+        """
+        self.track = None
+        self.misses = 0
+
     ## Input Functions
 
-    def set_img(self, color: np.ndarray, depth: np.ndarray) -> None:
+    def set_img(self, color: np.ndarray, depth: np.ndarray, frame=None) -> None:
         """
         Sets the image detection is performed on.
 
@@ -540,17 +741,32 @@ class ModuleLocation:
             The color image.
         depth: ndarray
             The depth image.
+        frame: FrameCache
+            Images already derived from color and depth, shared with other algorithms.
 
         Returns
         -------
         None
         """
+        # Carry the last image's result into the track
+        if self.tracking:
+            self._update_track()
+
         # Set depth and color images
         self.depth = depth
         self.img = color
+        self.frame = frame
+
+        # Search around the tracked module, if any
+        self.window = None
+        if self.track is not None:
+            self.window = self._get_window()
+        self.from_tracking = self.window is not None
+        self.found_center = False
 
         # Re-initialize all important values to zero/empty
         self.circles = np.array([])
+        self.found_circles = None
         self.clusters = []
         self.best_cluster = np.array([])
 
@@ -580,6 +796,24 @@ class ModuleLocation:
         # Set text boxes
         self.text_boxes = text_boxes
 
+    def set_circles(self, circles: np.ndarray) -> None:
+        """
+        Sets the unfiltered circles of the image, as found by _find_circles,
+        so circle detection can be run elsewhere (e.g. on a worker process).
+        Must be called after set_img.
+
+        Parameters
+        ----------
+        circles: ndarray
+            (x, y, r) circles detected in the color image.
+
+        Returns
+        -------
+        None
+        """
+        self.found_circles = np.asarray(circles)
+        self.needs_recalc = True
+
     ## Visualization Functions
 
     def show_img(self, draw_circles: bool = False, draw_center: bool = False) -> None:
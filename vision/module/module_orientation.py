@@ -2,13 +2,18 @@
 get_module_orientation will calculate the orientation of the module in degrees
 and return them as a tuple (x tilt, y tilt) using a derivative through the x- and y- axes
 
+fit_module_plane will calculate the orientation of the module in degrees from a least-squares
+plane through every valid depth pixel, and how far the depths are from that plane
+
 get_module_roll will calculate the roll of the module in degrees with respect to the y axis
+from the dominant orientation of the image gradients, get_module_roll_contours from the
+minimum area rectangles of the edge contours
 """
 import numpy as np
 import cv2
 
 
-def get_module_orientation(roi: np.ndarray) -> tuple:
+def get_module_orientation(roi: np.ndarray, fit_plane: bool = False) -> tuple:
     """
     Finds the orientation of the module in degrees
 
@@ -16,11 +21,17 @@ def get_module_orientation(roi: np.ndarray) -> tuple:
     ----------
     roi: numpy array
         module region of interest calculated by get_region_of_interest
+    fit_plane: bool
+        Whether to fit a plane to every valid depth pixel with fit_module_plane,
+        instead of using only the first and last rows and columns
 
     Returns
     -----------
     tuple(float) - degrees in coordinates of the tilt on the x and y axes, respectively
     """
+    if fit_plane:
+        return fit_module_plane(roi)[:2]
+
     if roi.size == 0:
         return 0.0, 0.0
 
@@ -33,25 +44,228 @@ def get_module_orientation(roi: np.ndarray) -> tuple:
     return x_tilt, y_tilt
 
 
+def _fit_plane(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """
+    Least-squares plane z = a * x + b * y + c, solved from the normal equations.
+
+    Parameters
+    ----------
+    x, y, z: numpy array
+        coordinates of the points, x and y preferably centered
+
+    Returns
+    -----------
+    numpy array - (a, b, c), None if the points do not define a plane
+    """
+    n = x.size
+    sx, sy, sz = np.sum(x), np.sum(y), np.sum(z)
+
+    normal_matrix = np.array(
+        [[x @ x, x @ y, sx], [x @ y, y @ y, sy], [sx, sy, n]], dtype=np.float64
+    )
+    normal_vector = np.array([x @ z, y @ z, sz], dtype=np.float64)
+
+    try:
+        return np.linalg.solve(normal_matrix, normal_vector)
+    except np.linalg.LinAlgError:  # points all in a line
+        return None
+
+
+def fit_module_plane(
+    roi: np.ndarray,
+    ransac_iterations: int = 0,
+    inlier_threshold: float = 10.0,
+    max_ransac_points: int = 500,
+) -> tuple:
+    """
+    Finds the orientation of the module in degrees from a least-squares plane
+    through every non-zero depth pixel of the region of interest.
+
+    Tilts are in the same terms as get_module_orientation, the depth change across
+    the region in meters, so both agree on a flat module.
+
+    Parameters
+    ----------
+    roi: numpy array
+        module region of interest calculated by get_region_of_interest
+    ransac_iterations: int
+        Number of random 3 pixel planes tried to find outliers, 0 fits every pixel
+    inlier_threshold: float
+        (in mm) largest distance from a RANSAC plane of pixels counted as on it
+    max_ransac_points: int
+        Number of pixels RANSAC planes are scored on, a random subset of larger regions
+
+    Returns
+    -----------
+    tuple(float) - degrees of the tilt on the x and y axes, and RMS distance (in mm) of the fitted pixels to the plane
+    """
+    MIN_POINTS = 3  # points needed to define a plane
+
+    if roi.ndim != 2 or roi.size == 0:
+        return 0.0, 0.0, 0.0
+
+    rows, columns = np.nonzero(roi)
+
+    if rows.size < MIN_POINTS:
+        return 0.0, 0.0, 0.0
+
+    z = roi[rows, columns].astype(np.float64)
+
+    # centered for a well conditioned solve
+    x = columns - (roi.shape[1] - 1) / 2
+    y = rows - (roi.shape[0] - 1) / 2
+
+    if ransac_iterations > 0:
+        random = np.random.default_rng(0)  # same result for the same region
+
+        # score planes on a subset of the pixels
+        scored = np.arange(z.size)
+        if z.size > max_ransac_points:
+            scored = random.integers(0, z.size, max_ransac_points)
+
+        # all planes at once, (iterations, 3 points)
+        samples = random.integers(0, z.size, (ransac_iterations, MIN_POINTS))
+        sample_matrices = np.stack(
+            (x[samples], y[samples], np.ones(samples.shape)), axis=2
+        )
+
+        # skip samples in a line
+        determinants = np.linalg.det(sample_matrices)
+        valid = np.abs(determinants) > 1e-9
+
+        if np.any(valid):
+            planes = np.linalg.solve(
+                sample_matrices[valid], z[samples[valid]][:, :, np.newaxis]
+            )[:, :, 0]
+
+            distances = np.abs(
+                planes[:, 0:1] * x[scored]
+                + planes[:, 1:2] * y[scored]
+                + planes[:, 2:3]
+                - z[scored]
+            )
+
+            best_plane = planes[
+                np.argmax(np.sum(distances <= inlier_threshold, axis=1))
+            ]
+
+            inliers = (
+                np.abs(best_plane[0] * x + best_plane[1] * y + best_plane[2] - z)
+                <= inlier_threshold
+            )
+
+            if np.count_nonzero(inliers) >= MIN_POINTS:
+                x, y, z = x[inliers], y[inliers], z[inliers]
+
+    plane = _fit_plane(x, y, z)
+
+    if plane is None:
+        return 0.0, 0.0, 0.0
+
+    x_slope, y_slope, offset = plane
+
+    # depth change across the region, in meters
+    x_tilt = np.degrees(np.arctan(x_slope * (roi.shape[1] - 1) / 1000))
+    y_tilt = np.degrees(np.arctan(y_slope * (roi.shape[0] - 1) / 1000))
+
+    residual = np.sqrt(np.mean((x_slope * x + y_slope * y + offset - z) ** 2))
+
+    return x_tilt, y_tilt, residual
+
+
 def get_module_roll(enclosing_region: np.ndarray) -> float:
     """
-    Finds the roll of the module in degrees
+    Finds the roll of the module in degrees, from the dominant orientation of the strong
+    image gradients. The module's edges are at right angles, so orientations are taken modulo 90.
+
+    Parameters
+    ----------
+    enclosing_region: numpy array
+        region of the image with the module, calculated by module_bounding
+        image is supposed to be padded enough to include the entire
+        BGR color, or already gray scale
+
+    Returns
+    -----------
+    float - module roll with respect to the positive y axis in degrees, in (0, 90] like cv2.minAreaRect
+    """
+    MIN_STRENGTH = 0.25  # weakest gradient used, as a fraction of the strongest
+    SMOOTHING = np.array([1, 2, 3, 2, 1])  # weights of neighboring 1 degree bins
+    # (in degrees), orientations around the peak averaged for the result
+    REFINE_RANGE = 8
+
+    if enclosing_region.size == 0:
+        return np.float64(0.0)
+
+    if enclosing_region.ndim == 3:
+        enclosing_region = cv2.cvtColor(enclosing_region, cv2.COLOR_BGR2GRAY)
+
+    # blurred and halved in one step, edge orientations do not need full resolution
+    blur = cv2.pyrDown(enclosing_region)
+
+    x_gradient = cv2.Scharr(blur, cv2.CV_32F, 1, 0)
+    y_gradient = cv2.Scharr(blur, cv2.CV_32F, 0, 1)
+
+    magnitude = cv2.magnitude(x_gradient, y_gradient)
+
+    max_magnitude = np.max(magnitude)
+    if not max_magnitude:  # no edges
+        return np.float64(0.0)
+
+    strong = magnitude > MIN_STRENGTH * max_magnitude
+    weights = magnitude[strong]
+
+    orientations = np.degrees(np.arctan2(y_gradient[strong], x_gradient[strong])) % 90
+
+    # magnitude weighted histogram of orientations, 1 degree bins wrapping around at 90
+    histogram = np.bincount(
+        orientations.astype(np.intp) % 90, weights=weights, minlength=90
+    )
+
+    pad = SMOOTHING.size // 2
+    histogram = np.convolve(
+        np.concatenate((histogram[-pad:], histogram, histogram[:pad])),
+        SMOOTHING,
+        mode="valid",
+    )
+
+    peak = np.argmax(histogram) + 0.5  # center of the peak bin
+
+    # refine with the weighted mean of the orientations near the peak
+    offsets = (orientations - peak + 45) % 90 - 45
+    near = np.abs(offsets) < REFINE_RANGE
+
+    roll = (peak + np.average(offsets[near], weights=weights[near])) % 90
+
+    # same range as cv2.minAreaRect angles
+    if roll <= 0:
+        roll += 90
+
+    return np.float64(roll)
+
+
+def get_module_roll_contours(enclosing_region: np.ndarray) -> float:
+    """
+    Finds the roll of the module in degrees, from the minimum area rectangles of simple edge contours.
+    Slower than get_module_roll.
 
     Parameters
     ----------
     enclosing_region: numpy array
         region of the image with the module, calculated by module_bounding
         image is supposed to be padded enough to include the entire
+        BGR color, or already gray scale
 
     Returns
     -----------
     float - module roll with respect to the positive y axis in degrees
     """
     if enclosing_region.size == 0:
-        return 0.0
+        return np.float64(0.0)
 
     # contours only work on grey images
-    enclosing_region = cv2.cvtColor(enclosing_region, cv2.COLOR_BGR2GRAY)
+    if enclosing_region.ndim == 3:
+        enclosing_region = cv2.cvtColor(enclosing_region, cv2.COLOR_BGR2GRAY)
 
     edges = cv2.Canny(enclosing_region, 150, 450)
 
@@ -91,9 +305,9 @@ def get_module_roll(enclosing_region: np.ndarray) -> float:
     try:
         angles = np_rectangles[:, 2]
 
-        roll = np.mean(angles)
+        roll = np.float64(np.mean(angles))
     except:
-        roll = 0
+        roll = np.float64(0.0)
 
     return roll
 
@@ -0,0 +1,41 @@
+"""
+This file contains the get_slopes function to find the slopes between every pair of circles.
+"""
+
+import numpy as np
+
+
+def get_slopes(circles: np.ndarray) -> np.ndarray:
+    """
+    Finds the slopes between every ordered pair of circles.
+
+    Slopes between circles sharing an x or y coordinate, and slopes that are
+    not finite, are left out. Slopes are ordered by first circle then second circle.
+    NOTE: Differences are taken in the dtype of circles, so unsigned circles wrap around.
+
+    Parameters
+    ----------
+    circles: ndarray
+        (x, y, ...) circles to get the slopes between.
+
+    Returns
+    -------
+    ndarray - slopes between circles.
+    """
+    circles = np.asarray(circles)
+
+    if not circles.size:
+        return np.array([])
+
+    x, y = circles[:, 0], circles[:, 1]
+
+    # [i, j] is from circle i to circle j
+    different = (x[:, np.newaxis] != x) & (y[:, np.newaxis] != y)
+
+    with np.errstate(all="ignore"):
+        rise = (y - y[:, np.newaxis])[different]
+        run = (x - x[:, np.newaxis])[different]
+
+        slopes = rise / run
+
+    return slopes[np.isfinite(slopes)]
@@ -12,6 +12,7 @@ sys.path.append(os.path.dirname(__file__))
 try:
     from obstacle_finder import ObstacleFinder
     from obstacle_tracker import Obstacle, ObstacleTracker
+    from assignment import linear_assignment, gated_assignment
 
 except ImportError as e:
     print(f"obstacle/__init__.py failed: {e}")
@@ -0,0 +1,181 @@
+"""
+This file contains functions to match objects between frames one to one, by least total distance.
+"""
+
+import numpy as np
+
+
+def linear_assignment(cost: np.ndarray) -> tuple:
+    """
+    Solves the linear assignment problem with the Hungarian algorithm,
+    using shortest augmenting paths with the inner loop over columns vectorized.
+
+    Every row is assigned a column if there are at least as many columns as rows,
+    otherwise every column is assigned a row.
+
+    Parameters
+    ----------
+    cost: ndarray
+        (rows, columns) finite cost of assigning each row to each column.
+
+    Returns
+    -------
+    tuple - (row indices, column indices) of the assignment with least total cost, sorted by row.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+
+    if not cost.size:
+        return np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+
+    num_rows, num_columns = cost.shape
+
+    # potentials, and for each column its row and the previous column on its augmenting path
+    # all 1-indexed, column 0 is a virtual column to start each path from
+    row_potentials = np.zeros(num_rows + 1)
+    column_potentials = np.zeros(num_columns + 1)
+    assigned_rows = np.zeros(num_columns + 1, dtype=np.intp)
+    path = np.zeros(num_columns + 1, dtype=np.intp)
+
+    for row in range(1, num_rows + 1):
+        assigned_rows[0] = row
+        column = 0
+
+        min_slack = np.full(num_columns + 1, np.inf)
+        used = np.zeros(num_columns + 1, dtype=bool)
+
+        # grow the shortest path tree until it reaches an unassigned column
+        while True:
+            used[column] = True
+            path_row = assigned_rows[column]
+
+            slack = (
+                cost[path_row - 1] - row_potentials[path_row] - column_potentials[1:]
+            )
+
+            better = ~used[1:] & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            path[1:][better] = column
+
+            free_slack = np.where(used[1:], np.inf, min_slack[1:])
+            next_column = int(np.argmin(free_slack)) + 1
+            delta = free_slack[next_column - 1]
+
+            row_potentials[assigned_rows[used]] += delta
+            column_potentials[used] -= delta
+            min_slack[~used] -= delta
+
+            column = next_column
+            if not assigned_rows[column]:
+                break
+
+        # flip the assignments along the path
+        while column:
+            previous = path[column]
+            assigned_rows[column] = assigned_rows[previous]
+            column = previous
+
+    columns = np.nonzero(assigned_rows[1:])[0]
+    rows = assigned_rows[1:][columns] - 1
+
+    if transposed:
+        rows, columns = columns, rows
+
+    order = np.argsort(rows)
+
+    return rows[order], columns[order]
+
+
+def gated_assignment(distances: np.ndarray, gate: float) -> tuple:
+    """
+    Matches rows to columns one to one, only where their distance is within gate.
+
+    The most pairs possible are matched, with the least total distance among those.
+    Rows and columns are split into groups connected by distances within gate,
+    and each group is solved on its own, so far apart objects add little cost.
+
+    Parameters
+    ----------
+    distances: ndarray
+        (rows, columns) distance between each row and column.
+    gate: float
+        Largest distance of a matched pair.
+
+    Returns
+    -------
+    tuple - (row indices, column indices) of matched pairs, sorted by row.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    num_rows, num_columns = distances.shape
+
+    candidates = distances <= gate
+
+    # pairs with no other candidates are matched directly, e.g. well separated obstacles
+    single_row = candidates.sum(axis=1) == 1
+    single_column = candidates.sum(axis=0) == 1
+    single = single_row[:, np.newaxis] & single_column
+    single_rows, single_columns = np.nonzero(candidates & single)
+
+    edge_rows, edge_columns = np.nonzero(candidates & ~single)
+
+    # forest over rows then columns linked by gated pairs, parents never above children
+    parents = np.arange(num_rows + num_columns)
+    edge_nodes = num_rows + edge_columns
+
+    while True:
+        # point every node at its root
+        roots = parents[parents]
+        while np.any(roots != parents):
+            parents = roots
+            roots = parents[parents]
+
+        root_rows, root_columns = parents[edge_rows], parents[edge_nodes]
+        split = root_rows != root_columns
+
+        if not np.any(split):
+            break
+
+        # hook the higher root of each split pair under the lower one
+        root_rows, root_columns = root_rows[split], root_columns[split]
+        np.minimum.at(
+            parents,
+            np.maximum(root_rows, root_columns),
+            np.minimum(root_rows, root_columns),
+        )
+
+    # edges split by group, the root of their rows
+    groups = parents[edge_rows]
+    order = np.argsort(groups, kind="stable")
+    bounds = np.flatnonzero(np.diff(groups[order])) + 1
+
+    matched_rows, matched_columns = [single_rows], [single_columns]
+
+    for group_rows, group_columns in zip(
+        np.split(edge_rows[order], bounds), np.split(edge_columns[order], bounds)
+    ):
+        if not group_rows.size:
+            continue
+
+        group_rows = np.unique(group_rows)
+        group_columns = np.unique(group_columns)
+
+        cost = distances[np.ix_(group_rows, group_columns)]
+        gated = ~(cost <= gate)
+
+        # more than any set of gated pairs costs, so the most pairs are matched first
+        cost[gated] = gate * (min(cost.shape) + 1) + 1
+
+        rows, columns = linear_assignment(cost)
+        kept = ~gated[rows, columns]
+
+        matched_rows.append(group_rows[rows[kept]])
+        matched_columns.append(group_columns[columns[kept]])
+
+    rows = np.concatenate(matched_rows)
+    columns = np.concatenate(matched_columns)
+    order = np.argsort(rows)
+
+    return rows[order], columns[order]
@@ -11,9 +11,10 @@ sys.path += [parent_dir, gparent_dir, ggparent_dir]
 
 import cv2
 import numpy as np
-from vision.bounding_box import BoundingBox, ObjectType
+from vision.bounding_box import BoundingBox, BoundingBoxBatch, ObjectType
 import json
 from vision.common.import_params import import_params
+from vision.common.intrinsics import Intrinsics
 
 
 class ObstacleFinder:
@@ -24,9 +25,38 @@ class ObstacleFinder:
     ----------
     params: SimpleBlobDetector_Params
         SimpleBlobDetector params object
+    intrinsics: Intrinsics
+        intrinsics of the color image, from its field of view if None
+    depth_segmentation: dict
+        "depthSegmentation" category of the obstacle config; if enabled, obstacles are
+        found by segmenting the depth image into depth bands instead of with the blob
+        detector
     """
-    def __init__(self, params=None):
+    # box corners, in half sizes from the center
+    CORNERS = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)])
+
+    DEPTH_SAMPLES = 9  # samples across each blob's circle, per side
+    REFERENCE_HEIGHT = 480  # rows depth images are segmented at
+    DEPTH_SCALE = 0.001  # meters per depth image unit
+
+    # default depth segmentation settings, in depth image units and pixels
+    DEPTH_SEGMENTATION = {
+        "minDepth": 300,
+        "maxDepth": 6000,
+        "bandWidth": 1000,
+        "minArea": 200,
+        "maxArea": 2000000,
+    }
+
+    def __init__(self, params=None, intrinsics=None, depth_segmentation=None):
         self.keypoints = []
+        self.intrinsics = intrinsics
+
+        self.depth_segmentation = None
+        if depth_segmentation is not None and depth_segmentation.get("enable", False):
+            self.depth_segmentation = dict(self.DEPTH_SEGMENTATION)
+            self.depth_segmentation.update(depth_segmentation)
+
         self.params = params
         self.blob_detector = cv2.SimpleBlobDetector_create(self.params)
 
@@ -48,7 +78,7 @@ class ObstacleFinder:
         self._params = value
         self.blob_detector = cv2.SimpleBlobDetector_create(self.params)
 
-    def find(self, color_image, depth_image):
+    def find(self, color_image, depth_image, batch=False):
         """
         Detects obstacles in the image provided in the constructor
 
@@ -57,47 +87,253 @@ class ObstacleFinder:
         color_image: np.ndarray
             image to find obstacles in
         depth_image: np.ndarray
-            image to find obstacles in
+            aligned depth image, or None; gives each box with depth vertices_3d, the 8
+            camera-frame (x, y, z) corners of a box as deep as it is wide, and distance,
+            both in meters
+        batch: bool
+            whether to return a BoundingBoxBatch instead of a list, with the depth,
+            3D vertices and distance of each box
 
         Returns
         -------
         list[BoundingBox]
-            a list of bounding boxes represented as Rectangles, each with 8 (x, y, z) coordinates
+            a list of bounding boxes represented as Rectangles, each with 4 (x, y) image
+            coordinates
         """
 
         if not isinstance(color_image, np.ndarray):
             raise ValueError(f"Requires image as np.ndarray, got {type(color_image)}")
 
-        keypoints = self.blob_detector.detect(color_image)
-        self.keypoints = keypoints
+        if self.depth_segmentation is not None:
+            # (N, 2) centers and (N, 2) half widths and heights of the segments
+            centers, half_sizes = self._segment_depth(depth_image)
 
-        bounding_boxes = []
-        for keypoint in keypoints:
-            # find center and radius of keypoint
-            center_x, center_y = keypoint.pt[0], keypoint.pt[1]
-            radius = keypoint.size / 2
+            self.keypoints = [
+                cv2.KeyPoint(x, y, 2 * max(half_width, half_height))
+                for (x, y), (half_width, half_height) in zip(
+                    centers.tolist(), half_sizes.tolist()
+                )
+            ]
+        else:
+            keypoints = self.blob_detector.detect(color_image)
+            self.keypoints = keypoints
+
+            # (N, 2) centers and radii of the blobs
+            centers = np.array([keypoint.pt for keypoint in keypoints], np.float64)
+            centers = centers.reshape(-1, 2)
+            radii = np.array([keypoint.size for keypoint in keypoints], np.float64) / 2
+            half_sizes = np.repeat(radii[:, np.newaxis], 2, axis=1)
+
+        num_boxes = centers.shape[0]
 
-            # calculate coordinates for bounding box of each obstacle
-            pos_dx = center_x + radius
-            neg_dx = center_x - radius
-            pos_dy = center_y + radius
-            neg_dy = center_y - radius
+        # top left, top right, bottom right, bottom left, of every box at once
+        corners = centers[:, np.newaxis] + half_sizes[:, np.newaxis] * self.CORNERS
 
-            top_left_near = (neg_dx, neg_dy)
-            top_right_near = (pos_dx, neg_dy)
-            bottom_right_near = (pos_dx, pos_dy)
-            bottom_left_near = (neg_dx, pos_dy)
+        depths = None
+        if depth_image is not None and num_boxes:
+            depths = self._sample_depths(depth_image, centers, half_sizes.min(axis=1))
 
-            # With depth, these will be calculated differently
+        vertices_3d = distances = None
+        if depths is not None:
+            vertices_3d, distances = self._back_project(
+                color_image.shape, centers, half_sizes[:, 0], corners, depths
+            )
 
-            vertices = [top_left_near, top_right_near, bottom_right_near, bottom_left_near] # , top_left_far, top_right_far, bottom_right_far, bottom_left_far]
+        if batch:
+            return BoundingBoxBatch(
+                corners,
+                [ObjectType.AVOID] * num_boxes,
+                depths,
+                vertices_3d=vertices_3d,
+                distances=distances,
+            )
 
+        bounding_boxes = []
+        for i, vertices in enumerate(corners.tolist()):
             # create Rectangle and add to list of bounding boxes
-            bbox = BoundingBox(vertices, ObjectType.AVOID)
+            bbox = BoundingBox([tuple(vertex) for vertex in vertices], ObjectType.AVOID)
+
+            # near then far face, in meters from the camera
+            if vertices_3d is not None and not np.isnan(distances[i]):
+                bbox.vertices_3d = [tuple(vertex) for vertex in vertices_3d[i].tolist()]
+                bbox.distance = float(distances[i])
+
             bounding_boxes.append(bbox)
 
         return bounding_boxes
 
+    def _segment_depth(self, depth_image):
+        """
+        Finds obstacles as connected regions of half overlapping depth bands, nearest
+        first.
+
+        A region found in two neighboring bands is kept once, from the band it is
+        largest in.
+        Depth images taller than REFERENCE_HEIGHT are downscaled first.
+
+        Parameters
+        ----------
+        depth_image: np.ndarray
+            depth image to find obstacles in
+
+        Returns
+        -------
+        tuple
+            (N, 2) centers and (N, 2) half widths and heights of the regions' bounding
+            rectangles
+        """
+        if not isinstance(depth_image, np.ndarray):
+            raise ValueError(
+                f"Depth segmentation requires a depth image as np.ndarray, "
+                f"got {type(depth_image)}"
+            )
+
+        settings = self.depth_segmentation
+        band_width = settings["bandWidth"]
+
+        # larger depth images are segmented at REFERENCE_HEIGHT rows,
+        # near the Realsense's depth resolution
+        rows, columns = depth_image.shape[:2]
+        if rows > self.REFERENCE_HEIGHT:
+            small_columns = max(int(round(columns * self.REFERENCE_HEIGHT / rows)), 1)
+            depth_image = cv2.resize(
+                depth_image,
+                (small_columns, self.REFERENCE_HEIGHT),
+                interpolation=cv2.INTER_NEAREST,
+            )
+
+        # full resolution pixels per segmented pixel
+        scale = np.array([columns / depth_image.shape[1], rows / depth_image.shape[0]])
+        min_area = settings["minArea"] / scale.prod()
+        max_area = settings["maxArea"] / scale.prod()
+
+        candidates = []  # (band, area, x, y, width, height) of each region
+        lowers = np.arange(settings["minDepth"], settings["maxDepth"], band_width / 2)
+        for band, lower in enumerate(lowers):
+            upper = min(lower + band_width, settings["maxDepth"])
+
+            mask = cv2.inRange(depth_image, float(lower), float(upper))
+            _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+            areas = stats[1:, cv2.CC_STAT_AREA]  # label 0 is outside the band
+            kept = stats[1:][(areas >= min_area) & (areas <= max_area)]
+
+            for x, y, width, height, area in kept.tolist():
+                candidates.append((band, area, x, y, width, height))
+
+        # largest first, drop regions centered in a larger region of a neighboring band
+        candidates.sort(key=lambda candidate: -candidate[1])
+
+        regions = []
+        for band, _, x, y, width, height in candidates:
+            center_x, center_y = x + width / 2, y + height / 2
+
+            if any(
+                abs(band - other_band) == 1
+                and other_x <= center_x < other_x + other_width
+                and other_y <= center_y < other_y + other_height
+                for other_band, other_x, other_y, other_width, other_height in regions
+            ):
+                continue
+
+            regions.append((band, x, y, width, height))
+
+        regions.sort()  # nearest band first
+
+        rectangles = np.array([region[1:] for region in regions], dtype=np.float64)
+        rectangles = rectangles.reshape(-1, 4)
+        rectangles *= np.tile(scale, 2)
+        half_sizes = rectangles[:, 2:] / 2
+
+        return rectangles[:, :2] + half_sizes, half_sizes
+
+    def _sample_depths(self, depth_image, centers, radii):
+        """
+        Median non-zero depth inside each blob's circle, from a grid of samples.
+
+        Parameters
+        ----------
+        depth_image: np.ndarray
+            depth image the blobs were found in
+        centers: np.ndarray
+            (N, 2) centers of the blobs
+        radii: np.ndarray
+            (N,) radii of the blobs
+
+        Returns
+        -------
+        np.ndarray
+            (N,) depths, NaN where no sample has depth
+        """
+        rows, columns = np.shape(depth_image)[:2]
+
+        # (S, 2) offsets within the unit circle, scaled to each blob
+        grid = np.linspace(-1, 1, self.DEPTH_SAMPLES)
+        offsets = np.stack(np.meshgrid(grid, grid), axis=-1).reshape(-1, 2)
+        offsets = offsets[np.hypot(offsets[:, 0], offsets[:, 1]) <= 1]
+
+        points = centers[:, np.newaxis] + radii[:, np.newaxis, np.newaxis] * offsets
+        points = np.rint(points).astype(np.intp)
+
+        samples = depth_image[
+            np.clip(points[..., 1], 0, rows - 1),
+            np.clip(points[..., 0], 0, columns - 1),
+        ].astype(np.float64)
+
+        valid = samples != 0
+        has_depth = valid.any(axis=1)
+
+        samples = np.where(valid, samples, np.nan)[has_depth]
+
+        depths = np.full(centers.shape[0], np.nan)
+        depths[has_depth] = np.nanmedian(samples, axis=1)
+
+        return depths
+
+    def _back_project(self, image_shape, centers, radii, corners, depths):
+        """
+        Camera-frame boxes of the blobs, as deep as they are wide.
+
+        Parameters
+        ----------
+        image_shape: tuple
+            shape of the color image, for default intrinsics
+        centers: np.ndarray
+            (N, 2) centers of the blobs
+        radii: np.ndarray
+            (N,) half widths of the blobs
+        corners: np.ndarray
+            (N, 4, 2) image corners of the boxes
+        depths: np.ndarray
+            (N,) depth of each blob, in depth image units
+
+        Returns
+        -------
+        tuple
+            (N, 8, 3) near then far face vertices and (N,) distances to the near face
+            center, in meters
+        """
+        intrinsics = self.intrinsics
+        if intrinsics is None:
+            intrinsics = Intrinsics.from_fov(image_shape[1], image_shape[0])
+
+        near = depths * self.DEPTH_SCALE
+        far = near + 2 * radii * near / intrinsics.fx  # width of the blob at its depth
+
+        x, y = corners[..., 0], corners[..., 1]
+        vertices_3d = np.concatenate(
+            [
+                intrinsics.deproject(x, y, near[:, np.newaxis]),
+                intrinsics.deproject(x, y, far[:, np.newaxis]),
+            ],
+            axis=1,
+        )
+
+        near_centers = intrinsics.deproject(centers[:, 0], centers[:, 1], near)
+        distances = np.linalg.norm(near_centers, axis=-1)
+
+        return vertices_3d, distances
+
 
 if __name__ == '__main__':
     from vision.common.box_plotter import plot_box
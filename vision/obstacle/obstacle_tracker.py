@@ -2,10 +2,14 @@
 Keeps track of detected obstacles between frames
 """
 
-import cv2
 import numpy as np
 from vision.bounding_box import BoundingBox
 
+try:
+    from vision.obstacle.assignment import gated_assignment
+except ImportError:
+    from assignment import gated_assignment
+
 
 class Obstacle:
     """
@@ -15,17 +19,33 @@ class Obstacle:
     ----------
     bbox: BoundingBox
         bounding box of obstacle
+    center: np.ndarray
+        (x, y) center of the bounding box, computed if not given
+    track_id: int
+        id shared by the obstacle in every frame it was tracked through
     """
 
-    def __init__(self, bbox: BoundingBox):
+    def __init__(self, bbox: BoundingBox, center=None, track_id=None):
         self.bounding_box = bbox
-        self.center = np.mean(bbox.vertices, axis=0)
+        self.center = np.mean(bbox.vertices, axis=0) if center is None else center
+        self.track_id = track_id
         self.frames_persisted = 0
+        self.misses = 0  # frames since the obstacle was last detected
 
 
 class ObstacleTracker:
     """
     Track obstacles between frames.
+
+    Each track has a constant velocity Kalman filter of its x, y and depth.
+    Depths are the near face z of the boxes' vertices_3d from ObstacleFinder, in meters.
+    The axes are independent, so every axis of every track is a (position, velocity)
+    filter, and all of them are predicted and updated at once as arrays.
+
+    Each frame's obstacles are matched one to one with the tracks' predicted centers,
+    by least total distance in gates. A gate is MVMT_TOLERANCE, or wider while a
+    track's prediction is uncertain, e.g. before its velocity is known.
+    Tracks that are not matched are predicted for up to MAX_MISSES frames.
     """
 
     def __init__(self):
@@ -35,48 +55,169 @@ class ObstacleTracker:
         self.PERSISTENCE_THRESHOLD = (
             5  # number of frames for an obstacle to be considered consequential
         )
+        # frames to predict a track for after its obstacle is lost
+        self.MAX_MISSES = 3
+        # gate size, in standard deviations of the predicted center
+        self.GATE_SIGMAS = 3
+
+        # per axis (x, y, depth) noise of the filters, in pixels or meters
+        # acceleration per frame^2, measurement, and velocity of new tracks per frame
+        self.ACCELERATION_STD = np.array([5.0, 5.0, 0.1])
+        self.MEASUREMENT_STD = np.array([2.0, 2.0, 0.05])
+        self.INITIAL_VELOCITY_STD = np.array([40.0, 40.0, 0.5])
+
+        self.obstacles = []  # buffer that stores current Obstacles in view
+
+        # (N, 3, 2) position, velocity of each axis of each obstacle's track
+        self.states = np.zeros((0, 3, 2))
+        # (N, 3, 3) position variance, covariance, velocity variance of each axis
+        self.covariances = np.zeros((0, 3, 3))
+        # (N,) whether each track has had a depth measurement
+        self.has_depth = np.zeros(0, dtype=bool)
+
+        self.next_track_id = 0
+
+    @property
+    def centers(self) -> np.ndarray:
+        """
+        (N, 2) filtered x, y centers of the tracked obstacles.
+        """
+        return self.states[:, :2, 0]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        """
+        (N, 2) filtered x, y velocities of the tracked obstacles, in pixels per frame.
+        """
+        return self.states[:, :2, 1]
+
+    @property
+    def depths(self) -> np.ndarray:
+        """
+        (N,) filtered depths of the tracked obstacles, in meters, NaN if never measured.
+        """
+        return np.where(self.has_depth, self.states[:, 2, 0], np.nan)
+
+    def _predict(self) -> None:
+        """
+        Advance every track by one frame.
+        """
+        position_variance = self.covariances[..., 0]
+        covariance = self.covariances[..., 1]
+        velocity_variance = self.covariances[..., 2]
+
+        noise = self.ACCELERATION_STD ** 2
+
+        # P = F P F^T + Q, with F = [[1, 1], [0, 1]] and white acceleration noise
+        self.covariances = np.stack(
+            [
+                position_variance + 2 * covariance + velocity_variance + noise / 4,
+                covariance + velocity_variance + noise / 2,
+                velocity_variance + noise,
+            ],
+            axis=-1,
+        )
+
+        self.states[..., 0] += self.states[..., 1]
+
+    def _correct(
+        self, tracks: np.ndarray, measurements: np.ndarray, measured: np.ndarray
+    ) -> None:
+        """
+        Update tracks with measured positions.
+
+        Parameters
+        ----------
+        tracks: np.ndarray
+            (M,) indices of the tracks.
+        measurements: np.ndarray
+            (M, 3) measured x, y and depth.
+        measured: np.ndarray
+            (M, 3) whether each axis was measured.
+        """
+        states = self.states[tracks]
+        covariances = self.covariances[tracks]
+
+        position_variance = covariances[..., 0]
+        covariance = covariances[..., 1]
+
+        residual_variance = position_variance + self.MEASUREMENT_STD ** 2
+
+        # Kalman gains of position and velocity, 0 for axes that were not measured
+        position_gain = np.where(measured, position_variance / residual_variance, 0)
+        velocity_gain = np.where(measured, covariance / residual_variance, 0)
+
+        residuals = np.where(measured, measurements - states[..., 0], 0)
+
+        states[..., 0] += position_gain * residuals
+        states[..., 1] += velocity_gain * residuals
+
+        covariances = np.stack(
+            [
+                (1 - position_gain) * position_variance,
+                (1 - position_gain) * covariance,
+                covariances[..., 2] - velocity_gain * covariance,
+            ],
+            axis=-1,
+        )
+
+        self.states[tracks] = states
+        self.covariances[tracks] = covariances
+
+    @staticmethod
+    def _box_depth(box: BoundingBox) -> float:
+        """
+        Depth of a box's near face, from its vertices_3d.
+
+        Returns
+        -------
+        float - depth in meters, NaN if the box has no vertices_3d.
+        """
+        vertices_3d = getattr(box, "vertices_3d", None)
 
-        self.obstacles = np.array([])  # buffer that stores current Obstacles in view
+        return np.nan if vertices_3d is None else vertices_3d[0][2]
 
-    def _is_same_obstacle(self, obj1: Obstacle, obj2: Obstacle) -> bool:
+    @staticmethod
+    def _move_vertices_3d(box: BoundingBox, shift: np.ndarray, depth: float) -> tuple:
         """
-        Returns True if the position of obj1 is within self.MVMT_TOLERANCE of obj2
+        Camera-frame box moved by an image shift of its center and to a new depth.
+
+        The box keeps its size in meters. Focal lengths are recovered from how the box's
+        near face projects onto its image vertices.
 
         Parameters
         ----------
-        obj1: Obstacle
-            The obstacle of reference
-        obj2: Obstacle
-            The obstacle in question
+        box: BoundingBox
+            box with vertices_3d, near then far face.
+        shift: np.ndarray
+            (x, y) shift of the box's image center, in pixels.
+        depth: float
+            new depth of the near face, in meters, NaN to keep it.
 
         Returns
         -------
-        bool
-            The result of whether or not obj1 and obj2 are the same object
-        """
-        is_same = True  # presume they're the same obstacle
-
-        # horizontal check
-        if obj1.center[0] >= (
-            obj2.center[0] + MVMT_TOLERANCE
-        ) or obj1.center[  # outside of upper bound
-            0
-        ] <= (
-            obj2.center[0] - MVMT_TOLERANCE
-        ):  # less than lower bound
-            is_same = False
-
-        # vertical check
-        if obj1.center[1] >= (
-            obj2.center[1] + MVMT_TOLERANCE
-        ) or obj1.center[  # outside of upper bound
-            1
-        ] <= (
-            obj2.center[1] - MVMT_TOLERANCE
-        ):  # less than lower bound
-            is_same = False
-
-        return is_same
+        tuple - (8, 3) moved vertices_3d, and the distance to their near face center.
+        """
+        vertices = np.asarray(box.vertices, dtype=np.float64)
+        vertices_3d = np.asarray(box.vertices_3d, dtype=np.float64)
+
+        near_z = vertices_3d[0, 2]
+        new_z = near_z if np.isnan(depth) else depth
+
+        # pixels per unit of x / z and of y / z, across the diagonal of the near face
+        rays = vertices_3d[:4, :2] / near_z
+        with np.errstate(divide="ignore", invalid="ignore"):
+            focal_lengths = (vertices[2] - vertices[0]) / (rays[2] - rays[0])
+
+        center_ray = rays.mean(axis=0)
+        if np.all(np.isfinite(focal_lengths)):
+            center_ray = center_ray + shift / focal_lengths
+
+        near_center = np.append(vertices_3d[:4, :2].mean(axis=0), near_z)
+        center = np.append(center_ray * new_z, new_z)
+        moved = vertices_3d + (center - near_center)
+
+        return moved, float(np.linalg.norm(np.append(center_ray, 1)) * new_z)
 
     def update(self, new_obstacle_boxes: list) -> None:
         """
@@ -85,41 +226,124 @@ class ObstacleTracker:
         Parameters
         ----------
         new_obstacle_boxes: list
-            The new list of obstacles to update the buffer with
+            The new list of obstacles to update the buffer with, boxes with
+            vertices_3d also update the depth of their track
 
         Returns
         -------
         None
         """
-        new_obstacles = np.array([])
+        num_boxes = len(new_obstacle_boxes)
+
+        centers = np.zeros((0, 2))
+        if num_boxes:
+            vertices = np.array(
+                [box.vertices for box in new_obstacle_boxes], dtype=np.float64
+            )
+            centers = vertices.reshape(num_boxes, -1, 2).mean(axis=1)
+
+        self._predict()
+
+        predicted = self.centers
+
+        # (new, old) distance between every center and predicted center, in gates
+        dx = np.subtract.outer(centers[:, 0], predicted[:, 0])
+        dy = np.subtract.outer(centers[:, 1], predicted[:, 1])
+
+        predicted_std = np.sqrt(
+            self.covariances[:, :2, 0].max(axis=1, initial=0)
+            + self.MEASUREMENT_STD[0] ** 2
+        )
+        gates = np.maximum(self.MVMT_TOLERANCE, self.GATE_SIGMAS * predicted_std)
+
+        distances = np.sqrt(dx * dx + dy * dy) / gates
 
-        # transform the list of bounding boxes into an array of Obstacles
-        for i in np.arange(len(new_obstacle_boxes)):
-            new_obstacles = np.append(new_obstacles, Obstacle(new_obstacle_boxes[i]))
+        new_indices, old_indices = gated_assignment(distances, 1)
 
-        # no previous obstacles
-        if self.obstacles.size:
-            self.obstacles = new_obstacles
-            return
+        # update matched tracks
+        measurements = np.empty((num_boxes, 3))
+        measurements[:, :2] = centers
+        measurements[:, 2] = [self._box_depth(box) for box in new_obstacle_boxes]
 
-        # compare new obstacles with previous buffer to find repeat obstacles
-        for i in np.arange(new_obstacles.size):
-            for j in np.arange(self.obstacles.size):
-                if self._is_same_obstacle(
-                    new_obstacles[i], self.obstacles[j]
-                ):  # if new obj is within MVMT_TOLERANCE of old obj
-                    new_obstacles[i].frame_persisted = (
-                        self.obstacles[j].frames_persisted + 1
-                    )
-                    break  # Found obstacle in old buffer, so don't need to check more obstacles
+        measured = np.ones((num_boxes, 3), dtype=bool)
+        measured[:, 2] = ~np.isnan(measurements[:, 2])
+
+        self._correct(old_indices, measurements[new_indices], measured[new_indices])
+
+        # tracks measured for the first time start at their measurement
+        first_depth = measured[new_indices, 2] & ~self.has_depth[old_indices]
+        first_tracks = old_indices[first_depth]
+        self.states[first_tracks, 2, 0] = measurements[new_indices[first_depth], 2]
+        self.states[first_tracks, 2, 1] = 0
+        self.covariances[first_tracks, 2] = (
+            self.MEASUREMENT_STD[2] ** 2,
+            0,
+            self.INITIAL_VELOCITY_STD[2] ** 2,
+        )
+        self.has_depth[old_indices] |= measured[new_indices, 2]
+
+        matches = dict(zip(new_indices.tolist(), old_indices.tolist()))  # new: old
+
+        new_obstacles = []
+        tracks = []  # track of each new obstacle, -1 for new tracks
+        for i, box in enumerate(new_obstacle_boxes):
+            obstacle = Obstacle(box, centers[i])
+
+            if i in matches:
+                old_obstacle = self.obstacles[matches[i]]
+                obstacle.track_id = old_obstacle.track_id
+                obstacle.frames_persisted = old_obstacle.frames_persisted + 1
+                tracks.append(matches[i])
+            else:
+                obstacle.track_id = self.next_track_id
+                self.next_track_id += 1
+                tracks.append(-1)
+
+            new_obstacles.append(obstacle)
+
+        # keep predicting lost tracks for a few frames
+        unmatched = np.ones(len(self.obstacles), dtype=bool)
+        unmatched[old_indices] = False
+
+        for j in np.nonzero(unmatched)[0]:
+            obstacle = self.obstacles[j]
+            obstacle.misses += 1
+
+            if obstacle.misses <= self.MAX_MISSES:
+                new_obstacles.append(obstacle)
+                tracks.append(j)
+
+        tracks = np.array(tracks, dtype=np.intp)
+        born = tracks == -1
+
+        # new tracks start at their measurement, not moving
+        states = np.zeros((len(new_obstacles), 3, 2))
+        covariances = np.zeros((len(new_obstacles), 3, 3))
+        has_depth = np.zeros(len(new_obstacles), dtype=bool)
+
+        states[~born] = self.states[tracks[~born]]
+        covariances[~born] = self.covariances[tracks[~born]]
+        has_depth[~born] = self.has_depth[tracks[~born]]
+
+        states[born, :, 0] = np.nan_to_num(measurements[born[:num_boxes]])
+        covariances[born, :, 0] = self.MEASUREMENT_STD ** 2
+        covariances[born, :, 2] = self.INITIAL_VELOCITY_STD ** 2
+        has_depth[born] = measured[born[:num_boxes], 2]
 
         # update buffer
         self.obstacles = new_obstacles
+        self.states = states
+        self.covariances = covariances
+        self.has_depth = has_depth
 
     def get_persistent_obstacles(self) -> list:
         """
         returns a list of bounding boxes that have been persistent for PERSISTENCE_THRESHOLD amount of frames
 
+        Obstacles lost for at most MAX_MISSES frames are given at their predicted
+        position, with from_tracking set on the box. Their vertices_3d and distance,
+        if any, are moved to the predicted position and depth.
+
         Returns
         -------
         list[BoundingBox]
@@ -128,8 +352,30 @@ class ObstacleTracker:
         persistent_obstacles = []
 
         # append only obstacles persistent for PERSISTENCE_THRESHOLD frames
-        for i in np.arange(self.obstacles.size):
-            if self.obstacles[i].frames_persisted == self.PERSISTENCE_THRESHOLD:
-                persistent_obstacles.append(self.obstacles[i].bounding_box)
+        for i, obstacle in enumerate(self.obstacles):
+            if obstacle.frames_persisted < self.PERSISTENCE_THRESHOLD:
+                continue
+
+            if not obstacle.misses:
+                persistent_obstacles.append(obstacle.bounding_box)
+                continue
+
+            # last box, moved to the predicted center
+            shift = self.states[i, :2, 0] - obstacle.center
+            vertices = np.asarray(obstacle.bounding_box.vertices, dtype=np.float64)
+            box = BoundingBox(
+                [tuple(vertex + shift) for vertex in vertices],
+                obstacle.bounding_box.object_type,
+            )
+            box.from_tracking = True
+
+            if getattr(obstacle.bounding_box, "vertices_3d", None) is not None:
+                depth = self.states[i, 2, 0] if self.has_depth[i] else np.nan
+                vertices_3d, box.distance = self._move_vertices_3d(
+                    obstacle.bounding_box, shift, depth
+                )
+                box.vertices_3d = [tuple(vertex) for vertex in vertices_3d.tolist()]
+
+            persistent_obstacles.append(box)
 
         return persistent_obstacles
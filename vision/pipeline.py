@@ -5,6 +5,7 @@ Takes information from the camera and gives it to vision
 import os
 import sys
 import numpy as np
+import cv2
 import asyncio
 import warnings
 
@@ -13,18 +14,24 @@ gparent_dir = os.path.dirname(parent_dir)
 ggparent_dir = os.path.dirname(gparent_dir)
 sys.path += [parent_dir, gparent_dir, ggparent_dir]
 
-from vision.bounding_box import BoundingBox, ObjectType
+from vision.bounding_box import BoundingBox, BoundingBoxBatch, ObjectType
 from vision.camera import realsense
 
 import datetime
 import json
+import multiprocessing
+from concurrent.futures import Future
 from multiprocessing import Queue
 from queue import Empty
 
 from vision.obstacle.obstacle_finder import ObstacleFinder
 from vision.obstacle.obstacle_tracker import ObstacleTracker
 from vision.common.import_params import import_params
+from vision.common.stage_timer import StageTimer
+from vision.common.frame_cache import FrameCache
 from vision.camera.template import Camera
+from vision.camera.frame_grabber import FrameGrabber
+from vision.camera.shared_frames import SharedFrameBuffer
 
 from vision.text.detect_words import TextDetector
 
@@ -33,12 +40,14 @@ from vision.module.module_depth import get_module_depth
 from vision.module.region_of_interest import get_region_of_interest
 from vision.module.module_orientation import get_module_orientation
 from vision.module.module_orientation import get_module_roll
+from vision.module.module_orientation import fit_module_plane
 from vision.module.module_bounding import get_module_bounds
 
 from vision.failure_flags import FailureFlags
 from vision.failure_flags import ObstacleDetectionFlags
 from vision.failure_flags import TextDetectionFlags
 from vision.failure_flags import ModuleDetectionFlags
+from vision.failure_flags import FailureCounts
 
 
 async def arange(count: int) -> int:
@@ -54,6 +63,104 @@ async def arange(count: int) -> int:
         yield (i)
 
 
+_worker_frames = None  # SharedFrameBuffer the current worker process reads frames from
+_worker_text_detector = None  # TextDetector of the current worker process
+_worker_module_location = (
+    None  # ModuleLocation of the current worker, keeps its buffers
+)
+
+
+def _init_worker(frames: SharedFrameBuffer) -> None:
+    """
+    Pool worker initializer, frames are shared when the worker starts, not per task.
+
+    Parameters
+    -------------
+    frames: SharedFrameBuffer
+        Ring buffer the pipeline writes each pooled frame into.
+    """
+    global _worker_frames
+
+    _worker_frames = frames
+
+
+def _read_worker_frame(sequence: int) -> tuple:
+    """
+    Views of a frame in the shared ring buffer.
+
+    Parameters
+    -------------
+    sequence: integer
+        Sequence number of the frame.
+
+    Raises
+    -------------
+    ValueError: If the frame was overwritten before it was read.
+
+    Returns
+    -------------
+    tuple - (depth image, color image).
+    """
+    frame = _worker_frames.read(sequence)
+
+    if frame is None:
+        raise ValueError(f"Frame {sequence} was overwritten before it was read")
+
+    return frame[2], frame[3]
+
+
+def _detect_text_worker(sequence: int) -> list:
+    """
+    Text detection for a pool worker, each worker keeps its own TextDetector.
+
+    Parameters
+    -------------
+    sequence: integer
+        Sequence number of the frame in the shared ring buffer.
+
+    Returns
+    -------------
+    list - BoundingBoxes of the text found.
+    """
+    global _worker_text_detector
+
+    if _worker_text_detector is None:
+        _worker_text_detector = TextDetector()
+
+    depth_image, color_image = _read_worker_frame(sequence)
+
+    return _worker_text_detector.detect_russian_word(color_image, depth_image)
+
+
+def _find_circles_worker(sequence: int, window: tuple = None) -> np.ndarray:
+    """
+    Unfiltered circle detection for a pool worker.
+
+    Parameters
+    -------------
+    sequence: integer
+        Sequence number of the frame in the shared ring buffer.
+    window: tuple
+        (x0, y0, x1, y1) part of the image to search, None for all of it.
+
+    Returns
+    -------------
+    ndarray - (x, y, r) circles, to be given to ModuleLocation.set_circles.
+    """
+    global _worker_module_location
+
+    if _worker_module_location is None:
+        _worker_module_location = ModuleLocation()
+
+    depth_image, color_image = _read_worker_frame(sequence)
+
+    module_location = _worker_module_location
+    module_location.set_img(color_image, depth_image)
+    module_location.window = window
+
+    return module_location._find_circles()
+
+
 class Pipeline:
     """
     Pipeline to carry information from the cameras through
@@ -67,18 +174,80 @@ class Pipeline:
         Interface to recieve flight state information from flight.
     camera: Camera
         Camera to pull image from.
+    threaded_capture: bool
+        Whether to acquire frames on a background thread, processing only the newest frame.
+    workers: integer
+        Worker processes used to run text and circle detection at the same time
+        during module detection, 0 runs every stage on this process.
+    stage_timeouts: dict
+        Seconds to wait on each pooled stage, keyed by its ModuleDetectionFlags field.
+        A stage that times out has its flag set to False.
+    module_tracking: bool
+        Whether to search for the module only around where it was last found.
+    ocr_workers: integer
+        Long-lived OCR worker processes for text detection, 0 runs a new tesseract per image.
+    ocr_cache: bool
+        Whether to reuse OCR results of near identical text crops, e.g. while hovering at the mast.
+    plane_orientation: bool
+        Whether to find the module orientation from a plane fit to its depth, giving the
+        module box an orientation_residual.
+    flags_queue: bool
+        Whether to put each frame's packed flags and stage timings on vision_flags, off
+        by default. Failure rates and stage latencies are always kept, without a queue.
+    batch_output: bool
+        Whether to send flight a BoundingBoxBatch, one buffer to pickle, instead of a list
+        of BoundingBox. Attributes other than vertices, type, depth, orientation,
+        from_tracking, vertices_3d and distance are not carried.
     """
 
     PUT_TIMEOUT = 1  # Expected time for results to be irrelevant.
 
-    def __init__(self, vision_communication, flight_communication, camera):
+    # Default seconds to wait on pooled stages, None waits indefinitely
+    STAGE_TIMEOUTS = {"detect_russian_word": 1.0, "is_in_frame": 1.0}
+
+    def __init__(
+        self,
+        vision_communication,
+        flight_communication,
+        camera,
+        threaded_capture=False,
+        workers=0,
+        stage_timeouts=None,
+        module_tracking=False,
+        ocr_workers=0,
+        ocr_cache=False,
+        plane_orientation=False,
+        batch_output=False,
+        flags_queue=False,
+    ):
         warnings.filterwarnings("ignore")
         ##
         self.vision_communication = vision_communication
         self.flight_communication = flight_communication
 
+        self.camera_device = camera  # for its intrinsics, once streaming
         self.camera = camera.__iter__()
 
+        self.frame_grabber = None
+        if threaded_capture:
+            self.frame_grabber = FrameGrabber(self.camera).start()
+
+        # pool and the shared frames it reads, started on the first pooled frame
+        self.workers = workers
+        self.pool = None
+        self.shared_frames = None
+        self.pool_stalled = (
+            False  # a pooled stage timed out, its worker may still be busy
+        )
+
+        self.stage_timeouts = dict(self.STAGE_TIMEOUTS)
+        if stage_timeouts is not None:
+            self.stage_timeouts.update(stage_timeouts)
+
+        self.plane_orientation = plane_orientation
+        self.batch_output = batch_output
+        self.flags_queue = flags_queue
+
         ##
         if os.path.isdir("vision"):
             prefix = "vision"
@@ -93,20 +262,176 @@ class Pipeline:
         with open(config_filename, "r") as config_file:
             config = json.load(config_file)
 
-        self.obstacle_finder = ObstacleFinder(params=import_params(config))
+        self.obstacle_finder = ObstacleFinder(
+            params=import_params(config),
+            depth_segmentation=config.get("depthSegmentation"),
+        )
 
         self.obstacle_tracker = ObstacleTracker()
 
-        self.text_detector = TextDetector()
+        self.text_detector = TextDetector(ocr_workers=ocr_workers, ocr_cache=ocr_cache)
 
-        self.module_location = ModuleLocation()
+        self.module_location = ModuleLocation(tracking=module_tracking)
 
         self.vision_flags = Queue()
 
+        # flags of each state, reset and reused every frame
+        self.no_flags = FailureFlags()
+        self.obstacle_flags = ObstacleDetectionFlags()
+        self.text_flags = TextDetectionFlags()
+        self.module_flags = ModuleDetectionFlags()
+
+        self.failure_counts = FailureCounts()
+
+        # timings of each frame only leave the pipeline on vision_flags with flags_queue
+        self.stage_timer = StageTimer()
+
     @property
     def picture(self):
+        if self.frame_grabber is not None:
+            return self.frame_grabber.get()
+
         return next(self.camera)
 
+    @property
+    def frame_counters(self) -> dict:
+        """
+        Captured, dropped and processed frame counts of the threaded capture stage.
+        Empty if threaded_capture is disabled.
+        """
+        if self.frame_grabber is None:
+            return {}
+
+        return self.frame_grabber.counters
+
+    @property
+    def stage_latencies(self) -> dict:
+        """
+        Rolling p50/p95/p99 latency of each pipeline stage, in seconds.
+        Kept whether or not flags_queue is set.
+        """
+        return self.stage_timer.percentiles()
+
+    @property
+    def failure_rates(self) -> dict:
+        """
+        Fraction of frames each algorithm failed on, keyed by flags class name then field.
+        """
+        return self.failure_counts.rates()
+
+    def close(self) -> None:
+        """
+        Stop background frame acquisition and worker processes, if running.
+        """
+        if self.frame_grabber is not None:
+            self.frame_grabber.stop()
+
+        self.text_detector.close()
+
+        self._stop_pool()
+
+    def _start_pool(self, depth_image: np.ndarray, color_image: np.ndarray):
+        """
+        Start the worker pool if it is not running, sharing frames the size of the images.
+
+        Parameters
+        -------------
+        depth_image: ndarray
+            Depth image of the frame to be pooled.
+        color_image: ndarray
+            Color image of the frame to be pooled.
+
+        Returns
+        -------------
+        multiprocessing Pool - the running pool.
+        """
+        height, width = color_image.shape[:2]
+
+        frames = self.shared_frames
+        if frames is None or (frames.height, frames.width) != (height, width):
+            self._stop_pool()
+            self.shared_frames = SharedFrameBuffer(width, height)
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(
+                processes=self.workers,
+                initializer=_init_worker,
+                initargs=(self.shared_frames,),
+            )
+
+        return self.pool
+
+    def _stop_pool(self) -> None:
+        """
+        Stop the worker pool without waiting, killing workers still running stages.
+        """
+        pool, self.pool = self.pool, None
+        self.pool_stalled = False
+
+        if pool is None:
+            return
+
+        # a running task can not be cancelled, only its process can be stopped
+        pool.terminate()
+
+    @staticmethod
+    def _submit(pool, function, *args) -> Future:
+        """
+        Run a stage on the pool.
+
+        Parameters
+        -------------
+        pool: multiprocessing Pool
+            Pool to run the stage on.
+        function: callable
+            Stage, a module level function.
+        *args
+            Arguments to the stage.
+
+        Returns
+        -------------
+        Future - result of the stage, running so a timed out wait can not cancel it.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        pool.apply_async(
+            function,
+            args,
+            callback=future.set_result,
+            error_callback=future.set_exception,
+        )
+
+        return future
+
+    async def _join(self, future: Future, stage: str):
+        """
+        Wait on the result of a pooled stage.
+
+        Parameters
+        -------------
+        future: Future
+            Future returned by _submit.
+        stage: string
+            ModuleDetectionFlags field of the stage, used to look up its timeout.
+
+        Raises
+        -------------
+        asyncio.TimeoutError: If the stage takes longer than its timeout.
+
+        Returns
+        -------------
+        Result of the stage.
+        """
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), self.stage_timeouts.get(stage)
+            )
+        except asyncio.TimeoutError:
+            # the task keeps its worker busy, the pool is replaced after this frame
+            self.pool_stalled = True
+            raise
+
     async def run(self, prev_state):
         """
         Process current camera frame.
@@ -122,57 +447,104 @@ class Pipeline:
 
         bboxes = []
 
-        flags = FailureFlags()
+        # gray, blurred, etc. images of this frame, each computed once and shared by the algorithms
+        frame = FrameCache(color_image, depth_image)
+
+        flags = self.no_flags
+
+        timer = self.stage_timer
+        timer.reset()
 
         if state == "early_laps":  # navigation around the pylons
-            flags = ObstacleDetectionFlags()
+            flags = self.obstacle_flags
+            flags.reset()
 
             try:
-                bboxes = self.obstacle_finder.find(color_image, depth_image)
+                with timer.time("obstacle_finder"):
+                    self.obstacle_finder.intrinsics = getattr(
+                        self.camera_device, "intrinsics", None
+                    )
+                    bboxes = self.obstacle_finder.find(color_image, depth_image)
             except:
                 flags.obstacle_finder = False
 
             if flags.obstacle_finder:
                 try:
-                    self.obstacle_tracker.update(bboxes)
-                    bboxes = self.obstacle_tracker.get_persistent_obstacles()
+                    with timer.time("obstacle_tracker"):
+                        self.obstacle_tracker.update(bboxes)
+                        bboxes = self.obstacle_tracker.get_persistent_obstacles()
                 except:
                     flags.obstacle_tracker = False
 
         elif state == "text_detection":  # approaching mast
-            flags = TextDetectionFlags()
+            flags = self.text_flags
+            flags.reset()
 
             try:
-                bboxes = self.text_detector.detect_russian_word(
-                    color_image, depth_image
-                )
+                with timer.time("detect_russian_word"):
+                    bboxes = self.text_detector.detect_russian_word(
+                        color_image, depth_image, frame
+                    )
             except:
                 flags.detect_russian_word = False
 
         elif state == "module_detection":  # locating module
-            flags = ModuleDetectionFlags()
+            flags = self.module_flags
+            flags.reset()
+
+            # text and circle detection are independent, start both on the pool
+            # workers read the frame from shared memory, only its sequence number is sent
+            if self.workers > 0:
+                pool = self._start_pool(depth_image, color_image)
+                sequence = self.shared_frames.write(depth_image, color_image)
+
+                text_future = self._submit(pool, _detect_text_worker, sequence)
+
             try:
-                self.module_location.set_img(color_image, depth_image)
+                with timer.time("set_img"):
+                    self.module_location.set_img(color_image, depth_image, frame)
             except:
                 flags.set_img = False
 
+            # circle detection needs the tracking window from set_img
+            if self.workers > 0 and flags.set_img:
+                circle_future = self._submit(
+                    pool, _find_circles_worker, sequence, self.module_location.window
+                )
+
+            # NOTE: with workers, pooled stages are timed from when they are waited on
             if flags.set_img:
                 try:
-                    bboxes.extend(
-                        self.text_detector.detect_russian_word(color_image, depth_image)
-                    )
+                    with timer.time("detect_russian_word"):
+                        if self.workers > 0:
+                            bboxes.extend(
+                                await self._join(text_future, "detect_russian_word")
+                            )
+                        else:
+                            bboxes.extend(
+                                self.text_detector.detect_russian_word(
+                                    color_image, depth_image, frame
+                                )
+                            )
                 except:
                     flags.detect_russian_word = False
 
             if flags.detect_russian_word:
                 try:
-                    self.module_location.set_text(bboxes)
+                    with timer.time("set_text"):
+                        self.module_location.set_text(bboxes)
                 except:
                     flags.set_text = False
 
             if flags.set_img:
                 try:
-                    in_frame = self.module_location.is_in_frame()
+                    with timer.time("is_in_frame"):
+                        if self.workers > 0:
+                            self.module_location.set_circles(
+                                await self._join(circle_future, "is_in_frame")
+                            )
+
+                        in_frame = self.module_location.is_in_frame()
                 except:
                     in_frame = False
                     flags.is_in_frame = False
@@ -185,71 +557,103 @@ class Pipeline:
                     depth = 0
                     region = np.empty(1)
                     orientation = (0, 0)
+                    residual = None
                     bounds = np.empty(1)
 
                     try:
-                        center = (
-                            self.module_location.get_center()
-                        )  # center of module in image]
+                        with timer.time("get_center"):
+                            center = (
+                                self.module_location.get_center()
+                            )  # center of module in image]
                     except:
                         flags.get_center = False
                     if flags.get_center:
                         try:
-                            depth = get_module_depth(
-                                depth_image, center
-                            )  # depth of center of module
+                            with timer.time("get_module_depth"):
+                                depth = get_module_depth(
+                                    depth_image, center
+                                )  # depth of center of module
                         except:
                             flags.get_module_depth = False
 
                         if flags.get_module_depth:
                             try:
-                                region = get_region_of_interest(
-                                    depth_image, depth, center
-                                )  # depth image sliced on underestimate bounds
+                                with timer.time("get_region_of_interest"):
+                                    region = get_region_of_interest(
+                                        depth_image, depth, center
+                                    )  # depth image sliced on underestimate bounds
                             except:
                                 flags.get_region_of_interest = False
 
                             if flags.get_region_of_interest:
                                 try:
-                                    orientation = get_module_orientation(
-                                        region
-                                    )  # x and y tilt of module
+                                    with timer.time("get_module_orientation"):
+                                        if self.plane_orientation:
+                                            x_tilt, y_tilt, residual = fit_module_plane(
+                                                region
+                                            )
+                                            orientation = (x_tilt, y_tilt)
+                                        else:
+                                            orientation = get_module_orientation(
+                                                region
+                                            )  # x and y tilt of module
                                 except:
                                     flags.get_module_orientation = False
 
                             try:
-                                bounds = get_module_bounds(
-                                    np.shape(color_image)[:2], center, depth
-                                )  # overestimate of bounds
+                                with timer.time("get_module_bounds"):
+                                    bounds = get_module_bounds(
+                                        np.shape(color_image)[:2], center, depth
+                                    )  # overestimate of bounds
                             except:
                                 flags.get_module_bounds = False
 
                             if flags.get_module_bounds:
                                 try:
-                                    roll = get_module_roll(
-                                        color_image[
-                                            bounds[0][1] : bounds[3][1],
-                                            bounds[0][0] : bounds[2][0],
-                                            :,
-                                        ]
-                                    )  # roll of module
+                                    with timer.time("get_module_roll"):
+                                        roll = get_module_roll(
+                                            frame.gray()[
+                                                bounds[0][1] : bounds[3][1],
+                                                bounds[0][0] : bounds[2][0],
+                                            ]
+                                        )  # roll of module
                                 except:
                                     flags.get_module_roll = False
                                 # construct boundingbox for the module
                                 box = BoundingBox(bounds, ObjectType.MODULE)
                                 box.module_depth = depth  # float
                                 box.orientation = orientation + (roll,)  # x, y, z tilt
+                                if self.plane_orientation:
+                                    # RMS distance of the depth to the fitted plane, in mm
+                                    box.orientation_residual = residual
+                                box.from_tracking = (
+                                    self.module_location.from_tracking
+                                )  # found near the last module, not in the full image
                                 bboxes.append(box)
 
+            # timed out stages can not be cancelled, replace the pool they are blocking
+            if self.pool_stalled:
+                self._stop_pool()
+
         else:
             pass  # raise AttributeError(f"Unrecognized state: {state}")
 
         time = datetime.datetime.now()
 
-        # You need to index vision_flags to see output, "self.vision_flags.get()[1]"
-        self.vision_flags.put((time, flags), self.PUT_TIMEOUT)
+        self.failure_counts.record(flags)
+
+        if self.flags_queue:
+            # You need to index vision_flags to see output, "self.vision_flags.get()[1]"
+            # flags are sent packed as (flags class, bits), read with "cls.decode(bits)"
+            # stage timings of this frame, in seconds, are at "self.vision_flags.get()[2]"
+            self.vision_flags.put(
+                (time, (type(flags), flags.bits), dict(timer.timings)),
+                self.PUT_TIMEOUT,
+            )
         ##
         await asyncio.sleep(0.001)
+        if self.batch_output:
+            bboxes = BoundingBoxBatch.from_boxes(bboxes)
         self.vision_communication.put((time, bboxes), self.PUT_TIMEOUT)
         # uncomment to visualize blobs
         # from vision.common.blob_plotter import plot_blobs
@@ -264,6 +668,11 @@ async def init_vision(
     camera: Camera,
     state: str,
     runtime: int = 100,
+    threaded_capture: bool = False,
+    workers: int = 0,
+    stage_timeouts: dict = None,
+    module_tracking: bool = False,
+    flags_comm: Queue = None,
 ) -> None:
     """
     Calls Pipeline().run to process a specific frame.
@@ -280,13 +689,38 @@ async def init_vision(
         Algorithm to run.
     runtime: integer
         Amount of frames to be processed.
+    threaded_capture: bool
+        Whether to acquire frames on a background thread, processing only the newest frame.
+    workers: integer
+        Worker processes for module detection, 0 runs every stage on this process.
+    stage_timeouts: dict
+        Seconds to wait on each pooled stage, keyed by its ModuleDetectionFlags field.
+    module_tracking: bool
+        Whether to search for the module only around where it was last found.
+    flags_comm: multiprocessing Queue
+        Interface to recieve each frame's packed flags and stage timings, see
+        Pipeline.run. None, the default, does not queue them.
     """
 
-    pipeline = Pipeline(vision_comm, flight_comm, camera)
+    pipeline = Pipeline(
+        vision_comm,
+        flight_comm,
+        camera,
+        threaded_capture,
+        workers,
+        stage_timeouts,
+        module_tracking,
+        flags_queue=flags_comm is not None,
+    )
+    if flags_comm is not None:
+        pipeline.vision_flags = flags_comm
 
     loop = asyncio.get_event_loop()
-    async for _ in arange(runtime):
-        await loop.create_task(pipeline.run(state))
+    try:
+        async for _ in arange(runtime):
+            await loop.create_task(pipeline.run(state))
+    finally:
+        pipeline.close()
 
 
 if __name__ == "__main__":
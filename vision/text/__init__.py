@@ -11,6 +11,8 @@ sys.path.append(os.path.dirname(__file__))
 
 try:
     from detect_words import TextDetector
+    from ocr_pool import OCRPool
+    from ocr_cache import OCRCache
 
 except ImportError as e:
     print(f"text/__init__.py failed: {e}")
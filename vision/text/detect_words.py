@@ -12,20 +12,74 @@ gparent_dir = os.path.dirname(parent_dir)
 ggparent_dir = os.path.dirname(gparent_dir)
 sys.path += [parent_dir, gparent_dir, ggparent_dir]
 
-from bounding_box import BoundingBox, ObjectType
+from bounding_box import BoundingBox, BoundingBoxBatch, ObjectType
+
+try:
+    from vision.common.buffers import BufferPool
+except ImportError:
+    from common.buffers import BufferPool
+
+try:
+    from vision.text.ocr_cache import OCRCache
+    from vision.text.ocr_pool import OCRPool
+except ImportError:
+    from ocr_cache import OCRCache
+    from ocr_pool import OCRPool
 
 
 class TextDetector:
     """
     Finds the bounding boxes of the specified text in the frame.
+
+    Parameters
+    ----------
+    roi_cache: bool
+        Whether to first search for the blue rectangle near where it was last found.
+        Off by default, the rectangle can be missed when it moves out of the region.
+    rescan_interval: int
+        Frames in a row searched near the last rectangle before searching the full frame again.
+    ocr_workers: int
+        Number of long-lived OCR worker processes, 0 runs a new tesseract process per image.
+    ocr_cache: bool
+        Whether to reuse the OCR result of a near identical text crop.
     """
 
-    def __init__(self):
+    MASK_BLUR_SIZE = 5  # size of the blur kernel applied before finding blue pixels
+
+    def __init__(
+        self,
+        roi_cache: bool = False,
+        rescan_interval: int = 10,
+        ocr_workers: int = 0,
+        ocr_cache: bool = False,
+    ):
         self.text = np.array(["модули", "иртибот"])
         self.tessdata: dict = {}
 
+        self.roi_cache = roi_cache
+        self.rescan_interval = rescan_interval
+
+        self.placard_rect = (
+            None  # (x, y, w, h) bounding rect of the last blue rectangle found
+        )
+        self.roi_frames = (
+            0  # frames searched near placard_rect since the last full frame search
+        )
+
+        self.ocr_pool = None
+        if ocr_workers > 0:
+            self.ocr_pool = OCRPool(workers=ocr_workers, lang="uzb_cyrl")
+
+        self.ocr_cache = OCRCache() if ocr_cache else None
+
+        self.buffers = BufferPool()  # scratch images reused between frames
+
     def detect_russian_word(
-        self, color_image: np.ndarray, depth_image: np.ndarray
+        self,
+        color_image: np.ndarray,
+        depth_image: np.ndarray,
+        frame=None,
+        batch: bool = False,
     ) -> list:
         """
         Detect words in given image.
@@ -36,6 +90,10 @@ class TextDetector:
             3-channel color image to perform text detection on
         depth_image: np.ndarray
             1-channel depth image from the realsense camera
+        frame: FrameCache
+            Images already derived from color_image and depth_image, shared with other algorithms.
+        batch: bool
+            Whether to return a BoundingBoxBatch instead of a list.
 
         Returns
         -------
@@ -49,59 +107,191 @@ class TextDetector:
             x_ul,
             y_ul,
             rotated_angle,
-        ) = self._get_rotated_min_area_rect(color_image, depth_image)
+        ) = self._get_rotated_min_area_rect(color_image, depth_image, frame)
 
         if len(sliced_rotated_image) == 0:
-            return []
+            return BoundingBoxBatch() if batch else []
+
+        # crop-relative word data is reused as is, _get_text_boxes places it on this frame
+        cache_key, cached_data = None, None
+        if self.ocr_cache is not None:
+            cache_key = self.ocr_cache.key(sliced_rotated_image)
+            cached_data = self.ocr_cache.get(cache_key)
+
+        if cached_data is not None:
+            self.tessdata = cached_data
+        elif self.ocr_pool is not None:
+            self.tessdata = self.ocr_pool.image_to_data(sliced_rotated_image)
+        else:
+            self.tessdata = pytesseract.image_to_data(
+                sliced_rotated_image,
+                output_type=pytesseract.Output.DICT,
+                lang="uzb_cyrl",
+            )
+
+        if cache_key is not None and cached_data is None:
+            self.ocr_cache.put(cache_key, self.tessdata)
 
-        self.tessdata = pytesseract.image_to_data(
-            sliced_rotated_image, output_type=pytesseract.Output.DICT, lang="uzb_cyrl"
+        return self._get_text_boxes(
+            self.tessdata, x_ul, y_ul, rotated_angle, batch=batch
         )
 
-        detected_words = self.tessdata["text"]
-        box_obs = []
+    def detect_russian_words(self, frames: list) -> list:
+        """
+        Detect words in several images, with their OCR run at once on the OCR workers.
 
-        rows, columns, _ = color_image.shape
+        Parameters
+        ------
+        frames: list[tuple[np.ndarray, np.ndarray]]
+            (color image, depth image) pairs to perform text detection on
+
+        Returns
+        -------
+        list[list[BoundingBox]] - text bounding boxes of each frame, in order
+        """
+        if self.ocr_pool is None:
+            return [
+                self.detect_russian_word(color_image, depth_image)
+                for color_image, depth_image in frames
+            ]
+
+        # find the text of every frame first, then OCR all of them at once
+        crops = [
+            self._get_rotated_min_area_rect(color_image, depth_image)
+            for color_image, depth_image in frames
+        ]
+
+        # (cache key, cached word data, pending OCR result) of each crop
+        results = []
+        for sliced_rotated_image, _, _, _ in crops:
+            if len(sliced_rotated_image) == 0:
+                results.append((None, None, None))
+                continue
+
+            cache_key, cached_data = None, None
+            if self.ocr_cache is not None:
+                cache_key = self.ocr_cache.key(sliced_rotated_image)
+                cached_data = self.ocr_cache.get(cache_key)
+
+            pending = None
+            if cached_data is None:
+                pending = self.ocr_pool.submit(sliced_rotated_image)
+
+            results.append((cache_key, cached_data, pending))
+
+        frame_boxes = []
+        for (_, x_ul, y_ul, rotated_angle), (cache_key, cached_data, pending) in zip(
+            crops, results
+        ):
+            if cached_data is None and pending is None:
+                frame_boxes.append([])
+                continue
+
+            if cached_data is not None:
+                self.tessdata = cached_data
+            else:
+                self.tessdata = pending.get()
+
+                if cache_key is not None:
+                    self.ocr_cache.put(cache_key, self.tessdata)
+
+            frame_boxes.append(
+                self._get_text_boxes(self.tessdata, x_ul, y_ul, rotated_angle)
+            )
+
+        return frame_boxes
+
+    def _get_text_boxes(
+        self,
+        tessdata: dict,
+        x_ul: int,
+        y_ul: int,
+        rotated_angle: float,
+        batch: bool = False,
+    ) -> list:
+        """
+        Makes BoundingBoxes of the desired words found by OCR.
+
+        Parameters
+        ------
+        tessdata: dict
+            Word data from OCR of the rotated text crop
+        x_ul: int
+            x-coordinate of upper-left corner of the crop relative to color_image
+        y_ul: int
+            y-coordinate of upper-left corner of the crop relative to color_image
+        rotated_angle: float
+            angle that the crop is rotated relative to color_image
+        batch: bool
+            Whether to return a BoundingBoxBatch instead of a list
+
+        Returns
+        -------
+        list[BoundingBox] - A list of rotated bounding box objects that contain desired text
+        """
+        detected_words = tessdata["text"]
+
+        # if any of the words are in the detected words, add BoundingBox to final set
+        # This is done to allow cases where extra characters around the words are detected
+        matches = [
+            i
+            for i, det_word in enumerate(detected_words)
+            if det_word  # ignore empty strings
+            and np.any([(rus_word in det_word.lower()) for rus_word in self.text])
+        ]
+
+        if not matches:
+            return BoundingBoxBatch() if batch else []
+
+        x = np.array(tessdata["left"])[matches] + x_ul
+        y = np.array(tessdata["top"])[matches] + y_ul
+        w = np.array(tessdata["width"])[matches]
+        h = np.array(tessdata["height"])[matches]
+
+        # lower left, upper left, upper right, lower right points of each rotated rectangle
+        rotated_verts = np.stack(
+            (
+                np.stack((x, y + h), axis=1),
+                np.stack((x, y), axis=1),
+                np.stack((x + w, y), axis=1),
+                np.stack((x + w, y + h), axis=1),
+            ),
+            axis=1,
+        ).astype(np.float64)
+
+        # text detection is performed on a rotated image
+        # boxes need to be rotated back to their original position, all at once
         theta = -rotated_angle  # angle to rotate text boxes back to original position
+        rot_mat = cv2.getRotationMatrix2D(center=(x_ul, y_ul), angle=theta, scale=1)
 
-        for i, det_word in enumerate(detected_words):
-            if not det_word:
-                continue  # ignore empty strings
-
-            # if any of the words are in the detected words, add BoundingBox to final set
-            # This is done to allow cases where extra characters around the words are detected
-            if np.any([(rus_word in det_word.lower()) for rus_word in self.text]):
-                (x, y, w, h) = (
-                    self.tessdata["left"][i] + x_ul,
-                    self.tessdata["top"][i] + y_ul,
-                    self.tessdata["width"][i],
-                    self.tessdata["height"][i],
-                )
-                ll_pt = (x, y + h)  # lower left point of rotated rectangle
-                ul_pt = (x, y)  # upper left point of rotated rectangle
-                ur_pt = (x + w, y)  # upper right point of rotated rectangle
-                lr_pt = (x + w, y + h)  # lower right point of rotated rectangle
-
-                # text detection is performed on a rotated image
-                # boxes need to be rotated back to their original position
-                rotated_verts = np.array([[ll_pt, ul_pt, ur_pt, lr_pt]])
-
-                # rotate box back to original point on color image
-                rot_mat = cv2.getRotationMatrix2D(
-                    center=(x_ul, y_ul), angle=theta, scale=1
-                )
-                verts = cv2.transform(src=rotated_verts, m=rot_mat)[0]
-                verts = [
-                    (int(row), int(col)) for (row, col) in verts
-                ]  # cast for proper types from ndarray
+        verts = cv2.transform(src=rotated_verts.reshape(1, -1, 2), m=rot_mat)
+        # rounded to whole pixels, as transforming integer points did
+        verts = np.rint(verts.reshape(-1, 4, 2)).astype(int)
+
+        if batch:
+            return BoundingBoxBatch(verts, [ObjectType.TEXT] * verts.shape[0])
 
-                box = BoundingBox(verts, ObjectType("text"))
-                box_obs.append(box)
+        return [
+            BoundingBox(
+                [tuple(vert) for vert in box_verts.tolist()], ObjectType("text")
+            )
+            for box_verts in verts
+        ]
+
+    def close(self) -> None:
+        """
+        Stop the OCR workers, if any.
 
-        return box_obs
+        Returns
+        -------
+        None
+        """
+        if self.ocr_pool is not None:
+            self.ocr_pool.close()
+            self.ocr_pool = None
 
     def _get_rotated_min_area_rect(
-        self, color_image: np.ndarray, depth_image: np.ndarray
+        self, color_image: np.ndarray, depth_image: np.ndarray, frame=None
     ) -> tuple:
         """
         Returns min area rect of inside the tape
@@ -112,6 +302,8 @@ class TextDetector:
             color ndarray from the realsense camera
         depth_image: np.ndarray
             depth ndarray from the realsense camera
+        frame: FrameCache
+            Images already derived from color_image and depth_image, None to compute them here.
 
         Returns
         --------
@@ -126,37 +318,162 @@ class TextDetector:
             angle: float
                 angle that the minAreaRect is rotated relative to color_image
         """
-        BLUR_SIZE = 5  # size of blur kernel
-        MIN_BLUE = 15  # minimum blue value in the image
-        RED_WT = 1.7  # blue-red weight ratio threshold
-        GREEN_WT = 1.1  # blue-green weight ratio threshold
-        DEPTH_THRESH = 8000  # maximum depth for background filtering
-        EDGE_LOWER = 250  # lower bound gradient threshold for edge detection
-        EDGE_UPPER = 255  # upper bound gradient threshold for edge detection
+        largestContour = self._find_placard(color_image, depth_image, frame)
 
-        # the text is always in a blue rectangle. this finds the rectangle
-        # remove noise, int16 to prevent negative overflow in following step
-        blur_image = np.int16(cv2.GaussianBlur(src=color_image, ksize=(5, 5), sigmaX=0))
-        b_image, g_image, r_image = (
-            blur_image[:, :, 0],
-            blur_image[:, :, 1],
-            blur_image[:, :, 2],
-        )  # separate channels
+        if largestContour is None:
+            return (np.array([]), 0, 0, 0)
 
-        r_image = np.where(r_image == 0, 1, r_image)  # prevent division by zero
-        g_image = np.where(g_image == 0, 1, g_image)  # prevent division by zero
+        rect = cv2.minAreaRect(largestContour)
+
+        center, size, theta = rect
 
-        blue_mask = np.logical_and(
-            (b_image / r_image > RED_WT),
-            (b_image / g_image > GREEN_WT),
-            (b_image > MIN_BLUE),  # eliminate near-black pixels
+        ## WORKAROUND for potential bug on linux build of opencv library ##
+        # BUG: opencv implements new undocumented implementation of cv2.minAreaRect return value
+        #      where angle is in range (0, 90] on Linux but is in range (-90, 0] on Windows
+        #      GitHub Issue #19472: https://github.com/opencv/opencv/issues/19472
+        theta = theta - 90 if 0 < theta <= 90 else theta
+
+        x_ul = int(center[0] - (size[0] / 2))
+        y_ul = int(center[1] - (size[1] / 2))
+
+        # adjust angle so the image isn't corrected to a 90 degree angle
+        if theta > -45:
+            rotation_angle = theta
+        else:
+            rotation_angle = theta + 90
+
+        rows, columns, channels = color_image.shape
+        matrix = cv2.getRotationMatrix2D(
+            center=(columns / 2, rows / 2), angle=rotation_angle, scale=1
         )
 
-        # make blue parts black, rest white
-        mask_image = np.where(blue_mask, np.uint8(0), np.uint8(255))
+        rect0 = (rect[0], rect[1], 0.0)
+        box = cv2.boxPoints(rect0)
+        points = np.int0(cv2.transform(np.array([box]), matrix))[0]
+        points[points < 0] = 0
 
-        # filter out background with depth image
-        mask_image = np.where((depth_image < DEPTH_THRESH), mask_image, np.uint8(255))
+        # bounds of the text in the rotated image, clipped to the image like a slice
+        x_0, x_1 = min(points[1][0], columns), min(points[2][0], columns)
+        y_0, y_1 = min(points[1][1], rows), min(points[0][1], rows)
+
+        if x_1 <= x_0 or y_1 <= y_0:
+            sliced_rotated_image = np.zeros(
+                (max(y_1 - y_0, 0), max(x_1 - x_0, 0), channels),
+                dtype=color_image.dtype,
+            )
+        else:
+            # rotate only the text, moving its corner to the origin of the output
+            crop_matrix = np.copy(matrix)
+            crop_matrix[:, 2] -= (x_0, y_0)
+
+            sliced_rotated_image = cv2.warpAffine(
+                src=color_image, M=crop_matrix, dsize=(int(x_1 - x_0), int(y_1 - y_0))
+            )
+
+        return sliced_rotated_image, x_ul, y_ul, rotation_angle
+
+    def _find_placard(
+        self, color_image: np.ndarray, depth_image: np.ndarray, frame=None
+    ) -> np.ndarray:
+        """
+        Finds the contour of the blue rectangle, first searching a window
+        around the last rectangle found if roi_cache is set.
+        The full frame is searched on a miss, or every rescan_interval frames.
+
+        Parameters
+        -----
+        color_image: np.ndarray
+            color ndarray from the realsense camera
+        depth_image: np.ndarray
+            depth ndarray from the realsense camera
+        frame: FrameCache
+            Images already derived from color_image and depth_image, None to compute them here.
+
+        Returns
+        --------
+        np.ndarray - largest contour relative to color_image, None if none found.
+        """
+        PADDING = 0.5  # window padding on each side, in rectangle sizes
+        MIN_PADDING = 20  # (in px), smallest window padding
+
+        # blurred once for the frame, windows are slices of it
+        blur_image = None if frame is None else frame.blurred(self.MASK_BLUR_SIZE)
+
+        if (
+            self.roi_cache
+            and self.placard_rect is not None
+            and self.roi_frames < self.rescan_interval
+        ):
+            x, y, w, h = self.placard_rect
+            pad = max(int(PADDING * max(w, h)), MIN_PADDING)
+
+            rows, columns = color_image.shape[:2]
+            x0, y0 = max(x - pad, 0), max(y - pad, 0)
+            x1, y1 = min(x + w + pad, columns), min(y + h + pad, rows)
+
+            contour = self._find_largest_contour(
+                color_image[y0:y1, x0:x1],
+                depth_image[y0:y1, x0:x1],
+                offset=(x0, y0),
+                blur_image=None if blur_image is None else blur_image[y0:y1, x0:x1],
+            )
+
+            if contour is not None:
+                rect = cv2.boundingRect(contour)
+
+                # a rectangle cut off by the window may continue outside of it
+                cut_off = (
+                    (rect[0] <= x0 and x0 > 0)
+                    or (rect[1] <= y0 and y0 > 0)
+                    or (rect[0] + rect[2] >= x1 and x1 < columns)
+                    or (rect[1] + rect[3] >= y1 and y1 < rows)
+                )
+
+                if not cut_off:
+                    self.placard_rect = rect
+                    self.roi_frames += 1
+                    return contour
+
+        contour = self._find_largest_contour(
+            color_image, depth_image, blur_image=blur_image
+        )
+
+        self.placard_rect = None if contour is None else cv2.boundingRect(contour)
+        self.roi_frames = 0
+
+        return contour
+
+    def _find_largest_contour(
+        self,
+        color_image: np.ndarray,
+        depth_image: np.ndarray,
+        offset: tuple = (0, 0),
+        blur_image: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Finds the largest contour with a child contour in the blue parts of the image.
+
+        Parameters
+        -----
+        color_image: np.ndarray
+            color ndarray from the realsense camera
+        depth_image: np.ndarray
+            depth ndarray from the realsense camera
+        offset: tuple
+            (x, y) offset added to the contour points, e.g. the position of a cropped image.
+        blur_image: np.ndarray
+            color_image already blurred by MASK_BLUR_SIZE, None to blur it here.
+
+        Returns
+        --------
+        np.ndarray - largest contour, None if none found.
+        """
+        BLUR_SIZE = 5  # size of blur kernel
+        EDGE_LOWER = 250  # lower bound gradient threshold for edge detection
+        EDGE_UPPER = 255  # upper bound gradient threshold for edge detection
+
+        # the text is always in a blue rectangle. this finds the rectangle
+        mask_image = self._get_blue_mask(color_image, depth_image, blur_image)
 
         # apply edge detection
         edges = cv2.Canny(
@@ -170,52 +487,96 @@ class TextDetector:
         # the rectangle has an inside and outside boundary, and we can use that fact to eliminate noise
         # that is, any contours that don't have child contours aren't our rectangle
         contours, hierarchy = cv2.findContours(
-            image=edges, mode=cv2.RETR_CCOMP, method=cv2.CHAIN_APPROX_NONE
+            image=edges,
+            mode=cv2.RETR_CCOMP,
+            method=cv2.CHAIN_APPROX_NONE,
+            offset=offset,
         )
 
         if hierarchy is None:
-            return (np.array([]), 0, 0, 0)
+            return None
 
         contourAreas = np.array([cv2.contourArea(c) for c in contours])
-        largestContour = contours[np.argmax(contourAreas)]
 
-        x, y, w, h = cv2.boundingRect(largestContour)
+        return contours[np.argmax(contourAreas)]
 
-        rect = cv2.minAreaRect(largestContour)
+    def _get_blue_mask(
+        self,
+        color_image: np.ndarray,
+        depth_image: np.ndarray,
+        blur_image: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Makes blue parts of the image that are not in the background black, the rest white.
+        Ratios are compared with integer cross-multiplication, in preallocated buffers.
 
-        center, size, theta = rect
+        Parameters
+        -----
+        color_image: np.ndarray
+            color ndarray from the realsense camera
+        depth_image: np.ndarray
+            depth ndarray from the realsense camera
+        blur_image: np.ndarray
+            color_image already blurred by MASK_BLUR_SIZE, None to blur it here.
 
-        ## WORKAROUND for potential bug on linux build of opencv library ##
-        # BUG: opencv implements new undocumented implementation of cv2.minAreaRect return value
-        #      where angle is in range (0, 90] on Linux but is in range (-90, 0] on Windows
-        #      GitHub Issue #19472: https://github.com/opencv/opencv/issues/19472
-        theta = theta - 90 if 0 < theta <= 90 else theta
+        Returns
+        --------
+        np.ndarray - uint8 mask, overwritten by the next call.
+        """
+        # blue-red weight ratio threshold 1.7 and blue-green threshold 1.1, as fractions
+        RED_WT_NUM, RED_WT_DEN = 17, 10
+        GREEN_WT_NUM, GREEN_WT_DEN = 11, 10
+        DEPTH_THRESH = 8000  # maximum depth for background filtering
 
-        x_ul = int(center[0] - (size[0] / 2))
-        y_ul = int(center[1] - (size[1] / 2))
+        rows, columns = color_image.shape[:2]
+        buffers = self.buffers
 
-        # adjust angle so the image isn't corrected to a 90 degree angle
-        if theta > -45:
-            rotation_angle = theta
-        else:
-            rotation_angle = theta + 90
+        # remove noise
+        if blur_image is None:
+            blur_image = buffers.get("blur", color_image.shape, np.uint8)
+            cv2.GaussianBlur(
+                src=color_image,
+                ksize=(self.MASK_BLUR_SIZE, self.MASK_BLUR_SIZE),
+                sigmaX=0,
+                dst=blur_image,
+            )
 
-        rows, columns, _ = color_image.shape
-        matrix = cv2.getRotationMatrix2D(
-            center=(columns / 2, rows / 2), angle=rotation_angle, scale=1
-        )
-        rotated = cv2.warpAffine(src=color_image, M=matrix, dsize=(columns, rows))
+        b_image, g_image, r_image = (
+            blur_image[:, :, 0],
+            blur_image[:, :, 1],
+            blur_image[:, :, 2],
+        )  # separate channels
 
-        rect0 = (rect[0], rect[1], 0.0)
-        box = cv2.boxPoints(rect0)
-        points = np.int0(cv2.transform(np.array([box]), matrix))[0]
-        points[points < 0] = 0
+        # b / r > 1.7 as b * 10 > r * 17, uint16 holds 255 * 17
+        # zero red or green counts as 1, as max(r * 17, 17) == max(r, 1) * 17
+        b_scaled = buffers.get("b_scaled", (rows, columns), np.uint16)
+        np.multiply(b_image, RED_WT_DEN, dtype=np.uint16, out=b_scaled)
 
-        sliced_rotated_image = rotated[
-            points[1][1] : points[0][1], points[1][0] : points[2][0]
-        ]
+        other_scaled = buffers.get("other_scaled", (rows, columns), np.uint16)
+        np.multiply(r_image, RED_WT_NUM, dtype=np.uint16, out=other_scaled)
+        np.maximum(other_scaled, RED_WT_NUM, out=other_scaled)
 
-        return sliced_rotated_image, x_ul, y_ul, rotation_angle
+        blue_mask = buffers.get("blue_mask", (rows, columns), np.bool_)
+        np.greater(b_scaled, other_scaled, out=blue_mask)
+
+        # b / g > 1.1 as b * 10 > g * 11, same denominator so b_scaled is reused
+        np.multiply(g_image, GREEN_WT_NUM, dtype=np.uint16, out=other_scaled)
+        np.maximum(other_scaled, GREEN_WT_NUM, out=other_scaled)
+
+        in_range = buffers.get("in_range", (rows, columns), np.bool_)
+        np.greater(b_scaled, other_scaled, out=in_range)
+        np.logical_and(blue_mask, in_range, out=blue_mask)
+
+        # filter out background with depth image
+        np.less(depth_image, DEPTH_THRESH, out=in_range)
+        np.logical_and(blue_mask, in_range, out=blue_mask)
+
+        # make blue parts black, rest white
+        mask_image = buffers.get("mask", (rows, columns), np.uint8)
+        np.logical_not(blue_mask, out=blue_mask)
+        np.multiply(blue_mask, 255, dtype=np.uint8, out=mask_image)
+
+        return mask_image
 
     def visualize_min_area_rect(
         self, color_image: np.ndarray, depth_image: np.ndarray
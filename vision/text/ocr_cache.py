@@ -0,0 +1,146 @@
+"""
+Cache of OCR results keyed on a perceptual hash of the image read,
+so near identical text crops are only read once.
+"""
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class OCRCache:
+    """
+    Least recently used cache of OCR word data.
+
+    Images are keyed on their difference hash (dHash) and size. A lookup hits
+    an entry whose size is within size_tolerance and whose hash differs in at
+    most max_distance bits.
+
+    Parameters
+    ----------
+    max_entries: int
+        Number of results kept, the least recently used is dropped first.
+    max_distance: int
+        Largest Hamming distance between hashes of matching images, out of 64 bits.
+    max_age: float
+        Seconds a result is kept after it was read.
+    size_tolerance: int
+        Largest difference in height or width, in pixels, between matching images.
+    """
+
+    HASH_SIZE = 8  # hash is HASH_SIZE x HASH_SIZE bits
+
+    def __init__(
+        self,
+        max_entries: int = 16,
+        max_distance: int = 4,
+        max_age: float = 2.0,
+        size_tolerance: int = 2,
+    ):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {max_entries}")
+
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.size_tolerance = size_tolerance
+
+        # key: (timestamp, data), least recently used first
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, image: np.ndarray) -> tuple:
+        """
+        Key of an image, its difference hash and size.
+
+        Parameters
+        ----------
+        image: np.ndarray
+            1 or 3 channel image.
+
+        Returns
+        -------
+        tuple - (hash, height, width)
+        """
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        small = cv2.resize(
+            gray, (self.HASH_SIZE + 1, self.HASH_SIZE), interpolation=cv2.INTER_AREA
+        )
+
+        # each bit is whether brightness increases to the right
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+
+        image_hash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+        return (image_hash, image.shape[0], image.shape[1])
+
+    def get(self, key: tuple) -> dict:
+        """
+        Look up the OCR result of an image.
+
+        Parameters
+        ----------
+        key: tuple
+            Key of the image, from key().
+
+        Returns
+        -------
+        dict - word data of a matching image, None on a miss.
+        """
+        image_hash, height, width = key
+        now = time.monotonic()
+
+        # drop results that are too old
+        for entry_key in [
+            entry_key
+            for entry_key, (timestamp, _) in self.entries.items()
+            if now - timestamp > self.max_age
+        ]:
+            del self.entries[entry_key]
+
+        for entry_key, (_, data) in reversed(self.entries.items()):
+            entry_hash, entry_height, entry_width = entry_key
+
+            if (
+                abs(entry_height - height) <= self.size_tolerance
+                and abs(entry_width - width) <= self.size_tolerance
+                and bin(entry_hash ^ image_hash).count("1") <= self.max_distance
+            ):
+                self.entries.move_to_end(entry_key)
+                self.hits += 1
+                return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, data: dict) -> None:
+        """
+        Add the OCR result of an image.
+
+        Parameters
+        ----------
+        key: tuple
+            Key of the image, from key().
+        data: dict
+            Word data of the image.
+
+        Returns
+        -------
+        None
+        """
+        self.entries[key] = (time.monotonic(), data)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    @property
+    def counters(self) -> dict:
+        """
+        Snapshot of the hit and miss counts.
+        """
+        return {"hits": self.hits, "misses": self.misses}
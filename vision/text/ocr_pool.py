@@ -0,0 +1,164 @@
+"""
+Pool of long-lived OCR worker processes, so tesseract is loaded once per worker
+instead of once per image.
+"""
+import multiprocessing
+from multiprocessing.pool import AsyncResult
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = (
+        None  # workers fall back to pytesseract, one tesseract process per image
+    )
+
+
+_worker_api = None  # tesserocr.PyTessBaseAPI of the current worker process
+_worker_lang = None  # tesseract language of the current worker process
+
+
+def _init_worker(lang: str) -> None:
+    """
+    Load tesseract once in a new worker process.
+
+    Parameters
+    ----------
+    lang: str
+        Tesseract language to load.
+
+    Returns
+    -------
+    None
+    """
+    global _worker_api, _worker_lang
+
+    _worker_lang = lang
+
+    if tesserocr is not None:
+        _worker_api = tesserocr.PyTessBaseAPI(lang=lang)
+
+
+def _image_to_data(image: np.ndarray) -> dict:
+    """
+    OCR an image on a worker process.
+
+    Parameters
+    ----------
+    image: np.ndarray
+        Image to read text from.
+
+    Returns
+    -------
+    dict - word data in the format of pytesseract.image_to_data with Output.DICT.
+    """
+    if _worker_api is None:
+        return pytesseract.image_to_data(
+            image, output_type=pytesseract.Output.DICT, lang=_worker_lang
+        )
+
+    _worker_api.SetImage(Image.fromarray(image))
+    _worker_api.Recognize()
+
+    data = {"text": [], "left": [], "top": [], "width": [], "height": [], "conf": []}
+
+    for word in tesserocr.iterate_level(_worker_api.GetIterator(), tesserocr.RIL.WORD):
+        box = word.BoundingBox(tesserocr.RIL.WORD)
+
+        if box is None:
+            continue
+
+        x_1, y_1, x_2, y_2 = box
+
+        data["text"].append(word.GetUTF8Text(tesserocr.RIL.WORD))
+        data["left"].append(x_1)
+        data["top"].append(y_1)
+        data["width"].append(x_2 - x_1)
+        data["height"].append(y_2 - y_1)
+        data["conf"].append(word.Confidence(tesserocr.RIL.WORD))
+
+    return data
+
+
+class OCRPool:
+    """
+    Worker processes that each keep tesseract loaded, and OCR images sent to them.
+    Uses tesserocr if installed, otherwise each worker calls pytesseract.
+
+    Parameters
+    ----------
+    workers: int
+        Number of worker processes.
+    lang: str
+        Tesseract language to load.
+    """
+
+    def __init__(self, workers: int = 2, lang: str = "uzb_cyrl"):
+        if workers < 1:
+            raise ValueError(f"OCRPool needs at least 1 worker, got {workers}")
+
+        self.workers = workers
+        self.lang = lang
+
+        self.pool = multiprocessing.Pool(
+            processes=workers, initializer=_init_worker, initargs=(lang,)
+        )
+
+    def submit(self, image: np.ndarray) -> AsyncResult:
+        """
+        Start OCR of an image.
+
+        Parameters
+        ----------
+        image: np.ndarray
+            Image to read text from.
+
+        Returns
+        -------
+        AsyncResult - .get() returns the word data dict.
+        """
+        return self.pool.apply_async(_image_to_data, (image,))
+
+    def image_to_data(self, image: np.ndarray) -> dict:
+        """
+        OCR an image, waiting for the result.
+
+        Parameters
+        ----------
+        image: np.ndarray
+            Image to read text from.
+
+        Returns
+        -------
+        dict - word data in the format of pytesseract.image_to_data with Output.DICT.
+        """
+        return self.submit(image).get()
+
+    def map(self, images: list) -> list:
+        """
+        OCR several images at once.
+
+        Parameters
+        ----------
+        images: list[np.ndarray]
+            Images to read text from.
+
+        Returns
+        -------
+        list[dict] - word data of each image, in order.
+        """
+        return [result.get() for result in [self.submit(image) for image in images]]
+
+    def close(self) -> None:
+        """
+        Stop the worker processes.
+
+        Returns
+        -------
+        None
+        """
+        self.pool.terminate()
+        self.pool.join()
@@ -9,6 +9,8 @@ sys.path += [parent_dir, gparent_dir, ggparent_dir]
 
 import unittest
 from unittest.mock import patch
+import multiprocessing
+import time
 
 import numpy as np
 import airsim
@@ -16,6 +18,8 @@ import airsim
 from vision.camera import bag_file
 from vision.camera import realsense
 from vision.camera import sim_camera
+from vision.camera.frame_grabber import FrameGrabber
+from vision.camera.shared_frames import SharedFrameBuffer
 
 
 COLOR_IMAGE = np.arange(0, 10).reshape(-1, 1, 1) + np.arange(0, 10).reshape(1, -1, 1) + np.arange(0, 3).reshape(1, 1, -1)
@@ -184,5 +188,149 @@ class TestCamera(unittest.TestCase):
                 break
 
 
+class TestFrameGrabber(unittest.TestCase):
+    """
+    Testing the background frame acquisition stage.
+    """
+    def test_get(self):
+        """
+        Testing FrameGrabber.get.
+
+        Returns
+        -------
+        tuple (depth image, color image) of the newest captured frame.
+        """
+        ## Ensure every frame is accounted for & stale frames are dropped
+        frames = [(np.full((2, 2), i), np.full((2, 2, 3), i)) for i in range(20)]
+
+        grabber = FrameGrabber(iter(frames), buffer_size=2).start()
+        grabber.thread.join(1)  # camera is exhausted immediately
+
+        depth, color = grabber.get()
+
+        np.testing.assert_array_equal(depth, frames[-1][0])
+        np.testing.assert_array_equal(color, frames[-1][1])
+
+        self.assertDictEqual(grabber.counters, {'captured': 20, 'dropped': 19, 'processed': 1})
+
+        ## Ensure end of camera is signalled
+        with self.assertRaises(StopIteration):
+            grabber.get()
+
+    def test_slow_camera(self):
+        """
+        Testing FrameGrabber with a camera slower than the consumer.
+
+        Effects
+        -------
+        get blocks until a frame arrives, so no frame is dropped.
+        """
+        def camera():
+            for i in range(3):
+                time.sleep(.01)
+                yield np.full((2, 2), i), np.full((2, 2, 3), i)
+
+        grabber = FrameGrabber(camera())
+
+        depths = [depth[0, 0] for depth, _ in grabber]
+
+        self.assertListEqual(depths, [0, 1, 2])
+        self.assertDictEqual(grabber.counters, {'captured': 3, 'dropped': 0, 'processed': 3})
+
+        ## Ensure camera errors are raised to the consumer
+        def broken_camera():
+            raise RuntimeError("camera disconnected")
+            yield
+
+        with self.assertRaises(RuntimeError):
+            FrameGrabber(broken_camera()).get(timeout=1)
+
+
+def _read_shared_frames(frame_buffer, results):
+    """
+    Worker process for TestSharedFrameBuffer, records the first pixel of every frame seen.
+    """
+    for depth, color in frame_buffer:
+        results.put((int(depth[0, 0]), int(color[0, 0, 0])))
+
+    results.put(None)
+
+
+class TestSharedFrameBuffer(unittest.TestCase):
+    """
+    Testing the shared memory frame ring buffer.
+    """
+    def test_read(self):
+        """
+        Testing SharedFrameBuffer.write and SharedFrameBuffer.read.
+
+        Returns
+        -------
+        (sequence, timestamp, depth image, color image) or None once overwritten.
+        """
+        frame_buffer = SharedFrameBuffer(20, 10, slots=3)
+
+        self.assertIsNone(frame_buffer.read())
+
+        ## Ensure frames read back as written
+        for i in range(1, 5):
+            sequence = frame_buffer.write(DEPTH_IMAGE[:10] * i, COLOR_IMAGE.repeat(2, axis=1) * i)
+
+            self.assertEqual(sequence, i)
+            self.assertEqual(frame_buffer.head, i)
+
+            read_sequence, timestamp, depth, color = frame_buffer.read()
+
+            self.assertEqual(read_sequence, i)
+            self.assertEqual(depth.dtype, np.uint16)
+            self.assertEqual(color.dtype, np.uint8)
+            np.testing.assert_array_equal(depth, DEPTH_IMAGE[:10] * i)
+            np.testing.assert_array_equal(color, COLOR_IMAGE.repeat(2, axis=1) * i)
+
+        ## Ensure overwritten frames are reported stale
+        self.assertIsNone(frame_buffer.read(1))
+        self.assertFalse(frame_buffer.is_valid(1))
+        self.assertTrue(frame_buffer.is_valid(4))
+
+        ## Ensure reads are views into shared memory
+        _, _, depth, _ = frame_buffer.read(4)
+        frame_buffer.depth_slots[4 % 3][0, 0] = 12345
+        self.assertEqual(depth[0, 0], 12345)
+
+    def test_processes(self):
+        """
+        Testing SharedFrameBuffer across processes.
+
+        Effects
+        -------
+        A worker process sees frames written by the parent, in order, until closed.
+        """
+        frame_buffer = SharedFrameBuffer(4, 4, slots=4)
+        results = multiprocessing.Queue()
+
+        worker = multiprocessing.Process(target=_read_shared_frames, args=(frame_buffer, results))
+        worker.start()
+
+        for i in range(1, 6):
+            frame_buffer.write(np.full((4, 4), i), np.full((4, 4, 3), i))
+            time.sleep(.05)
+
+        frame_buffer.close()
+
+        seen = []
+        while True:
+            item = results.get(timeout=5)
+            if item is None:
+                break
+            seen.append(item)
+
+        worker.join(5)
+
+        self.assertGreater(len(seen), 0)
+        self.assertListEqual(seen, sorted(seen))
+        for depth_value, color_value in seen:
+            self.assertEqual(depth_value, color_value)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -16,6 +16,24 @@ try:
 except ImportError:
     from common.import_params import import_params
 
+try:
+    from vision.common.stage_timer import StageTimer
+except ImportError:
+    from common.stage_timer import StageTimer
+
+try:
+    from vision.common.frame_cache import FrameCache
+except ImportError:
+    from common.frame_cache import FrameCache
+
+try:
+    from vision.common.intrinsics import Intrinsics
+except ImportError:
+    from common.intrinsics import Intrinsics
+
+import cv2
+import numpy as np
+
 
 class TestParamsImport(unittest.TestCase):
     def test_params_import(self):
@@ -74,5 +92,119 @@ class TestParamsImport(unittest.TestCase):
         self.assertDictEqual(config_original, config_parameter)
 
 
+class TestStageTimer(unittest.TestCase):
+    def test_time(self):
+        """
+        Tests timing stages.
+
+        Returns
+        -------
+        Timings of the current frame, and of stages that raise, are recorded.
+        """
+        timer = StageTimer(window=10)
+
+        with timer.time("stage"):
+            pass
+
+        with self.assertRaises(ValueError):
+            with timer.time("failing"):
+                raise ValueError
+
+        self.assertEqual(sorted(timer.timings), ["failing", "stage"])
+        self.assertGreaterEqual(timer.timings["stage"], 0)
+
+        timer.reset()
+        self.assertEqual(timer.timings, {})
+        self.assertEqual(len(timer.samples["stage"]), 1)
+
+    def test_percentiles(self):
+        """
+        Tests rolling percentiles.
+
+        Returns
+        -------
+        Percentiles only cover the last window timings.
+        """
+        timer = StageTimer(window=100)
+
+        for i in range(200):
+            timer.record("stage", float(i))
+
+        latencies = timer.percentiles()["stage"]
+
+        self.assertAlmostEqual(latencies["p50"], 149.5)
+        self.assertAlmostEqual(latencies["p95"], 194.05)
+        self.assertAlmostEqual(latencies["p99"], 198.01)
+
+
+class TestFrameCache(unittest.TestCase):
+    def test_computed_once(self):
+        """
+        Tests derived images are computed once per frame.
+
+        Returns
+        -------
+        Same read-only array on every call, matching the direct computation.
+        """
+        random = np.random.default_rng(0)
+        color_image = random.integers(0, 256, (48, 64, 3), dtype="uint8")
+        depth_image = random.integers(0, 3, (48, 64), dtype="uint16")
+
+        frame = FrameCache(color_image, depth_image)
+
+        calls = []
+
+        def compute():
+            calls.append(None)
+            return np.zeros(1)
+
+        self.assertIs(frame.get("image", compute), frame.get("image", compute))
+        self.assertEqual(len(calls), 1)
+
+        blurred_gray = frame.blurred_gray(5)
+        self.assertIs(frame.blurred_gray(5), blurred_gray)
+        self.assertFalse(blurred_gray.flags.writeable)
+
+        gray = cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)
+        np.testing.assert_array_equal(frame.gray(), gray)
+        np.testing.assert_array_equal(
+            blurred_gray, cv2.GaussianBlur(gray, (5, 5), sigmaX=0)
+        )
+        np.testing.assert_array_equal(frame.depth_valid(), depth_image != 0)
+
+        # other parameters are another image
+        self.assertFalse(
+            np.array_equal(frame.gray(cv2.COLOR_BGR2GRAY), frame.gray(cv2.COLOR_RGB2GRAY))
+        )
+
+
+class TestIntrinsics(unittest.TestCase):
+    def test_deproject(self):
+        """
+        Pixels are back-projected along their rays to the given depth.
+        """
+        intrinsics = Intrinsics(640, 480, 600, 500, 320, 240)
+
+        np.testing.assert_allclose(intrinsics.deproject(320, 240, 2), (0, 0, 2))
+        np.testing.assert_allclose(intrinsics.deproject(920, 740, 2), (2, 2, 2))
+
+        points = intrinsics.deproject([[0, 640]], [[0], [480]], 3)
+        self.assertEqual(points.shape, (2, 2, 3))
+        np.testing.assert_allclose(points[1, 1], (320 / 600 * 3, 240 / 500 * 3, 3))
+
+    def test_from_fov(self):
+        """
+        The image edges are at half the field of view.
+        """
+        intrinsics = Intrinsics.from_fov(1280, 720, 90, 60)
+
+        self.assertAlmostEqual(intrinsics.fx, 640)
+        self.assertAlmostEqual(intrinsics.fy, 360 / np.tan(np.radians(30)))
+        self.assertEqual((intrinsics.ppx, intrinsics.ppy), (639.5, 359.5))
+
+        point = intrinsics.deproject(intrinsics.ppx + 640, intrinsics.ppy, 1)
+        self.assertAlmostEqual(np.degrees(np.arctan2(point[0], point[2])), 45)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -15,7 +15,15 @@ import cv2
 from vision.module.in_frame import ModuleInFrame as mif
 from vision.module.location import ModuleLocation
 from vision.module.region_of_interest import get_region_of_interest
-from vision.module.module_orientation import get_module_roll, get_module_orientation
+from vision.module.module_orientation import (
+    get_module_roll,
+    get_module_roll_contours,
+    get_module_orientation,
+    fit_module_plane,
+)
+from vision.module.slopes import get_slopes
+from vision.module.clustering import cluster_circles
+from vision.bounding_box import BoundingBox, ObjectType
 
 
 class TestModuleInFrame(unittest.TestCase):
@@ -177,6 +185,229 @@ class TestModuleLocation(unittest.TestCase):
         np.testing.assert_array_equal(color_image, color_parameter)
         np.testing.assert_array_equal(depth_image, depth_parameter)
 
+    def test_tracking(self):
+        """
+        Verify tracking searches around the last center and falls back to the full image.
+
+        Returns
+        -------
+        from_tracking, window, center
+        """
+        MAX_MISSES = 3
+
+        def grid_image(cx, cy):
+            # rotated grid of holes around (cx, cy)
+            color_image = np.full((480, 640, 3), 200, dtype="uint8")
+            depth_image = np.full((480, 640), 1000, dtype="uint16")
+            theta = np.radians(10)
+            for i in range(-1, 2):
+                for j in range(-1, 2):
+                    x, y = 30 * i, 30 * j
+                    location = (
+                        int(cx + x * np.cos(theta) - y * np.sin(theta)),
+                        int(cy + x * np.sin(theta) + y * np.cos(theta)),
+                    )
+                    cv2.circle(color_image, location, 6, (20, 20, 20), 2)
+            return color_image, depth_image
+
+        locator = ModuleLocation(tracking=True, max_misses=MAX_MISSES)
+
+        ## First image searched in full
+        locator.set_img(*grid_image(300, 240))
+        self.assertFalse(locator.from_tracking)
+        self.assertTrue(locator.is_in_frame())
+        first_center = locator.get_center()
+
+        ## Following image searched around the last center
+        locator.set_img(*grid_image(305, 240))
+        self.assertTrue(locator.from_tracking)
+
+        x0, y0, x1, y1 = locator.window
+        self.assertLess(x1 - x0, 640)
+        self.assertTrue(x0 <= first_center[0] < x1 and y0 <= first_center[1] < y1)
+
+        self.assertTrue(locator.is_in_frame())
+        x, y = locator.get_center()
+        self.assertTrue(x0 <= x < x1 and y0 <= y < y1)
+
+        ## Module moved out of the window
+        for _ in range(MAX_MISSES):
+            locator.set_img(*grid_image(560, 240))
+            self.assertTrue(locator.from_tracking)
+            self.assertFalse(locator.is_in_frame())
+
+        ## Searched in full after max_misses
+        locator.set_img(*grid_image(560, 240))
+        self.assertFalse(locator.from_tracking)
+        self.assertTrue(locator.is_in_frame())
+
+    def test_pyramid(self):
+        """
+        Verify circles found on a downscaled image first match those found at full resolution.
+
+        Returns
+        -------
+        circles
+        """
+        HEIGHT, WIDTH = 1080, 1920
+        SCALE = HEIGHT / ModuleLocation.REFERENCE_HEIGHT
+
+        # rotated grid of holes, sized like the 480p grid in test_tracking
+        color_image = np.full((HEIGHT, WIDTH, 3), 200, dtype="uint8")
+        depth_image = np.full((HEIGHT, WIDTH), 1000, dtype="uint16")
+        theta = np.radians(10)
+        holes = []
+        for i in range(-1, 2):
+            for j in range(-1, 2):
+                x, y = 30 * SCALE * i, 30 * SCALE * j
+                location = (
+                    int(900 + x * np.cos(theta) - y * np.sin(theta)),
+                    int(600 + x * np.sin(theta) + y * np.cos(theta)),
+                )
+                holes.append(location)
+                cv2.circle(
+                    color_image, location, int(6 * SCALE), (20, 20, 20), int(2 * SCALE)
+                )
+
+        found = []
+        for pyramid in (True, False):
+            locator = ModuleLocation(pyramid=pyramid)
+            locator.set_img(color_image, depth_image)
+            circles = locator._find_circles()
+
+            self.assertEqual(circles.shape, (len(holes), 3))
+            found.append(circles[np.lexsort((circles[:, 1], circles[:, 0]))])
+
+        np.testing.assert_array_equal(found[0][:, :2], found[1][:, :2])
+        self.assertFalse(ModuleLocation().pyramid)
+
+        # every hole is found
+        for x, y in holes:
+            distances = np.hypot(
+                found[0][:, 0].astype(float) - x, found[0][:, 1].astype(float) - y
+            )
+            self.assertLess(np.min(distances), 3)
+
+    def test_preprocess(self):
+        """
+        Verify gray pre-processing matches brightening the color image, and reuses its buffers.
+
+        Returns
+        -------
+        laplacian
+        """
+        random = np.random.default_rng(0)
+        color_image = cv2.GaussianBlur(
+            random.integers(0, 256, (480, 640, 3), dtype="uint8"), (9, 9), 0
+        )
+        depth_image = np.full((480, 640), 1000, dtype="uint16")
+
+        locator = ModuleLocation()
+        locator.set_img(color_image, depth_image)
+
+        gray = locator._get_gray(color_image)
+        alpha = locator._get_brightness_alpha(gray, 42)
+        self.assertAlmostEqual(
+            alpha, 170 / np.median(cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)), 1
+        )
+
+        laplacian = locator._preprocess(gray, alpha, 1)
+
+        # brightened in color before taking gray
+        bright = cv2.addWeighted(src1=color_image, alpha=alpha, src2=0, beta=0, gamma=0)
+        blur = cv2.GaussianBlur(cv2.cvtColor(bright, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        expected = cv2.Laplacian(src=blur, ddepth=cv2.CV_8U, ksize=3)
+
+        # only rounding differs, and the Laplacian amplifies it
+        difference = np.abs(laplacian.astype(int) - expected)
+        self.assertLess(np.mean(difference), 2)
+        self.assertGreater(np.mean(difference <= 4), 0.9)
+
+        # same memory used for the next image
+        address = laplacian.__array_interface__["data"][0]
+        laplacian = locator._preprocess(locator._get_gray(color_image), alpha, 1)
+        self.assertEqual(laplacian.__array_interface__["data"][0], address)
+
+    def test_filter_circles(self):
+        """
+        Verify vectorized circle filters remove the same circles as per circle loops.
+
+        Returns
+        -------
+        ndarray - same circles in the same order.
+        """
+        random = np.random.default_rng(0)
+
+        depth_image = random.integers(0, 10000, (480, 640)).astype("uint16")
+        circles = np.column_stack(
+            (
+                random.integers(0, 640, 300),
+                random.integers(0, 480, 300),
+                random.integers(0, 10, 300),
+            )
+        ).astype("uint16")
+
+        ## Distant circles
+        expected = np.array(
+            [(x, y, r) for x, y, r in circles if not depth_image[y][x] > 5000]
+        )
+
+        locator = ModuleLocation()
+        locator.depth, locator.circles = depth_image, np.copy(circles)
+        locator._filter_distant_circles(5000)
+
+        np.testing.assert_array_equal(locator.circles, expected)
+
+        ## Circles below text
+        ROTNEG90 = np.array([[0, 1], [-1, 0]])
+
+        text_boxes = [
+            BoundingBox(
+                np.array([[200, 150], [200, 100], [300, 100], [300, 150]]),
+                ObjectType.TEXT,
+            ),
+            BoundingBox(
+                np.array([[310, 160], [310, 110], [420, 110], [420, 160]]),
+                ObjectType.TEXT,
+            ),
+        ]
+
+        for n_boxes in [1, 2]:
+            with self.subTest(n_boxes=n_boxes):
+                boxes = text_boxes[:n_boxes]
+
+                ll_x, ll_y = boxes[0].vertices[0]
+                lr_x, lr_y = boxes[-1].vertices[3]
+
+                if n_boxes == 1:
+                    lb_vect = (lr_x - ll_x, lr_y - ll_y)
+                    ll_x, ll_y = np.array((ll_x, ll_y)) - np.int0(
+                        np.array(lb_vect) * 0.5
+                    )
+                    lr_x, lr_y = np.int0(np.array(lb_vect) * 0.5) + np.array(
+                        (lr_x, lr_y)
+                    )
+
+                lower_vect = (lr_x - ll_x, lr_y - ll_y)
+                perp_vect = tuple(np.dot(lower_vect, ROTNEG90).astype(int))
+
+                expected = np.array(
+                    [
+                        (x, y, r)
+                        for x, y, r in circles
+                        if np.cross(lower_vect, (x - ll_x, y - ll_y)) > 0
+                        and np.cross(perp_vect, (x - ll_x, y - ll_y)) < 0
+                        and np.cross(perp_vect, (x - lr_x, y - lr_y)) > 0
+                    ]
+                )
+
+                locator = ModuleLocation()
+                locator.text_boxes, locator.circles = boxes, np.copy(circles)
+                locator._filter_text_circles()
+
+                self.assertGreater(expected.shape[0], 0)
+                np.testing.assert_array_equal(locator.circles, expected)
+
 
 class TestModuleOrientation(unittest.TestCase):
     """
@@ -201,6 +432,45 @@ class TestModuleOrientation(unittest.TestCase):
         self.assertIs(type(image), np.ndarray)
         self.assertIs(type(result), tuple)
 
+    def test_fit_module_plane(self):
+        """
+        Verify the plane fit agrees with the edge estimate on a flat module, and rejects outliers.
+
+        Returns
+        -------
+        x tilt, y tilt, residual
+        """
+        rows, columns = np.mgrid[0:140, 0:108]
+        roi = 800 + 1.5 * columns - 0.7 * rows
+
+        with self.subTest(i="Flat module"):
+            x_tilt, y_tilt, residual = fit_module_plane(roi)
+
+            np.testing.assert_allclose((x_tilt, y_tilt), get_module_orientation(roi))
+            np.testing.assert_allclose(
+                get_module_orientation(roi, fit_plane=True), (x_tilt, y_tilt)
+            )
+            self.assertAlmostEqual(residual, 0)
+
+        random = np.random.default_rng(0)
+        noisy = (roi + random.normal(0, 3, roi.shape)).astype("uint16")
+        noisy[random.random(roi.shape) < 0.1] = 0  # no depth
+        noisy[random.random(roi.shape) < 0.1] = 3000  # outliers
+
+        with self.subTest(i="RANSAC"):
+            x_tilt, y_tilt, residual = fit_module_plane(noisy, ransac_iterations=20)
+
+            expected = get_module_orientation(roi)
+            self.assertAlmostEqual(x_tilt, expected[0], delta=0.5)
+            self.assertAlmostEqual(y_tilt, expected[1], delta=0.5)
+            self.assertLess(residual, 5)
+
+        with self.subTest(i="No depth"):
+            self.assertEqual(fit_module_plane(np.zeros((10, 10))), (0.0, 0.0, 0.0))
+            self.assertEqual(
+                fit_module_plane(np.array([[0, 5], [0, 0]])), (0.0, 0.0, 0.0)
+            )
+
     def test_get_module_orientation(self):
 
         img_dir = os.path.join(gparent_dir, "vision_images/module/Feb29")
@@ -368,6 +638,145 @@ class TestRegionOfInterest(unittest.TestCase):
         self.assertIs(type(roi), np.ndarray)
 
 
+class TestSlopes(unittest.TestCase):
+    """
+    Testing module.slopes functionality.
+    """
+
+    @staticmethod
+    def _loop_slopes(circles):
+        """
+        Reference pairwise loop that get_slopes replaces.
+        """
+        np.seterr(all="ignore")
+
+        slopes = np.array([])
+        for x, y, _ in circles:
+            for iX, iY, _ in circles:
+                m = (iY - y) / (iX - x)
+                if (not np.isnan(m)) and (not np.isinf(m)) and (x != iX and y != iY):
+                    slopes = np.append(slopes, m)
+
+        return slopes
+
+    def test_get_slopes(self):
+        """
+        Verify slopes match the pairwise loop.
+
+        Returns
+        -------
+        ndarray - same slopes in the same order.
+        """
+        random = np.random.default_rng(0)
+
+        for n_circles in [0, 1, 2, 10, 50]:
+            for dtype in ["uint16", "int64", "float32"]:
+                with self.subTest(n_circles=n_circles, dtype=dtype):
+                    circles = random.integers(0, 20, (n_circles, 3)).astype(dtype)
+
+                    expected = self._loop_slopes(circles)
+                    slopes = get_slopes(circles)
+
+                    np.testing.assert_array_equal(slopes, expected)
+
+        with self.subTest(i="Empty array"):
+            self.assertEqual(get_slopes(np.array([])).size, 0)
+
+
+class TestClustering(unittest.TestCase):
+    """
+    Testing module.clustering functionality.
+    """
+
+    @staticmethod
+    def _pairwise_labels(circles, link_scale):
+        """
+        Reference clustering, comparing every pair of circles.
+        """
+        circles = circles.astype(float)
+        labels = np.arange(circles.shape[0])
+
+        for i in range(circles.shape[0]):
+            for j in range(circles.shape[0]):
+                distance = np.hypot(*(circles[i, :2] - circles[j, :2]))
+                if distance <= link_scale * (circles[i, 2] + circles[j, 2]) / 2:
+                    labels[labels == labels[j]] = labels[i]
+
+        return np.unique(labels, return_inverse=True)[1]
+
+    def test_cluster_circles(self):
+        """
+        Verify clusters match the pairwise reference, and are numbered by first circle.
+
+        Returns
+        -------
+        ndarray - same labels.
+        """
+        random = np.random.default_rng(0)
+
+        for n_circles in [0, 1, 2, 10, 100]:
+            with self.subTest(n_circles=n_circles):
+                circles = np.column_stack(
+                    (
+                        random.integers(0, 640, n_circles),
+                        random.integers(0, 480, n_circles),
+                        random.integers(1, 11, n_circles),
+                    )
+                ).astype("uint16")
+
+                labels = cluster_circles(circles, 6)
+
+                # same partition as the reference
+                expected = self._pairwise_labels(circles, 6)
+                np.testing.assert_array_equal(
+                    labels[:, np.newaxis] == labels, expected[:, np.newaxis] == expected
+                )
+
+                # clusters numbered in order of their first circle
+                _, first = np.unique(labels, return_index=True)
+                np.testing.assert_array_equal(np.sort(first), first)
+
+        with self.subTest(i="Dense blob"):
+            circles = np.column_stack(
+                (random.integers(0, 60, (200, 2)), random.integers(1, 4, 200))
+            ).astype("uint16")
+
+            for link_scale in [1, 6]:
+                labels = cluster_circles(circles, link_scale)
+                expected = self._pairwise_labels(circles, link_scale)
+                np.testing.assert_array_equal(
+                    labels[:, np.newaxis] == labels, expected[:, np.newaxis] == expected
+                )
+
+        with self.subTest(i="Chain"):
+            # each circle only links to its neighbors, labels reach across many links
+            circles = np.array(
+                [(5 * i, 10 + 3 * (i % 2), 2) for i in range(100)], dtype="uint16"
+            )[random.permutation(100)]
+
+            np.testing.assert_array_equal(cluster_circles(circles, 3), np.zeros(100))
+
+        with self.subTest(i="Two grids"):
+            grid = [(30 * i, 30 * j, 7) for i in range(3) for j in range(3)]
+            circles = np.array(
+                [(x + 170, y + 210, r) for x, y, r in grid]
+                + [(x + 420, y + 210, r) for x, y, r in grid],
+                dtype="uint16",
+            )
+
+            labels = cluster_circles(circles, 6)
+
+            np.testing.assert_array_equal(labels, [0] * 9 + [1] * 9)
+
+            # same result whatever the order of the circles
+            order = random.permutation(circles.shape[0])
+            shuffled = cluster_circles(circles[order], 6)
+            np.testing.assert_array_equal(
+                shuffled[:, np.newaxis] == shuffled,
+                labels[order][:, np.newaxis] == labels[order],
+            )
+
+
 class TestModuleRoll(unittest.TestCase):
     """
     Testing module.get_module_roll for validity.
@@ -393,6 +802,32 @@ class TestModuleRoll(unittest.TestCase):
         self.assertIs(type(enclosing_region), np.ndarray)
         self.assertIs(type(module_roll), np.float64)
 
+    def test_rotated_module(self):
+        """
+        Verify roll of a drawn module matches the contour roll and minAreaRect angle.
+
+        Returns
+        -------
+        np.float64 - roll in (0, 90]
+        """
+        for roll in [5, 20, 40, 60, 85]:
+            with self.subTest(roll=roll):
+                color_image = np.full((500, 360, 3), 230, dtype=np.uint8)
+                box = cv2.boxPoints(((180, 250), (150, 220), roll)).astype(np.int32)
+                cv2.fillPoly(color_image, [box], (30, 30, 30), cv2.LINE_AA)
+
+                expected = cv2.minAreaRect(box)[2]
+
+                self.assertAlmostEqual(get_module_roll(color_image), expected, delta=1)
+                self.assertAlmostEqual(
+                    get_module_roll(cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)),
+                    expected,
+                    delta=1,
+                )
+                self.assertAlmostEqual(
+                    get_module_roll_contours(color_image), expected, delta=1
+                )
+
     def test_module_roll(self):
         img_dir = os.path.join(gparent_dir, "vision_images/module/Feb29")
         files = os.listdir(img_dir)
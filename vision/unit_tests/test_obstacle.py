@@ -9,11 +9,16 @@ sys.path += [parent_dir, gparent_dir, ggparent_dir]
 
 import unittest
 
+import pickle
+
 import numpy as np
 import cv2
 
 from vision.obstacle.obstacle_finder import ObstacleFinder
-from vision.bounding_box import BoundingBox, ObjectType
+from vision.obstacle.obstacle_tracker import ObstacleTracker
+from vision.obstacle.assignment import linear_assignment, gated_assignment
+from vision.common.intrinsics import Intrinsics
+from vision.bounding_box import BoundingBox, BoundingBoxBatch, ObjectType
 
 
 class TestObstacleDetection(unittest.TestCase):
@@ -118,6 +123,288 @@ class TestObstacleDetection(unittest.TestCase):
 
         np.testing.assert_array_equal(color_image, color_parameter)
 
+        ## Ensure batch output has the same boxes
+        with self.subTest(i="Batch"):
+            boxes = detector.find(color_image, None)
+            batch = detector.find(color_image, None, batch=True)
+
+            self.assertIsInstance(batch, BoundingBoxBatch)
+            self.assertEqual(len(batch), len(boxes))
+
+            for box, batch_box in zip(boxes, batch):
+                np.testing.assert_allclose(batch_box.vertices, box.vertices, rtol=1e-6)
+                self.assertEqual(batch_box.object_type, ObjectType.AVOID)
+
+        ## Ensure boxes with depth are back-projected
+        with self.subTest(i="Depth"):
+            depth_image = np.zeros(color_image.shape[:2], dtype='uint16')
+            depth_image[::2, ::2] = 4000  # sparse depth, zeros are left out
+            depth_image[:10, :10] = 65535  # outliers are left out by the median
+
+            intrinsics = Intrinsics(1000, 1000, 500, 500, 499.5, 499.5)
+            detector = ObstacleFinder(params=self._get_params(), intrinsics=intrinsics)
+
+            boxes = detector.find(color_image, depth_image)
+            self.assertGreater(len(boxes), 0)
+
+            for box in boxes:
+                self.assertEqual(len(box.vertices), 4)
+                self.assertEqual(len(box.vertices_3d), 8)
+
+                near, far = np.array(box.vertices_3d[:4]), np.array(box.vertices_3d[4:])
+                np.testing.assert_allclose(near[:, 2], 4)
+
+                # as deep as it is wide
+                width = near[:, 0].max() - near[:, 0].min()
+                np.testing.assert_allclose(far[:, 2], 4 + width)
+
+                # image corners project back onto the near face
+                np.testing.assert_allclose(near[:, :2] / 4 * 500 + 499.5, box.vertices)
+
+                center = np.mean(box.vertices, axis=0)
+                np.testing.assert_allclose(box.distance, np.linalg.norm([*(center - 499.5) / 500 * 4, 4]))
+
+            batch = detector.find(color_image, depth_image, batch=True)
+            np.testing.assert_allclose(batch.depths, 4000)
+
+            # batches carry the same 3D boxes
+            for box, batch_box in zip(boxes, batch):
+                np.testing.assert_allclose(batch_box.vertices_3d, box.vertices_3d, rtol=1e-6)
+                self.assertAlmostEqual(batch_box.distance, box.distance, places=5)
+
+            # no depth readings, no 3D box
+            box = detector.find(color_image, np.zeros_like(depth_image))[0]
+            self.assertFalse(hasattr(box, "vertices_3d"))
+
+    def test_depth_segmentation(self):
+        """
+        Testing ObstacleFinder.find with depth segmentation.
+
+        Effects
+        -------
+        Each obstacle standing out from the background is one box, even across depth bands.
+        """
+        detector = ObstacleFinder(params=self._get_params(), depth_segmentation={"enable": True})
+
+        depth_image = np.full((1080, 1920), 7000, dtype='uint16')  # background beyond maxDepth
+        depth_image[200:900, 300:450] = 2000
+        # spans the boundary of two bands
+        depth_image[100:1000, 1200:1300] = 3480 + np.arange(100, dtype='uint16') // 2
+        depth_image[::7, ::5] = 0  # missing readings
+
+        color_image = np.zeros((1080, 1920, 3), dtype='uint8')
+
+        boxes = detector.find(color_image, depth_image)
+
+        self.assertEqual(len(boxes), 2)
+
+        for box, expected in zip(boxes, [(300, 200, 450, 900), (1200, 100, 1300, 1000)]):
+            self.assertEqual(box.object_type, ObjectType.AVOID)
+            np.testing.assert_allclose(np.min(box.vertices, axis=0), expected[:2], atol=5)
+            np.testing.assert_allclose(np.max(box.vertices, axis=0), expected[2:], atol=5)
+
+        self.assertAlmostEqual(np.array(boxes[0].vertices_3d)[0, 2], 2)
+        self.assertEqual(len(detector.keypoints), 2)
+
+        ## Disabled by default, and requires a depth image when enabled
+        self.assertIsNone(ObstacleFinder(params=self._get_params(), depth_segmentation={"enable": False}).depth_segmentation)
+
+        with self.assertRaises(ValueError):
+            detector.find(color_image, None)
+
+
+class TestBoundingBoxBatch(unittest.TestCase):
+    """
+    Testing BoundingBoxBatch.
+    """
+    def test_round_trip(self):
+        """
+        Boxes made from a batch match the boxes it was made from,
+        including after pickling.
+        """
+        boxes = [
+            BoundingBox([(0, 0), (10, 0), (10, 10), (0, 10)], ObjectType.AVOID),
+            BoundingBox([(5.5, 5), (15, 5), (15, 20), (5.5, 20)], ObjectType.TEXT),
+            BoundingBox([(1, 2), (3, 2), (3, 4), (1, 4)], ObjectType.MODULE),
+        ]
+        boxes[2].module_depth = 1500.0
+        boxes[2].orientation = (10.0, -5.0, 45.0)
+        boxes[2].from_tracking = True
+        boxes[0].vertices_3d = [(x, y, z) for z in (2.0, 2.5) for x, y in [(-1, -1), (1, -1), (1, 1), (-1, 1)]]
+        boxes[0].distance = 2.0
+
+        batch = BoundingBoxBatch.from_boxes(boxes)
+
+        for copy in (batch, pickle.loads(pickle.dumps(batch)), BoundingBoxBatch.from_buffer(batch.to_buffer())):
+            self.assertEqual(len(copy), len(boxes))
+            self.assertEqual(copy.object_types, [box.object_type for box in boxes])
+
+            for box, batch_box in zip(boxes, copy):
+                self.assertEqual(batch_box.vertices, [tuple(map(float, vertex)) for vertex in box.vertices])
+                self.assertEqual(batch_box.object_type, box.object_type)
+
+            self.assertFalse(hasattr(copy[0], "module_depth"))
+            self.assertEqual(copy[2].module_depth, 1500.0)
+            self.assertEqual(copy[2].orientation, (10.0, -5.0, 45.0))
+            self.assertTrue(copy[2].from_tracking)
+            self.assertEqual(copy[0].vertices_3d, boxes[0].vertices_3d)
+            self.assertEqual(copy[0].distance, 2.0)
+            self.assertFalse(hasattr(copy[2], "vertices_3d"))
+
+        ## Batches of batches
+        merged = BoundingBoxBatch.from_boxes([batch, batch[0]])
+        self.assertEqual(len(merged), 4)
+        self.assertEqual(merged[3].vertices, merged[0].vertices)
+
+        ## Empty
+        self.assertEqual(len(BoundingBoxBatch.from_boxes([])), 0)
+        self.assertEqual(len(pickle.loads(pickle.dumps(BoundingBoxBatch()))), 0)
+
+        ## Mismatched counts
+        with self.assertRaises(ValueError):
+            BoundingBoxBatch(np.zeros((2, 4, 2)), [ObjectType.AVOID])
+
+
+class TestObstacleTracker(unittest.TestCase):
+    """
+    Testing obstacle tracking.
+    """
+    @staticmethod
+    def _boxes(centers, radius=10):
+        """
+        Square obstacle boxes around centers.
+        """
+        return [
+            BoundingBox([(x - radius, y - radius), (x + radius, y - radius), (x + radius, y + radius), (x - radius, y + radius)], ObjectType.AVOID)
+            for x, y in centers
+        ]
+
+    def test_assignment(self):
+        """
+        Assignments have the least total cost, and only gated pairs are matched.
+        """
+        cost = np.array([[4, 1, 3], [2, 0, 5], [3, 2, 2]])
+        rows, columns = linear_assignment(cost)
+        np.testing.assert_array_equal(rows, [0, 1, 2])
+        np.testing.assert_array_equal(columns, [1, 0, 2])
+
+        rows, columns = linear_assignment(cost[:, :2].T)
+        self.assertEqual(cost[:, :2].T[rows, columns].sum(), 3)
+
+        # greedy would match row 0 to column 0 and leave row 1 unmatched
+        distances = np.array([[1, 2], [2, 50]])
+        rows, columns = gated_assignment(distances, 10)
+        np.testing.assert_array_equal(rows, [0, 1])
+        np.testing.assert_array_equal(columns, [1, 0])
+
+        rows, columns = gated_assignment(np.full((3, 2), 50), 10)
+        self.assertEqual(rows.size, 0)
+
+    def test_update(self):
+        """
+        Obstacles keep their track ids while moving within MVMT_TOLERANCE.
+        """
+        tracker = ObstacleTracker()
+
+        rng = np.random.default_rng(0)
+        centers = np.stack([np.arange(300) * 100, rng.uniform(0, 1000, 300)], axis=1)
+
+        # persisted for PERSISTENCE_THRESHOLD frames after the first
+        for frame in range(tracker.PERSISTENCE_THRESHOLD + 1):
+            self.assertEqual(len(tracker.get_persistent_obstacles()), 0)
+
+            tracker.update(self._boxes(centers))
+            centers = centers + 10
+
+        self.assertEqual(len(tracker.get_persistent_obstacles()), 300)
+        self.assertEqual(sorted(obstacle.track_id for obstacle in tracker.obstacles), list(range(300)))
+
+        ## Swapped order, and one obstacle jumps out of tolerance
+        previous_ids = [obstacle.track_id for obstacle in tracker.obstacles]
+        moved = centers[::-1].copy()
+        moved[0] += 1000
+
+        tracker.update(self._boxes(moved))
+
+        ids = [obstacle.track_id for obstacle in tracker.obstacles]
+        self.assertEqual(ids[1:300], previous_ids[::-1][1:])
+        self.assertEqual(ids[0], 300)
+        self.assertEqual(tracker.obstacles[0].frames_persisted, 0)
+
+        # the lost obstacle is still predicted
+        self.assertEqual(ids[300], previous_ids[-1])
+        self.assertEqual(tracker.obstacles[300].misses, 1)
+
+        ## Empty frames, persistent obstacles are predicted for MAX_MISSES frames
+        self.assertEqual(len(tracker.get_persistent_obstacles()), 300)
+
+        for _ in range(tracker.MAX_MISSES):
+            tracker.update([])
+
+        # the obstacle lost a frame earlier is no longer predicted
+        self.assertEqual(len(tracker.get_persistent_obstacles()), 299)
+
+        tracker.update([])
+        self.assertEqual(tracker.get_persistent_obstacles(), [])
+
+    def test_prediction(self):
+        """
+        Obstacles moving faster than MVMT_TOLERANCE per frame are tracked through dropouts.
+        """
+        tracker = ObstacleTracker()
+
+        intrinsics = Intrinsics(1920, 1080, 1000, 900, 959.5, 539.5)
+
+        for frame in range(12):
+            centers = np.array([[100 + 60 * frame, 500 + 5 * frame], [1500, 200]])
+
+            if frame in (8, 9):  # first obstacle is not detected
+                centers = centers[1:]
+
+            boxes = self._boxes(centers)
+
+            # obstacles on the left have depth, approaching by 0.1 m per frame
+            for box, (x, _) in zip(boxes, centers):
+                if x < 960:
+                    near = 3 - 0.1 * frame
+                    corners = np.array(box.vertices, dtype=np.float64)
+                    box.vertices_3d = [
+                        tuple(vertex)
+                        for z in (near, near + 0.2)
+                        for vertex in intrinsics.deproject(corners[:, 0], corners[:, 1], z).tolist()
+                    ]
+
+            tracker.update(boxes)
+
+            if frame == 9:
+                boxes = tracker.get_persistent_obstacles()
+                self.assertEqual(len(boxes), 2)
+
+                predicted = [box for box in boxes if getattr(box, "from_tracking", False)]
+                self.assertEqual(len(predicted), 1)
+
+                center = np.mean(predicted[0].vertices, axis=0)
+                np.testing.assert_allclose(center, (640, 545), atol=1)
+
+                # 3D box moved with the prediction, keeping its size
+                vertices_3d = np.array(predicted[0].vertices_3d)
+                np.testing.assert_allclose(vertices_3d[:4, 2], 2.1, atol=0.02)
+                np.testing.assert_allclose(vertices_3d[4:, 2] - vertices_3d[:4, 2], 0.2)
+
+                near_z = vertices_3d[0, 2]
+                projected = vertices_3d[:4, :2] / near_z * (1000, 900) + (959.5, 539.5)
+                np.testing.assert_allclose(projected.mean(axis=0), center, atol=1e-6)
+                np.testing.assert_allclose(
+                    predicted[0].distance, np.linalg.norm(intrinsics.deproject(*center, near_z))
+                )
+
+        self.assertEqual(sorted(obstacle.track_id for obstacle in tracker.obstacles), [0, 1])
+        self.assertTrue(all(obstacle.misses == 0 for obstacle in tracker.obstacles))
+
+        i = [obstacle.track_id for obstacle in tracker.obstacles].index(0)
+        np.testing.assert_allclose(tracker.velocities[i], (60, 5), atol=1)
+        np.testing.assert_allclose(tracker.depths[i], 1.9, atol=0.01)
+        self.assertTrue(np.isnan(tracker.depths[1 - i]))
 
 if __name__ == '__main__':
     unittest.main()
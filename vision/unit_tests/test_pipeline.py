@@ -9,11 +9,16 @@ sys.path += [parent_dir, gparent_dir, ggparent_dir]
 
 import unittest
 from unittest.mock import patch, Mock
+import asyncio
+import pickle
+import time
 import numpy as np
 
 from multiprocessing import Queue
 
 from vision import pipeline as PIPELINE
+from vision.bounding_box import ObjectType
+from vision.failure_flags import FailureCounts, ModuleDetectionFlags, ObstacleDetectionFlags
 
 
 class FakeObstacleFinder:
@@ -81,6 +86,278 @@ class TestPipeline(unittest.TestCase):
         pipeline = self._get_pipeline(flight_communication=flight_communication, camera=camera)
         pipeline.run('start')
 
+    @patch_pipeline
+    def test_threaded_capture(self, Obstacle__init__):
+        """
+        Testing Pipeline with threaded_capture.
+
+        Effects
+        -------
+        Frames are pulled on a background thread and every processed frame is counted.
+        """
+        def frames():
+            for _ in range(10):
+                time.sleep(.01)
+                yield np.ones((3, 3), dtype='uint16'), np.ones((3, 3, 3), dtype='uint8')
+
+        camera = type('Camera', (object,), {'__iter__': frames})
+
+        pipeline = PIPELINE.Pipeline(Queue(), Queue(), camera, threaded_capture=True)
+
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(3):
+                loop.run_until_complete(pipeline.run('start'))
+        finally:
+            loop.close()
+            pipeline.close()
+
+        counters = pipeline.frame_counters
+
+        self.assertEqual(counters['processed'], 3)
+        self.assertLessEqual(counters['processed'] + counters['dropped'], counters['captured'])
+        self.assertLessEqual(counters['captured'], 10)
+
+    @staticmethod
+    def _run_module_detection(**kwargs):
+        """
+        Run one module_detection frame, returning its flags.
+        """
+        color_image = np.zeros((480, 640, 3), dtype='uint8')
+        depth_image = np.full((480, 640), 1000, dtype='uint16')
+
+        camera = type('Camera', (object,), {'__iter__': lambda: iter([(depth_image, color_image)])})
+
+        pipeline = PIPELINE.Pipeline(Queue(), Queue(), camera, flags_queue=True, **kwargs)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(pipeline.run('module_detection'))
+        finally:
+            loop.close()
+            pipeline.close()
+
+        flag_type, bits = pipeline.vision_flags.get(timeout=1)[1]
+
+        return flag_type(bits)
+
+    @patch_pipeline
+    @patch.object(PIPELINE.ModuleLocation, 'get_center', return_value=(320, 240))
+    @patch.object(PIPELINE.ModuleLocation, 'is_in_frame', return_value=True)
+    def test_module_box(self, is_in_frame, get_center, Obstacle__init__):
+        """
+        Testing Pipeline module detection with the module in frame.
+
+        Effects
+        -------
+        A module bounding box is sent on vision_communication.
+        """
+        color_image = np.zeros((480, 640, 3), dtype='uint8')
+        depth_image = np.full((480, 640), 1000, dtype='uint16')
+
+        camera = type('Camera', (object,), {'__iter__': lambda: iter([(depth_image, color_image)])})
+
+        pipeline = PIPELINE.Pipeline(Queue(), Queue(), camera)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(pipeline.run('module_detection'))
+        finally:
+            loop.close()
+            pipeline.close()
+
+        _, bboxes = pipeline.vision_communication.get(timeout=1)
+        modules = [box for box in bboxes if box.object_type == ObjectType.MODULE]
+
+        self.assertEqual(len(modules), 1)
+        self.assertEqual(modules[0].module_depth, 1000)
+
+    @patch_pipeline
+    def test_workers(self, Obstacle__init__):
+        """
+        Testing Pipeline module detection on a worker pool.
+
+        Effects
+        -------
+        Same stages succeed as when running on one process.
+        """
+        expected = self._run_module_detection()
+        flags = self._run_module_detection(workers=2, stage_timeouts={'detect_russian_word': 30, 'is_in_frame': 30})
+
+        self.assertEqual(vars(flags), vars(expected))
+
+    @patch_pipeline
+    def test_stage_timeouts(self, Obstacle__init__):
+        """
+        Testing Pipeline stage timeouts.
+
+        Effects
+        -------
+        Pooled stages that do not finish in time have their flags set to False.
+        """
+        flags = self._run_module_detection(workers=1, stage_timeouts={'detect_russian_word': 0, 'is_in_frame': 0})
+
+        self.assertTrue(flags.set_img)
+        self.assertFalse(flags.detect_russian_word)
+        self.assertFalse(flags.is_in_frame)
+
+    @patch_pipeline
+    def test_stalled_pool(self, Obstacle__init__):
+        """
+        Testing Pipeline worker pool replacement.
+
+        Effects
+        -------
+        A pool with timed out stages is stopped, and the next frame runs on a new pool.
+        """
+        color_image = np.zeros((480, 640, 3), dtype='uint8')
+        depth_image = np.full((480, 640), 1000, dtype='uint16')
+
+        camera = type('Camera', (object,), {'__iter__': lambda: iter([(depth_image, color_image)] * 2)})
+
+        pipeline = PIPELINE.Pipeline(Queue(), Queue(), camera, workers=1, flags_queue=True, stage_timeouts={'detect_russian_word': 0, 'is_in_frame': 0})
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(pipeline.run('module_detection'))
+
+            self.assertIsNone(pipeline.pool)
+            self.assertFalse(pipeline.pool_stalled)
+
+            pipeline.stage_timeouts.update({'detect_russian_word': 30, 'is_in_frame': 30})
+            loop.run_until_complete(pipeline.run('module_detection'))
+        finally:
+            loop.close()
+            pipeline.close()
+
+        pipeline.vision_flags.get(timeout=1)
+        flag_type, bits = pipeline.vision_flags.get(timeout=1)[1]
+        flags = flag_type(bits)
+
+        self.assertTrue(flags.detect_russian_word)
+        self.assertTrue(flags.is_in_frame)
+
+    @patch_pipeline
+    def test_stage_timings(self, Obstacle__init__):
+        """
+        Testing Pipeline stage timings.
+
+        Effects
+        -------
+        With flags_queue, timings of the stages run are queued with the flags.
+        They are kept for percentiles either way.
+        """
+        camera = type('Camera', (object,), {'__iter__': lambda: ((np.ones((3, 3), dtype='uint16'), np.ones((3, 3, 3), dtype='uint8')) for _ in range(5))})
+
+        pipeline = PIPELINE.Pipeline(Queue(), Queue(), camera, flags_queue=True)
+
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(5):
+                loop.run_until_complete(pipeline.run('early_laps'))
+        finally:
+            loop.close()
+            pipeline.close()
+
+        _, (flag_type, bits), timings = pipeline.vision_flags.get(timeout=1)
+
+        self.assertIs(flag_type, ObstacleDetectionFlags)
+        self.assertIsInstance(bits, int)
+
+        self.assertIn('obstacle_finder', timings)
+        self.assertGreaterEqual(timings['obstacle_finder'], 0)
+
+        latencies = pipeline.stage_latencies['obstacle_finder']
+
+        self.assertEqual(sorted(latencies), ['p50', 'p95', 'p99'])
+        self.assertLessEqual(latencies['p50'], latencies['p99'])
+
+    @patch_pipeline
+    def test_failure_counts(self, Obstacle__init__):
+        """
+        Testing Pipeline failure counts.
+
+        Effects
+        -------
+        Failures are counted without a queue, which is off by default.
+        """
+        color_image = np.zeros((480, 640, 3), dtype='uint8')
+        depth_image = np.full((480, 640), 1000, dtype='uint16')
+
+        camera = type('Camera', (object,), {'__iter__': lambda: ((depth_image, color_image) for _ in range(2))})
+
+        pipeline = PIPELINE.Pipeline(
+            Queue(), Queue(), camera, workers=1,
+            stage_timeouts={'detect_russian_word': 0, 'is_in_frame': 0},
+        )
+
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(2):
+                loop.run_until_complete(pipeline.run('module_detection'))
+        finally:
+            loop.close()
+            pipeline.close()
+
+        self.assertTrue(pipeline.vision_flags.empty())
+
+        frames, failures = pipeline.failure_counts.failures(ModuleDetectionFlags)
+        self.assertEqual(frames, 2)
+        self.assertEqual(failures['detect_russian_word'], 2)
+        self.assertEqual(failures['set_img'], 0)
+
+        rates = pipeline.failure_rates['ModuleDetectionFlags']
+        self.assertEqual(rates['is_in_frame'], 1)
+        self.assertEqual(rates['set_img'], 0)
+
+
+class TestFailureFlags(unittest.TestCase):
+    """
+    Testing the packed failure flags.
+    """
+    def test_bits(self):
+        """
+        Flags are stored in a stable bit layout and decode to readable text.
+        """
+        flags = ModuleDetectionFlags()
+        self.assertEqual(flags.bits, 0)
+        self.assertTrue(flags.set_img)
+
+        flags.set_img = False
+        flags.get_module_roll = False
+        self.assertFalse(flags.set_img)
+        self.assertTrue(flags.set_text)
+        self.assertEqual(flags.bits, 1 | 1 << 9)
+
+        self.assertEqual(
+            str(flags),
+            "setImg: ERROR, detect_russian_word: OK, set_text: OK, is_in_frame: OK, "
+            "get_center: OK, get_module_depth: OK, get_region_of_interest: OK, "
+            "get_module_orientation: OK, get_module_bounds: OK, get_module_roll: ERROR",
+        )
+        self.assertEqual(ObstacleDetectionFlags.decode(2), "obstacle_finder: OK, obstacle_tracker: ERROR")
+
+        self.assertEqual(pickle.loads(pickle.dumps(flags)), flags)
+        self.assertEqual(flags.copy(), flags)
+
+        flags.reset()
+        self.assertEqual(flags, ModuleDetectionFlags())
+
+    def test_counts(self):
+        """
+        Failure counts and rates of recorded flags.
+        """
+        counts = FailureCounts()
+
+        flags = ObstacleDetectionFlags()
+        counts.record(flags)
+        flags.obstacle_tracker = False
+        counts.record(flags)
+
+        self.assertEqual(counts.failures(ObstacleDetectionFlags), (2, {'obstacle_finder': 0, 'obstacle_tracker': 1}))
+        self.assertEqual(counts.rates()['ObstacleDetectionFlags']['obstacle_tracker'], 0.5)
+        self.assertEqual(counts.rates()['TextDetectionFlags'], {'detect_russian_word': 0})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -7,13 +7,23 @@ gparent_dir = os.path.dirname(parent_dir)
 ggparent_dir = os.path.dirname(gparent_dir)
 sys.path += [parent_dir, gparent_dir, ggparent_dir]
 
+import shutil
+import time
 import unittest
+from unittest.mock import patch
 import numpy as np
 import cv2
 
 from text.detect_words import TextDetector
+import text.ocr_pool as ocr_pool
+from text.ocr_pool import OCRPool, tesserocr
+from text.ocr_cache import OCRCache
 from bounding_box import BoundingBox, ObjectType
 
+# tesserocr runs without the tesseract binary, but both need the language data
+TESSEROCR_ENG = tesserocr is not None and "eng" in tesserocr.get_languages()[1]
+TESSERACT_ENG = TESSEROCR_ENG if tesserocr is not None else bool(shutil.which("tesseract"))
+
 
 class TestDetectRussianWord(unittest.TestCase):
     """
@@ -88,5 +98,334 @@ class TestDetectRussianWord(unittest.TestCase):
         np.testing.assert_array_equal(color_image, color_parameter)
 
 
+class TestPlacardCache(unittest.TestCase):
+    """
+    Testing the blue rectangle region of interest cache.
+    """
+    @staticmethod
+    def _placard_image(x_shift):
+        """
+        Blue rectangle with a white inside, shifted right by x_shift.
+        """
+        color_image = np.full((480, 640, 3), 120, dtype='uint8')
+        depth_image = np.full((480, 640), 1000, dtype='uint16')
+
+        outer = cv2.boxPoints(((320 + x_shift, 240), (260, 120), 8.0)).astype(np.int32)
+        inner = cv2.boxPoints(((320 + x_shift, 240), (220, 80), 8.0)).astype(np.int32)
+        cv2.fillPoly(color_image, [outer], (200, 60, 40))
+        cv2.fillPoly(color_image, [inner], (230, 230, 230))
+
+        return color_image, depth_image
+
+    def test_roi_cache(self):
+        """
+        Testing searching near the last rectangle.
+
+        Returns
+        -------
+        Same crop and angle as searching the full frame, with a full search every rescan_interval frames.
+        Off unless asked for.
+        """
+        RESCAN_INTERVAL = 3
+
+        self.assertFalse(TextDetector().roi_cache)
+
+        full_detector = TextDetector()
+        cached_detector = TextDetector(roi_cache=True, rescan_interval=RESCAN_INTERVAL)
+
+        for i in range(2 * RESCAN_INTERVAL + 2):
+            color_image, depth_image = self._placard_image(2 * i)
+
+            expected = full_detector._get_rotated_min_area_rect(color_image, depth_image)
+            result = cached_detector._get_rotated_min_area_rect(color_image, depth_image)
+
+            np.testing.assert_array_equal(result[0], expected[0])
+            self.assertEqual(result[1:], expected[1:])
+
+            self.assertEqual(cached_detector.roi_frames, i % (RESCAN_INTERVAL + 1))
+
+        ## Rectangle gone, next frame searches the full frame
+        color_image = np.full((480, 640, 3), 120, dtype='uint8')
+        depth_image = np.full((480, 640), 1000, dtype='uint16')
+
+        result = cached_detector._get_rotated_min_area_rect(color_image, depth_image)
+
+        self.assertEqual(len(result[0]), 0)
+        self.assertIsNone(cached_detector.placard_rect)
+
+    def test_crop_then_rotate(self):
+        """
+        Testing rotating only the text against rotating the full frame then slicing.
+
+        Returns
+        -------
+        Same crop size, position and angle, and nearly the same pixels.
+        """
+        detector = TextDetector(roi_cache=False)
+
+        for angle in [-30, -8, 0, 8, 30]:
+            with self.subTest(angle=angle):
+                color_image = np.full((480, 640, 3), 120, dtype='uint8')
+                depth_image = np.full((480, 640), 1000, dtype='uint16')
+
+                outer = cv2.boxPoints(((300, 260), (260, 120), angle)).astype(np.int32)
+                inner = cv2.boxPoints(((300, 260), (220, 80), angle)).astype(np.int32)
+                cv2.fillPoly(color_image, [outer], (200, 60, 40))
+                cv2.fillPoly(color_image, [inner], (230, 230, 230))
+                cv2.putText(color_image, "TEXT", (220, 275), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+
+                sliced_rotated_image, x_ul, y_ul, rotation_angle = detector._get_rotated_min_area_rect(color_image, depth_image)
+
+                # reference, full frame rotation
+                rect = cv2.minAreaRect(detector._find_largest_contour(color_image, depth_image))
+                rows, columns, _ = color_image.shape
+                matrix = cv2.getRotationMatrix2D(center=(columns / 2, rows / 2), angle=rotation_angle, scale=1)
+                rotated = cv2.warpAffine(src=color_image, M=matrix, dsize=(columns, rows))
+
+                points = np.int0(cv2.transform(np.array([cv2.boxPoints((rect[0], rect[1], 0.0))]), matrix))[0]
+                points[points < 0] = 0
+                expected = rotated[points[1][1] : points[0][1], points[1][0] : points[2][0]]
+
+                self.assertGreater(sliced_rotated_image.size, 0)
+                self.assertEqual(sliced_rotated_image.shape, expected.shape)
+                self.assertLess(np.mean(np.abs(sliced_rotated_image.astype(int) - expected)), 1)
+
+
+class TestOCRPool(unittest.TestCase):
+    """
+    Testing the OCR worker pool.
+    """
+    def test_params(self):
+        """
+        Testing OCRPool worker count.
+        """
+        with self.assertRaises(ValueError):
+            OCRPool(workers=0)
+
+    @unittest.skipUnless(TESSERACT_ENG, "tesseract is not installed")
+    def test_image_to_data(self):
+        """
+        Testing OCR on the workers.
+
+        Returns
+        -------
+        Same word data for one image at a time and several at once.
+        """
+        image = np.full((100, 400, 3), 255, dtype='uint8')
+        cv2.putText(image, "TEST", (20, 70), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+
+        pool = OCRPool(workers=2, lang="eng")
+        try:
+            data = pool.image_to_data(image)
+            batch = pool.map([image, image, image])
+        finally:
+            pool.close()
+
+        for key in ["text", "left", "top", "width", "height"]:
+            self.assertIn(key, data)
+
+        self.assertEqual(len(batch), 3)
+        for result in batch:
+            self.assertEqual(result["text"], data["text"])
+
+    @unittest.skipUnless(TESSEROCR_ENG, "tesserocr is not installed")
+    def test_persistent_worker(self):
+        """
+        Testing OCR with tesserocr, as run on each worker.
+
+        Returns
+        -------
+        One tesseract instance is loaded and reused for every image, and its word data
+        has the pytesseract image_to_data format.
+        """
+        image = np.full((100, 400, 3), 255, dtype='uint8')
+        cv2.putText(image, "TEST", (20, 70), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+
+        ocr_pool._init_worker("eng")
+        api = ocr_pool._worker_api
+        try:
+            self.assertIsInstance(api, tesserocr.PyTessBaseAPI)
+
+            first = ocr_pool._image_to_data(image)
+            second = ocr_pool._image_to_data(image)
+
+            self.assertIs(ocr_pool._worker_api, api)
+        finally:
+            api.End()
+            ocr_pool._worker_api = None
+            ocr_pool._worker_lang = None
+
+        self.assertEqual(first, second)
+        self.assertIn("TEST", first["text"])
+
+        for key in ["text", "left", "top", "width", "height", "conf"]:
+            self.assertEqual(len(first[key]), len(first["text"]))
+
+        left, top = first["left"][0], first["top"][0]
+        right, bottom = left + first["width"][0], top + first["height"][0]
+
+        # word box around the drawn text
+        self.assertLessEqual(left, 25)
+        self.assertLessEqual(top, 35)
+        self.assertGreater(right, 150)
+        self.assertGreaterEqual(bottom, 70)
+
+
+class TestOCRCache(unittest.TestCase):
+    """
+    Testing the OCR result cache.
+    """
+    @staticmethod
+    def _text_image(height=80, width=300):
+        image = np.full((height, width, 3), 230, dtype='uint8')
+        cv2.putText(image, "TEXT", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+        return image
+
+    def test_get(self):
+        """
+        Testing lookups.
+
+        Returns
+        -------
+        Hits for near identical images of about the same size, misses otherwise.
+        """
+        cache = OCRCache(max_distance=4, size_tolerance=2)
+        data = {"text": ["TEXT"]}
+
+        image = self._text_image()
+        cache.put(cache.key(image), data)
+
+        noisy = np.clip(image + np.random.default_rng(0).integers(-3, 4, image.shape), 0, 255).astype('uint8')
+        self.assertIs(cache.get(cache.key(noisy)), data)
+        self.assertIs(cache.get(cache.key(self._text_image(81, 299))), data)
+
+        self.assertIsNone(cache.get(cache.key(self._text_image(80, 320))))
+        self.assertIsNone(cache.get(cache.key(np.full((80, 300, 3), 230, dtype='uint8')[:, ::-1])))
+
+        self.assertEqual(cache.counters, {"hits": 2, "misses": 2})
+
+    def test_eviction(self):
+        """
+        Testing least recently used and age limits.
+        """
+        cache = OCRCache(max_entries=2, max_distance=0, size_tolerance=0, max_age=0.2)
+
+        keys = [cache.key(self._text_image(80, width)) for width in [100, 200, 300]]
+
+        cache.put(keys[0], {"text": ["0"]})
+        cache.put(keys[1], {"text": ["1"]})
+        cache.get(keys[0])  # 1 is now least recently used
+        cache.put(keys[2], {"text": ["2"]})
+
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[0]))
+
+        time.sleep(0.25)
+        self.assertIsNone(cache.get(keys[2]))
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_detector_cache(self):
+        """
+        Testing TextDetector with the OCR cache.
+
+        Returns
+        -------
+        OCR runs once for a hovering placard, and cached boxes follow the placard.
+        """
+        tessdata = {"text": ["", "модули"], "left": [0, 20], "top": [0, 10], "width": [0, 100], "height": [0, 40]}
+
+        detector = TextDetector(ocr_cache=True)
+
+        with patch('text.detect_words.pytesseract.image_to_data', return_value=tessdata) as image_to_data:
+            first = detector.detect_russian_word(*TestPlacardCache._placard_image(0))
+            second = detector.detect_russian_word(*TestPlacardCache._placard_image(2))
+
+        self.assertEqual(image_to_data.call_count, 1)
+        self.assertEqual(detector.ocr_cache.counters, {"hits": 1, "misses": 1})
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        for (x_1, y_1), (x_2, y_2) in zip(first[0].vertices, second[0].vertices):
+            self.assertEqual(x_2 - x_1, 2)
+            self.assertEqual(y_2, y_1)
+
+
+class TestBlueMask(unittest.TestCase):
+    """
+    Testing the blue rectangle mask.
+    """
+    @staticmethod
+    def _float_blue_mask(color_image, depth_image):
+        """
+        Reference mask with float division, as computed before integer cross-multiplication.
+        """
+        blur_image = np.int16(cv2.GaussianBlur(src=color_image, ksize=(5, 5), sigmaX=0))
+        b_image, g_image, r_image = blur_image[:, :, 0], blur_image[:, :, 1], blur_image[:, :, 2]
+
+        r_image = np.where(r_image == 0, 1, r_image)
+        g_image = np.where(g_image == 0, 1, g_image)
+
+        # NOTE: 3rd argument is logical_and's out, so near-black pixels were never removed
+        blue_mask = np.logical_and((b_image / r_image > 1.7), (b_image / g_image > 1.1))
+
+        mask_image = np.where(blue_mask, np.uint8(0), np.uint8(255))
+
+        return np.where((depth_image < 8000), mask_image, np.uint8(255))
+
+    def _assert_same_mask(self, detector, color_image, depth_image):
+        expected = self._float_blue_mask(color_image, depth_image)
+        mask = detector._get_blue_mask(color_image, depth_image)
+
+        self.assertEqual(mask.dtype, np.uint8)
+        np.testing.assert_array_equal(mask, expected)
+
+    def test_blue_mask(self):
+        """
+        Testing integer mask matches float division mask.
+        """
+        detector = TextDetector()
+        random = np.random.default_rng(0)
+
+        ## Random images, sizes changing between calls to reuse buffers
+        for size in [(480, 640), (720, 1280), (100, 120), (1080, 1920)]:
+            with self.subTest(size=size):
+                color_image = random.integers(0, 256, (*size, 3)).astype('uint8')
+                depth_image = random.integers(0, 16000, size).astype('uint16')
+
+                self._assert_same_mask(detector, color_image, depth_image)
+
+        ## Every blue, red pair on exact ratio boundaries
+        b, r = np.meshgrid(np.arange(256, dtype='uint8'), np.arange(256, dtype='uint8'))
+        color_image = np.dstack((b, r, r))
+        depth_image = np.zeros(b.shape, dtype='uint16')
+        self._assert_same_mask(detector, color_image, depth_image)
+
+        ## Placard images
+        for x_shift in [0, 50]:
+            self._assert_same_mask(detector, *TestPlacardCache._placard_image(x_shift))
+
+    @unittest.skipUnless(os.path.isdir(os.path.join(gparent_dir, "vision_images", "text")), "text dataset not found")
+    def test_blue_mask_dataset(self):
+        """
+        Testing integer mask matches float division mask on the text benchmark dataset.
+        """
+        detector = TextDetector()
+        img_dir = os.path.join(gparent_dir, "vision_images", "text")
+
+        for filename in sorted(os.listdir(img_dir)):
+            if "colorImage" not in filename:
+                continue
+
+            color_image = cv2.imread(os.path.join(img_dir, filename))
+            depth_filename = os.path.join(img_dir, filename.replace("colorImage", "depthImage").rsplit(".", 1)[0] + ".npy")
+            if os.path.isfile(depth_filename):
+                depth_image = np.load(depth_filename)
+            else:
+                depth_image = np.zeros(color_image.shape[:2], dtype='uint16')
+
+            with self.subTest(filename=filename):
+                self._assert_same_mask(detector, color_image, depth_image)
+
+
 if __name__ == '__main__':
     unittest.main()